@@ -1,489 +1,1024 @@
-from flask import Flask, render_template, request, jsonify
+from flask import (Flask, Response, render_template, request, jsonify, abort, make_response,
+                   stream_with_context)
 import requests
 from requests.auth import HTTPBasicAuth
 from datetime import datetime, timezone
 import json
-import copy
+import hmac
+import os
 import threading
-
+import time
+
+from policy import PoolBusy
+from sign import SignClient, SignOffline, strip_bom, add_sign, remove_sign, get_sign, all_signs, fan_out
+from poller import StatusPoller
+from httpcache import JSONSnapshot, snapshot_for, snapshot_response, init_compression
+from metrics import init_metrics, render as render_metrics
+import shared
+from logs import init_logging, set_level, get_level, payloads
+from fonts import fit, available as font_available
+from preview import (frame_key, message_key, render_frame, render_message, encode_png,
+                     PreviewError, MAX_SCALE, available as previews_available)
+from model import DEFAULT_FONT, SIGN_WIDTH, SIGN_HEIGHT
+from backup import backup_lines, gzip_stream, read_lines, restore, RESTORE_WORKERS
+from outbox import Outbox, add_outbox, remove_outbox, get_outbox
+from sync import Reconciler, SyncError, parse_desired, plan_all
+from history import History, HistoryError, add_history, remove_history, get_history, parse_time
+from msgindex import QueryError, parse_query, parse_when, page
+from timeline import timeline_for
+from messages import build_message, apply_update, apply_toggle, plan_batch, format_path, MessageError
+
+init_logging()
 app = Flask(__name__)
 
+# Timing first, so the login check below is counted in each request's time
+init_metrics(app)
+
 # Google OAuth — must be initialised before any routes
-from auth import init_auth
+from auth import init_auth, PUBLIC_ENDPOINTS
+from flask_login import current_user
 init_auth(app)
+init_compression(app)
 
 # --- Config ---
 SIGN_IP  = "192.168.48.6"
 USERNAME = "Dak"
 PASSWORD = "DakPassword"
-BASE_URL = f"http://{SIGN_IP}"
-
-# --- Session management ---
-# We keep a persistent requests.Session so cookies are maintained between calls.
-# The ECCB PHP backend requires a valid session cookie set by login.cgi.
-_session_lock  = threading.Lock()
-_session       = None
-_session_valid = False
-
-
-def _make_session():
-    s = requests.Session()
-    s.auth = HTTPBasicAuth(USERNAME, PASSWORD)
-    return s
-
-
-def get_session():
-    """Return a logged-in session, creating/refreshing as needed."""
-    global _session, _session_valid
-    with _session_lock:
-        if _session is None:
-            _session = _make_session()
-        if not _session_valid:
-            _login(_session)
-    return _session
-
-
-def _login(s):
-    """POST credentials to login.cgi to obtain a session cookie."""
-    global _session_valid
-    try:
-        # First hit cookiechecker so the sign knows we want a session
-        s.get(f"{BASE_URL}/cookiechecker?uri=/ECCB/index.html", timeout=60)
-        # Then POST to login.cgi with the credentials
-        r = s.post(
-            f"{BASE_URL}/login.cgi",
-            data={"username": USERNAME, "password": PASSWORD, "uri": "/ECCB/index.html"},
-            timeout=60,
-            allow_redirects=True,
-        )
-        app.logger.info(f"login.cgi -> {r.status_code}, cookies: {dict(s.cookies)}")
-        _session_valid = True
-        return True
-    except Exception as e:
-        app.logger.error(f"Login failed: {e}")
-        _session_valid = False
-        return False
-
-
-def invalidate_session():
-    global _session_valid
-    with _session_lock:
-        _session_valid = False
-
 
-def strip_bom(raw_bytes):
-    text = raw_bytes.decode("utf-8-sig").strip()
-    while text.startswith("\ufeff"):
-        text = text.lstrip("\ufeff").strip()
-    return text
-
-
-def eccb_get(path):
-    s = get_session()
-    try:
-        r = s.get(f"{BASE_URL}{path}", timeout=60)
-        raw = strip_bom(r.content)
-        try:
-            return json.loads(raw), r.status_code
-        except Exception:
-            return raw, r.status_code
-    except requests.exceptions.ConnectionError:
-        return {"error": "Cannot reach sign"}, 503
-    except Exception as e:
-        return {"error": str(e)}, 500
-
-
-def eccb_put(path, data=None):
-    s = get_session()
-    try:
-        r = s.put(f"{BASE_URL}{path}", json=data, timeout=60)
-        return r.text, r.status_code
-    except Exception as e:
-        return {"error": str(e)}, 500
-
-
-def get_messages():
-    s = get_session()
-    r = s.get(f"{BASE_URL}/ECCB/getmessagelist.php", timeout=60)
-    raw = strip_bom(r.content)
-    data = json.loads(raw)
-    msgs = data.get("Messages") or data.get("messages") or []
-    # Log specific messages for comparison
-    for m in msgs:
-        if m.get("Name") in ("B2", "Elliot", "Recovery"):
-            print(f"[GET] {m['Name']}: {json.dumps(m, indent=2)}", flush=True)
-    return msgs
-
-
-def save_message_obj(msg_obj):
-    """POST message to savemessage.php.
-
-    Confirmed from Fiddler capture of native UI:
-    - Content-Type: application/x-www-form-urlencoded
-    - Field name: 'json'
-    - Value: JSON-serialized message object
-    - Success response: BOM-only (0 bytes after stripping BOM) with HTTP 200
-      (BOM-only IS the success indicator — the sign does not return {"Status":"OK"})
-    """
-    msg_json = json.dumps(msg_obj)
-    headers = {
-        "X-Requested-With": "XMLHttpRequest",
-        "Referer": f"{BASE_URL}/ECCB/EditMessage.html",
-        "Origin": BASE_URL,
-        "Accept": "application/json, text/javascript, */*; q=0.01",
-    }
-    s = get_session()
-    r = s.post(
-        f"{BASE_URL}/ECCB/savemessage.php",
-        data={"json": msg_json},
-        headers=headers,
-        timeout=60,
-    )
-    app.logger.info(f"savemessage status={r.status_code} bytes={len(r.content)}")
-    return strip_bom(r.content), r.status_code
-
-
-def delete_message_by_name(name):
-    """Delete via POST to deletemessage.php.
-
-    Confirmed from Fiddler capture of native UI:
-    - Method: POST
-    - Content-Type: application/x-www-form-urlencoded
-    - Field name: 'Message'
-    - Value: 'name.vmpl'  (filename with .vmpl extension, not just the name)
-    - Success response: BOM-only with HTTP 200
-    """
-    s = get_session()
-    headers = {
-        "X-Requested-With": "XMLHttpRequest",
-        "Referer": f"{BASE_URL}/ECCB/EditMessage.html",
-        "Accept": "*/*",
-    }
-    filename = f"{name}.vmpl"
-    r = s.post(
-        f"{BASE_URL}/ECCB/deletemessage.php",
-        data={"Message": filename},
-        headers=headers,
-        timeout=60,
-    )
-    app.logger.info(f"deletemessage POST '{filename}' -> {r.status_code}: {r.content[:200]}")
-    return strip_bom(r.content), r.status_code
+# Further signs, by name: {"lobby": {"ip": "...", "username": "...", "password": "..."}}
+# The sign above is registered as DEFAULT_SIGN and serves the unscoped /api routes.
+EXTRA_SIGNS  = {}
+DEFAULT_SIGN = "main"
+
+# Message list cache: getmessagelist.php is slow, so the last list is kept in
+# memory and patched after our own writes. TTL 0 disables caching; a non-zero
+# refresh interval keeps the cache warm from a background thread.
+MESSAGE_CACHE_TTL     = 30   # seconds
+MESSAGE_CACHE_REFRESH = 0    # seconds, 0 = no background refresh
+
+# Login cookies are kept here so a restart doesn't force a fresh login, and
+# each sign logs in (or checks its saved cookie) in the background at boot.
+# DAK_STATE_DIR moves it, along with the queue, history and shared files.
+STATE_DIR        = os.environ.get("DAK_STATE_DIR") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "state")
+WARM_UP_AT_START = True
+
+# Several worker processes (gunicorn -c gunicorn.conf.py app:app) share sign
+# settings and the sign login through this file; see shared.py. Off for a
+# single process. Once on, the sign settings above only seed it: later
+# changes are made in the app and kept there.
+SHARED_STATE = os.environ.get("DAK_SHARED_STATE") == "1"
+SHARED_FILE  = os.path.join(STATE_DIR, "shared.db")
+
+# Message writes made while a sign can't be reached are kept here and
+# replayed in order once it answers again (see outbox.py).
+OUTBOX_FILE = os.path.join(STATE_DIR, "outbox.db")
+
+# Status, configuration and dimming are polled once per sign in the background
+# and served to every browser from memory (and pushed over /api/stream).
+STATUS_POLL_INTERVAL = 10   # seconds
+
+# Numeric status and dimming fields are sampled into fixed-size files under
+# HISTORY_DIR for /api/history (see history.py). None records every numeric
+# field the sign reports; or name them: {"temp": "status:Temperature"}.
+# Sampling reads the status poller, so while this is on the sign is polled
+# every STATUS_POLL_INTERVAL even with no browser open.
+HISTORY_ENABLED = True
+HISTORY_DIR     = os.path.join(STATE_DIR, "history")
+HISTORY_FIELDS  = None
+
+# /api/timeline shows this many days ahead unless asked (see timeline.py)
+TIMELINE_DAYS     = 7
+TIMELINE_MAX_DAYS = 28
+
+# /metrics (Prometheus format) is open to logged-in users and to localhost.
+# Set METRICS_TOKEN in the environment to let a scraper in with
+# "Authorization: Bearer <token>" instead of by address.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+# Desired-state sync: a JSON or YAML file listing the messages each sign
+# should have, reconciled every SYNC_INTERVAL seconds. Off unless a file is
+# set here or in DAK_SYNC_FILE. SYNC_APPLY = False only computes plans.
+SYNC_FILE     = os.environ.get("DAK_SYNC_FILE", "")
+SYNC_INTERVAL = 60   # seconds
+SYNC_APPLY    = True
+
+
+def _register_sign(name, ip, username, password):
+    client = add_sign(SignClient(name, ip, username, password,
+                                 cache_ttl=MESSAGE_CACHE_TTL,
+                                 cache_refresh=MESSAGE_CACHE_REFRESH,
+                                 cookie_file=os.path.join(STATE_DIR, f"cookies-{name}.json")))
+    _pollers[name] = StatusPoller(client, STATUS_POLL_INTERVAL)
+    add_outbox(Outbox(client, OUTBOX_FILE))
+    if HISTORY_ENABLED:
+        add_history(History(_pollers[name], os.path.join(HISTORY_DIR, name), HISTORY_FIELDS,
+                            STATUS_POLL_INTERVAL))
+    if WARM_UP_AT_START:
+        client.warm_up()
+    return client
+
+
+_pollers = {}   # sign name -> StatusPoller
+
+
+def _forget_sign(name):
+    client = remove_sign(name)
+    if client is not None:
+        client.close()
+    poller = _pollers.pop(name, None)
+    if poller is not None:
+        poller.stop()
+    remove_outbox(name)
+    remove_history(name)
+
+
+_signs_version = None
+_signs_checked = 0.0   # time.monotonic() of the last look at shared.db
+_signs_lock    = threading.Lock()
+SIGNS_CHECK    = 1.0   # seconds; how stale another worker's sign changes may be here
+
+
+def _follow_shared_signs():
+    """Pick up signs another worker added, removed or reconfigured, looking
+    at most once every SIGNS_CHECK seconds rather than on every request."""
+    global _signs_version, _signs_checked
+    now = time.monotonic()
+    if now - _signs_checked < SIGNS_CHECK:
+        return
+    _signs_checked = now
+    if shared.version("signs") == _signs_version:
+        return
+    with _signs_lock:
+        version = shared.version("signs")
+        if version == _signs_version:
+            return
+        saved = shared.load_signs()
+        for name, (ip, username, password) in saved.items():
+            client = get_sign(name)
+            if client is None:
+                _register_sign(name, ip, username, password)
+            elif (client.ip, client.username, client.password) != (ip, username, password):
+                client.configure(ip=ip, username=username, password=password)
+                _pollers[name].poke()
+        for client in all_signs():
+            if client.name not in saved:
+                _forget_sign(client.name)
+        _signs_version = version
+
+
+if SHARED_STATE:
+    shared.init_shared(SHARED_FILE)
+    shared.seed_signs({DEFAULT_SIGN: (SIGN_IP, USERNAME, PASSWORD), **{
+        n: (c["ip"], c.get("username", USERNAME), c.get("password", PASSWORD))
+        for n, c in EXTRA_SIGNS.items()}})
+    _follow_shared_signs()
+    app.before_request(_follow_shared_signs)
+else:
+    _register_sign(DEFAULT_SIGN, SIGN_IP, USERNAME, PASSWORD)
+    for _name, _conf in EXTRA_SIGNS.items():
+        _register_sign(_name, _conf["ip"], _conf.get("username", USERNAME),
+                       _conf.get("password", PASSWORD))
+
+_reconciler = Reconciler(SYNC_FILE, SYNC_INTERVAL, SYNC_APPLY) if SYNC_FILE else None
+if _reconciler:
+    _reconciler.start()
+
+
+def _client(sign=None):
+    """Resolve the sign a request is scoped to (the default sign if none)."""
+    client = get_sign(sign or DEFAULT_SIGN)
+    if client is None:
+        abort(make_response(jsonify({"error": f"Unknown sign '{sign}'"}), 404))
+    return client
+
+
+def _poller(sign=None):
+    return _pollers[_client(sign).name]
+
+
+def _queued(client, error=None, save=None, delete=None):
+    """202 response for a write kept in the outbox until the sign is back.
+    A rename queues the save of the new name and then the delete of the old."""
+    outbox = get_outbox(client.name)
+    if save is not None:
+        outbox.put("save", save.name, save)
+    if delete is not None:
+        outbox.put("delete", delete)
+    body = {"queued": True, **outbox.describe()}
+    if isinstance(error, SignOffline):
+        body["offline_since"] = error.since_iso
+    if save is not None:
+        body["message"] = save.to_eccb()
+    return jsonify(body), 202
+
+
+def _unreachable(e):
+    """503 response for a sign we could not talk to."""
+    if isinstance(e, SignOffline):
+        return jsonify({"error": str(e), "offline_since": e.since_iso}), 503
+    if isinstance(e, PoolBusy):
+        return jsonify({"error": str(e)}), 503
+    return jsonify({"error": "Cannot reach sign"}), 503
+
+
+@app.errorhandler(requests.exceptions.ConnectionError)
+def handle_unreachable(e):
+    return _unreachable(e)
 
 
 # ─── Routes ────────────────────────────────────────────────────────────────────
 
 @app.route("/")
 def index():
-    return render_template("index.html", sign_ip=SIGN_IP)
+    return render_template("index.html", sign_ip=_client().ip,
+                           fonts_ready=font_available(DEFAULT_FONT),
+                           previews_ready=previews_available())
+
+def _polled_response(sign, key):
+    data, code = _poller(sign).get(key)
+    return snapshot_response(snapshot_for(data, lambda: data, code), code)
 
 @app.route("/api/status")
-def api_status():
-    data, code = eccb_get("/daktronics/syscontrol/1.0/status")
-    return jsonify(data), code
+@app.route("/api/signs/<sign>/status")
+def api_status(sign=None):
+    return _polled_response(sign, "status")
 
 @app.route("/api/configuration")
-def api_configuration():
-    data, code = eccb_get("/daktronics/syscontrol/1.0/configuration")
-    return jsonify(data), code
+@app.route("/api/signs/<sign>/configuration")
+def api_configuration(sign=None):
+    return _polled_response(sign, "configuration")
 
 @app.route("/api/dimming")
-def api_dimming():
-    data, code = eccb_get("/daktronics/syscontrol/1.0/configuration/output/0/dimming")
-    return jsonify(data), code
+@app.route("/api/signs/<sign>/dimming")
+def api_dimming(sign=None):
+    return _polled_response(sign, "dimming")
+
+@app.route("/api/stream")
+@app.route("/api/signs/<sign>/stream")
+def api_stream(sign=None):
+    """Server-Sent Events: a "snapshot" event with every polled endpoint, then
+    an "update" event carrying only the changed fields whenever one changes."""
+    return Response(_poller(sign).stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/api/policy")
+@app.route("/api/signs/<sign>/policy")
+def api_policy(sign=None):
+    """Timeouts and retry counts learned for each sign endpoint (see policy.py)."""
+    return jsonify(_client(sign).policy.describe())
+
+@app.route("/api/history")
+@app.route("/api/signs/<sign>/history")
+def api_history(sign=None):
+    """Recorded values of one status field: ?field=&from=&to=&step= (times as
+    epoch seconds, ISO 8601 or "-6h"; step in seconds). No field lists them."""
+    history = get_history(_client(sign).name)
+    if history is None:
+        return jsonify({"error": "history is not enabled (HISTORY_ENABLED)"}), 404
+    field = request.args.get("field")
+    if not field:
+        return jsonify(history.describe())
+    now = datetime.now(timezone.utc).timestamp()
+    try:
+        t0   = parse_time(request.args.get("from", "-1h"), now)
+        t1   = parse_time(request.args.get("to", str(now)), now)
+        step = float(request.args.get("step", 0)) or None
+        if step is not None and not 0 < step < float("inf"):   # also rejects nan
+            raise ValueError("step must be a positive number of seconds")
+    except (HistoryError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    if field not in history.fields():
+        return jsonify({"error": f"no history for {field!r}", "fields": history.fields()}), 404
+    try:
+        return jsonify(history.query(field, t0, t1, step))
+    except HistoryError as e:
+        return jsonify({"error": str(e)}), 400
 
 @app.route("/api/messages")
-def api_messages():
+@app.route("/api/signs/<sign>/messages")
+def api_messages(sign=None):
+    """The message list; with ?enabled=&activeAt=&dow=&q=&offset=&limit= only
+    the matching messages, a page at a time (see msgindex.py)."""
+    client = _client(sign)
+    outbox = get_outbox(client.name)
     try:
-        msgs = get_messages()
-        return jsonify({"messages": msgs}), 200
-    except requests.exceptions.ConnectionError:
-        return jsonify({"error": "Cannot reach sign"}), 503
+        query = parse_query(request.args)
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        msgs = client.get_messages(fresh=request.args.get("fresh") == "1")
+        if not outbox.depth:
+            if query is None:
+                return snapshot_response(snapshot_for(
+                    msgs, lambda: {"messages": [m.to_eccb() for m in msgs]}))
+            return snapshot_response(snapshot_for(
+                msgs, lambda: page(msgs, **query), tuple(sorted(query.items()))))
+        stale = False
+    except requests.exceptions.ConnectionError as e:
+        # Show the last list we had, with queued edits, so work can go on offline
+        msgs = client.last_known_messages()
+        if msgs is None:
+            return _unreachable(e)
+        stale = True
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+    msgs, pending = outbox.view(msgs)
+    body = page(msgs, **query) if query is not None else {"messages": [m.to_eccb() for m in msgs]}
+    return snapshot_response(JSONSnapshot({**body, "pending": pending, "stale": stale}))
+
+@app.route("/api/timeline")
+@app.route("/api/signs/<sign>/timeline")
+def api_timeline(sign=None):
+    """What the sign plays when: ?at= for the rotation at one time, else the
+    changes from ?from= (default now) over ?days= (default 7), with gaps and
+    schedule issues. Times as in /api/messages' activeAt (see timeline.py)."""
+    client = _client(sign)
+    days = request.args.get("days", str(TIMELINE_DAYS))
+    if not days.isdigit() or not 1 <= int(days) <= TIMELINE_MAX_DAYS:
+        return jsonify({"error": f"days must be 1-{TIMELINE_MAX_DAYS}"}), 400
+    days = int(days)
+    at   = request.args.get("at")
+    try:
+        when = parse_when(at or request.args.get("from") or "now")
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        msgs  = client.get_messages()
+        stale = False
+    except requests.exceptions.ConnectionError as e:
+        msgs = client.last_known_messages()
+        if msgs is None:
+            return _unreachable(e)
+        stale = True
+    msgs, _ = get_outbox(client.name).view(msgs)   # as it will be once queued edits land
+    timeline = timeline_for(msgs)
+    build    = lambda: {"sign": client.name, **(timeline.now_playing(when) if at
+                                                else timeline.playlist(when, days))}
+    if stale:
+        return jsonify({**build(), "stale": True})
+    return snapshot_response(snapshot_for(msgs, build, ("timeline", bool(at), when, days)))
 
 @app.route("/api/messages/create", methods=["POST"])
-def api_create_message():
-    body       = request.json or {}
-    name       = body.get("name", "").strip()
-    frames_in  = body.get("frames", [])  # New multi-frame structure
-    hold       = body.get("holdTime", "P0Y0M0DT0H0M5S")
-    sched_in   = body.get("schedule", {})
-    
-    if not name:
-        return jsonify({"error": "name is required"}), 400
-    
-    # Support both old format (text + extraLines) and new format (frames array)
-    if not frames_in and body.get("text"):
-        # Old format: single frame
-        text  = body.get("text", "").strip()
-        extra = body.get("extraLines", [])
-        all_lines = [text] + [l for l in extra if isinstance(l, str)]
-        all_lines = [l for l in all_lines if l.strip()]
-        frames_in = [{"lines": all_lines}] if all_lines else []
-    
-    if not frames_in:
-        return jsonify({"error": "at least one frame with text is required"}), 400
-    
-    # Build frames with auto font sizing
-    frames = []
-    font_size_map = {1: 39, 2: 29, 3: 23, 4: 17.5}
-    
-    for frame_data in frames_in:
-        lines = [l for l in frame_data.get("lines", []) if isinstance(l, str) and l.strip()]
-        if not lines:
-            continue
-            
-        line_count = len(lines)
-        font_size = font_size_map.get(line_count, 17.5)
-        
-        frame = {
-            "HoldTime": hold,
-            "Lines": [{"Font": "dak_eccb_black-webfont.ttf", "FontSize": font_size, "Text": l} 
-                      for l in lines],
-            "LineSpacing": 0,
-        }
-        frames.append(frame)
-    
-    if not frames:
-        return jsonify({"error": "no valid frames with text"}), 400
-    
-    # Minimal structure that works (no extra fields)
-    msg = {
-        "Name": name,
-        "Height": 32,
-        "Width": 72,
-        "IsPermanent": False,
-        "Frames": frames,
-        "CurrentSchedule": {
-            "Enabled":   body.get("enabled", True),
-            "StartTime": sched_in.get("StartTime", "PT0H0M0S"),
-            "EndTime":   sched_in.get("EndTime",   "PT0H0M0S"),
-            "Dow":       sched_in.get("Dow", 127) if body.get("enabled", True) else 0,
-            "IsAllDay":  sched_in.get("IsAllDay", True),
-        },
-    }
-    
-    import json
-    print(f"[CREATE] name={name!r} frames={len(frames)} total_lines={sum(len(f['Lines']) for f in frames)}", flush=True)
-    print(f"[CREATE] name={name!r} frames={len(frames)} total_lines={sum(len(f['Lines']) for f in frames)}", flush=True)
-    print(f"[MSG] Sending to sign: {json.dumps(msg, indent=2)}", flush=True)
+@app.route("/api/signs/<sign>/messages/create", methods=["POST"])
+def api_create_message(sign=None):
+    client = _client(sign)
+    msg, error = build_message(request.json or {})
+    if error:
+        return jsonify({"error": error}), 400
     
+    app.logger.info("[%s] create %r frames=%d total_lines=%d", client.name, msg.name,
+                    len(msg.frames), sum(len(f.lines) for f in msg.frames))
+    payloads.dump("create", client.name, msg)
+
+    if get_outbox(client.name).depth:
+        return _queued(client, save=msg)   # behind earlier queued writes
     try:
-        result, code = save_message_obj(msg)
-        return jsonify({"result": result, "status": code, "message": msg}), code
+        result, code = client.save_message_obj(msg)
+        return jsonify({"result": result, "status": code, "message": msg.to_eccb()}), code
+    except requests.exceptions.ConnectionError as e:
+        return _queued(client, e, save=msg)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/api/fit", methods=["POST"])
+@app.route("/api/signs/<sign>/fit", methods=["POST"])
+def api_fit(sign=None):
+    """Largest font size at which each frame's lines fit the sign.
+
+    Body: {"lines": [...]} or {"frames": [{"lines": [...]}, ...]}, plus
+    optional "font", "width", "height" and "lineSpacing". Cheap enough to
+    call on every keystroke: fonts are parsed once and fits are memoized.
+    """
+    if sign is not None:
+        _client(sign)
+    body   = request.json or {}
+    frames = body.get("frames") or [{"lines": body.get("lines") or []}]
+    font   = body.get("font") or DEFAULT_FONT
+    try:
+        box = (int(body.get("width", SIGN_WIDTH)), int(body.get("height", SIGN_HEIGHT)),
+               int(body.get("lineSpacing", 0)))
+        texts = [[l for l in f["lines"] if isinstance(l, str) and l.strip()] for f in frames]
+    except (TypeError, ValueError, KeyError):
+        return jsonify({"error": "frames of lines and integer width/height expected"}), 400
+    return jsonify({"font": font, "width": box[0], "height": box[1],
+                    "frames": [fit(t, font, *box) for t in texts]})
+
+def _preview_response(msg):
+    """PNG of one frame (?frame=N), or an animated PNG of the whole message.
+
+    ?scale=N enlarges each LED to NxN pixels. The ETag is a hash of what is
+    drawn, so an unchanged thumbnail costs a 304 and no rendering.
+    """
+    scale  = min(max(request.args.get("scale", 1, type=int), 1), MAX_SCALE)
+    index  = request.args.get("frame", type=int)
+    frames = msg.frames or ()
+    if index is not None and not 0 <= index < len(frames):
+        return jsonify({"error": f"no frame {index}"}), 404
+    key  = frame_key(frames[index]) if index is not None else message_key(msg)
+    etag = f"{key}-{scale}"
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers={"ETag": f'"{etag}"'})
+    try:
+        if index is not None:
+            data = encode_png(render_frame(frames[index], key=key), scale=scale)
+        else:
+            data = render_message(msg, scale)
+    except PreviewError as e:
+        return jsonify({"error": str(e)}), 409
+    resp = Response(data, mimetype="image/png")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.set_etag(etag)
+    return resp
+
+@app.route("/api/messages/preview")
+@app.route("/api/signs/<sign>/messages/preview")
+def api_message_preview(sign=None):
+    """Preview of a message on the sign (?name=...), drawn from the cached list."""
+    client = _client(sign)
+    name   = request.args.get("name")
+    if not name:
+        return jsonify({"error": "name required"}), 400
+    try:
+        msg = client.find_message(name)
+    except requests.exceptions.ConnectionError as e:
+        return _unreachable(e)
+    if msg is None:
+        return jsonify({"error": f"Message '{name}' not found"}), 404
+    return _preview_response(msg)
+
+@app.route("/api/preview", methods=["POST"])
+@app.route("/api/signs/<sign>/preview", methods=["POST"])
+def api_preview(sign=None):
+    """Preview of an unsaved message; takes the same body as create."""
+    if sign is not None:
+        _client(sign)
+    msg, error = build_message(request.json or {})
+    if error:
+        return jsonify({"error": error}), 400
+    return _preview_response(msg)
+
 @app.route("/api/messages/update", methods=["POST"])
-def api_update_message():
+@app.route("/api/signs/<sign>/messages/update", methods=["POST"])
+def api_update_message(sign=None):
+    client        = _client(sign)
     body          = request.json or {}
     original_name = body.get("name")
     if not original_name:
         return jsonify({"error": "name required"}), 400
+    outbox = get_outbox(client.name)
     try:
-        msgs = get_messages()
-        msg  = next((m for m in msgs if m.get("Name") == original_name), None)
-        if msg is None:
+        current = outbox.find(original_name)
+        if current is None:
             return jsonify({"error": f"Message '{original_name}' not found"}), 404
-        msg = copy.deepcopy(msg)
-
-        # Apply frame text edits — supports line count changes from template picker
-        for fu in (body.get("frames") or []):
-            fi = fu.get("frameIndex", 0)
-            if fi < len(msg["Frames"]):
-                new_lines = fu.get("lines", [])
-                frame     = msg["Frames"][fi]
-                font      = (frame["Lines"][0].get("Font", "dak_eccb_black-webfont.ttf")
-                             if frame.get("Lines") else "dak_eccb_black-webfont.ttf")
-                font_size = (frame["Lines"][0].get("FontSize", 17.5)
-                             if frame.get("Lines") else 17.5)
-                if len(new_lines) != len(frame.get("Lines", [])):
-                    # Line count changed — rebuild lines
-                    frame["Lines"] = [{"Font": font, "FontSize": font_size, "Text": t}
-                                      for t in new_lines]
-                else:
-                    for li, text in enumerate(new_lines):
-                        frame["Lines"][li]["Text"] = text
-
-        # Apply schedule changes
-        if body.get("schedule") is not None:
-            msg["CurrentSchedule"].update(body["schedule"])
-
-        # Rename if requested
-        new_name = body.get("newName", "").strip()
-        if new_name and new_name != original_name:
-            msg["Name"] = new_name
-
-        # Delete old then save updated
-        del_text, del_code = delete_message_by_name(original_name)
-        app.logger.info(f"pre-update delete '{original_name}' -> {del_code}: {del_text[:100]}")
-
-        import json
-        print(f"[UPDATE] Sending to sign: {json.dumps(msg, indent=2)}", flush=True)
-        save_result, save_code = save_message_obj(msg)
-        return jsonify({"result": save_result, "status": save_code, "message": msg}), save_code
-
-    except requests.exceptions.ConnectionError:
-        return jsonify({"error": "Cannot reach sign"}), 503
+        msg = apply_update(current, body)
+
+        payloads.dump("update", client.name, msg)
+        renamed = original_name if msg.name != original_name else None
+        if outbox.depth:
+            return _queued(client, save=msg, delete=renamed)
+        try:
+            save_result, save_code, action, changes = client.replace_message(current, msg)
+        except requests.exceptions.ConnectionError as e:
+            return _queued(client, e, save=msg, delete=renamed)
+        app.logger.info("[%s] update %r -> %s %s", client.name, original_name, action, save_code)
+        return jsonify({"result": save_result, "status": save_code, "message": msg.to_eccb(),
+                        "action": action, "changes": [format_path(p) for p in changes]}), save_code
+
+    except MessageError as e:
+        return jsonify({"error": str(e)}), e.status
+    except requests.exceptions.ConnectionError as e:
+        return _unreachable(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/messages/toggle", methods=["POST"])
-def api_toggle_message():
+@app.route("/api/signs/<sign>/messages/toggle", methods=["POST"])
+def api_toggle_message(sign=None):
+    client  = _client(sign)
     body    = request.json or {}
     name    = body.get("name")
     enabled = body.get("enabled")
     if name is None or enabled is None:
         return jsonify({"error": "name and enabled required"}), 400
+    outbox = get_outbox(client.name)
     try:
-        msgs = get_messages()
-        msg  = next((m for m in msgs if m.get("Name") == name), None)
-        if msg is None:
+        current = outbox.find(name)
+        if current is None:
             return jsonify({"error": f"Message '{name}' not found"}), 404
-        msg = copy.deepcopy(msg)
-        msg["CurrentSchedule"]["Enabled"] = enabled
-        # When enabling, restore Dow to all days if it was 0 (disabled state)
-        if enabled and msg["CurrentSchedule"].get("Dow") == 0:
-            msg["CurrentSchedule"]["Dow"] = 127
-        # When disabling, set Dow to 0
-        elif not enabled:
-            msg["CurrentSchedule"]["Dow"] = 0
-        delete_message_by_name(name)
-        result, code = save_message_obj(msg)
-        return jsonify({"result": result, "status": code, "enabled": enabled}), code
-    except requests.exceptions.ConnectionError:
-        return jsonify({"error": "Cannot reach sign"}), 503
+        msg = apply_toggle(current, enabled)
+        if outbox.depth:
+            return _queued(client, save=msg)
+        try:
+            result, code, action, _ = client.replace_message(current, msg)
+        except requests.exceptions.ConnectionError as e:
+            return _queued(client, e, save=msg)
+        return jsonify({"result": result, "status": code, "enabled": enabled,
+                        "action": action}), code
+    except requests.exceptions.ConnectionError as e:
+        return _unreachable(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/messages/delete", methods=["POST"])
-def api_delete_message():
+@app.route("/api/signs/<sign>/messages/delete", methods=["POST"])
+def api_delete_message(sign=None):
+    client = _client(sign)
     body = request.json or {}
     name = body.get("Name") or body.get("name")
     if not name:
         return jsonify({"error": "Name required"}), 400
-    result, code = delete_message_by_name(name)
+    if get_outbox(client.name).depth:
+        return _queued(client, delete=name)
+    try:
+        result, code = client.delete_message_by_name(name)
+    except requests.exceptions.ConnectionError as e:
+        return _queued(client, e, delete=name)
     return jsonify({"result": result, "status": code}), code
 
+@app.route("/api/messages/batch", methods=["POST"])
+@app.route("/api/signs/<sign>/messages/batch", methods=["POST"])
+def api_batch_messages(sign=None):
+    """Apply a list of create/update/toggle/delete operations in one go.
+
+    Body: {"operations": [{"op": "toggle", "name": ..., "enabled": ...}, ...]},
+    each operation taking the same fields as its single-message route. They
+    are resolved against one snapshot of the message list and collapsed, so
+    only the net changes are written to the sign. Like the single-message
+    routes, the batch is queued (202) while the sign is unreachable or
+    earlier writes are still queued, and planned against the queued list.
+    """
+    client = _client(sign)
+    outbox = get_outbox(client.name)
+    body   = request.json
+    ops    = body.get("operations") if isinstance(body, dict) else None
+    if not isinstance(ops, list) or not ops:
+        return jsonify({"error": "operations list required"}), 400
+    error = None
+    try:
+        msgs = client.get_messages()
+    except requests.exceptions.ConnectionError as e:
+        msgs, error = client.last_known_messages(), e
+        if msgs is None:
+            return _unreachable(e)
+    try:
+        # Resolved against the list as it will be once queued writes land
+        snapshot, _ = outbox.view(msgs)
+        deletes, saves, results = plan_batch(snapshot, ops)
+        if error is not None or outbox.depth:
+            return _queued_batch(client, error, deletes, saves, results)
+        writes = client.write_batch(deletes, saves, {m.name for m in snapshot})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    # The sign dropped off part way: queue what didn't get through
+    lost = {name for name, entries in writes.items()
+            if any(not w["ok"] and w["status"] == 503 for w in entries)}
+    for msg in saves:
+        if msg.name in lost:
+            outbox.put("save", msg.name, msg)
+    for name in deletes:
+        if name in lost:
+            outbox.put("delete", name)
+
+    for result in results:
+        if "error" in result:
+            continue
+        touched = [w for name in result["names"] for w in writes.get(name, [])]
+        if lost.intersection(result["names"]):
+            result.update(ok=True, status=202, queued=True, writes=len(touched))
+            continue
+        failed  = [w for w in touched if not w["ok"]]
+        result["ok"]     = not failed
+        result["status"] = failed[0]["status"] if failed else 200
+        result["writes"] = len(touched)
+        if failed:
+            result["error"] = failed[0].get("error") or failed[0].get("result")
+    ok   = all(r["ok"] for r in results)
+    body = {"ok": ok, "results": results,
+            "deleted": [n for n in deletes if n not in lost],
+            "saved": [m.name for m in saves if m.name not in lost]}
+    if lost:
+        body.update(queued=sorted(lost), **outbox.describe())
+    return jsonify(body), 200 if ok and not lost else 202 if ok else 207
+
+def _queued_batch(client, error, deletes, saves, results):
+    """202 response for a batch kept in the outbox, like _queued() for one write."""
+    outbox = get_outbox(client.name)
+    for msg in saves:
+        outbox.put("save", msg.name, msg)
+    for name in deletes:
+        outbox.put("delete", name)
+    for result in results:
+        if "error" not in result:
+            result.update(ok=True, status=202, queued=True, writes=0)
+    ok   = all(r["ok"] for r in results)
+    body = {"ok": ok, "queued": True, "results": results, **outbox.describe(),
+            "deleted": deletes, "saved": [m.name for m in saves]}
+    if isinstance(error, SignOffline):
+        body["offline_since"] = error.since_iso
+    return jsonify(body), 202 if ok else 207
+
 @app.route("/api/messages/reorder", methods=["POST"])
-def api_reorder_messages():
-    s = get_session()
+@app.route("/api/signs/<sign>/messages/reorder", methods=["POST"])
+def api_reorder_messages(sign=None):
+    client = _client(sign)
+    try:
+        text, code = client.reorder_messages(request.json or {})
+        return jsonify({"result": text, "status": code}), code
+    except requests.exceptions.ConnectionError as e:
+        return _unreachable(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/backup")
+@app.route("/api/signs/<sign>/backup")
+def api_backup(sign=None):
+    """Every message on the sign as JSON Lines, written out as it is serialized.
+    ?gzip=1 compresses it; ?fresh=0 allows the cached list."""
+    client = _client(sign)
     try:
-        r = s.post(f"{BASE_URL}/ECCB/updateMessageSchedulePosition.php",
-                   data=request.json or {}, timeout=60)
-        return jsonify({"result": r.text, "status": r.status_code}), r.status_code
+        msgs = client.get_messages(fresh=request.args.get("fresh", "1") == "1")
+    except requests.exceptions.ConnectionError as e:
+        return _unreachable(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+    body     = backup_lines(client, msgs)
+    filename = f"{client.name}-{datetime.now():%Y%m%d-%H%M%S}.jsonl"
+    headers  = {"Cache-Control": "no-store"}
+    if request.args.get("gzip") == "1":
+        body      = gzip_stream(body)
+        filename += ".gz"
+        mimetype  = "application/gzip"
+    else:
+        mimetype  = "application/x-ndjson"
+    headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return Response(body, mimetype=mimetype, headers=headers)
+
+@app.route("/api/restore", methods=["POST"])
+@app.route("/api/signs/<sign>/restore", methods=["POST"])
+def api_restore(sign=None):
+    """Apply a backup from /api/backup, sent as the raw request body (gzipped
+    or not) and read as it arrives. Streams back one JSON progress event per
+    line. ?dry_run=1 only reports, ?skip_unchanged=0 rewrites identical
+    messages too, ?workers=1 writes in file order."""
+    client = _client(sign)
+    if request.mimetype == "multipart/form-data":
+        return jsonify({"error": "send the backup as the request body, not a form upload"}), 415
+    try:
+        workers = int(request.args.get("workers", RESTORE_WORKERS))
+    except ValueError:
+        return jsonify({"error": "workers must be a number"}), 400
+    dry_run = request.args.get("dry_run") == "1"
+    if not dry_run and get_outbox(client.name).depth:
+        # Replaying those later would undo parts of the restore
+        return jsonify({"error": "writes are still queued for this sign; restore once they "
+                                 "are replayed", **get_outbox(client.name).describe()}), 409
+    try:
+        events = restore(client, read_lines(request.stream),
+                         dry_run=dry_run,
+                         skip_unchanged=request.args.get("skip_unchanged", "1") == "1",
+                         workers=min(max(workers, 1), 8))
+        first = next(events)   # fetches the current list, so an offline sign fails here
+    except requests.exceptions.ConnectionError as e:
+        return _unreachable(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    def generate():
+        yield json.dumps(first) + "\n"
+        try:
+            for event in events:
+                yield json.dumps(event) + "\n"
+        except Exception as e:   # the status line is long gone; report it in-band
+            yield json.dumps({"event": "done", "ok": False, "error": str(e)}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.route("/api/messages/probe", methods=["POST"])
-def api_probe_save():
+@app.route("/api/signs/<sign>/messages/probe", methods=["POST"])
+def api_probe_save(sign=None):
+    client = _client(sign)
     body = request.json or {}
     name = body.get("name")
     if not name:
         return jsonify({"error": "name required"}), 400
     try:
-        msgs = get_messages()
-        msg  = next((m for m in msgs if m.get("Name") == name), None)
+        msg = client.find_message(name)
         if not msg:
             return jsonify({"error": f"'{name}' not found"}), 404
-        msg = copy.deepcopy(msg)
-        s   = get_session()
+        s   = client.get_session()
+        base_url = s.base_url
         results = []
 
         headers = {
             "X-Requested-With": "XMLHttpRequest",
-            "Referer": f"{BASE_URL}/ECCB/EditMessage.html",
-            "Origin": BASE_URL,
+            "Referer": f"{base_url}/ECCB/EditMessage.html",
+            "Origin": base_url,
         }
-        msg_json = json.dumps(msg)
+        msg_json = json.dumps(msg.to_eccb())
         results.append({"info": "session_cookies", "cookies": dict(s.cookies)})
 
         for field in ["message", "Message", "data", "json", "msg"]:
-            r = s.post(f"{BASE_URL}/ECCB/savemessage.php",
+            r = s.post(f"{base_url}/ECCB/savemessage.php",
                        data={field: msg_json}, headers=headers, timeout=60)
             body = strip_bom(r.content)
             results.append({"format": f"form_{field}", "status": r.status_code,
                             "body": body or "(empty-BOM-only)"})
 
-        r = s.post(f"{BASE_URL}/ECCB/savemessage.php",
-                   json=msg, headers=headers, timeout=60)
+        r = s.post(f"{base_url}/ECCB/savemessage.php",
+                   json=msg.to_eccb(), headers=headers, timeout=60)
         results.append({"format": "raw_json", "status": r.status_code,
                         "body": strip_bom(r.content) or "(empty-BOM-only)"})
 
-        r2 = s.get(f"{BASE_URL}/ECCB/deletemessage.php",
+        r2 = s.get(f"{base_url}/ECCB/deletemessage.php",
                    params={"Name": name}, headers=headers, timeout=60)
         results.append({"format": "delete_GET_Name", "status": r2.status_code,
                         "body": strip_bom(r2.content) or "(empty-BOM-only)"})
-        r3 = s.post(f"{BASE_URL}/ECCB/deletemessage.php",
+        r3 = s.post(f"{base_url}/ECCB/deletemessage.php",
                     data={"Name": name}, headers=headers, timeout=60)
         results.append({"format": "delete_POST_Name", "status": r3.status_code,
                         "body": strip_bom(r3.content) or "(empty-BOM-only)"})
 
-        msgs_after = get_messages()
+        client.invalidate_messages()
+        msgs_after = client.get_messages(fresh=True)
         return jsonify({
             "session_cookies": dict(s.cookies),
             "results": results,
             "msg_count_after": len(msgs_after),
-            "msg_names_after": [m.get("Name") for m in msgs_after],
+            "msg_names_after": [m.name for m in msgs_after],
         }), 200
+    except requests.exceptions.ConnectionError as e:
+        return _unreachable(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route("/api/sync-time", methods=["POST"])
-def api_sync_time():
+def _sync_time(client):
     now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
-    text, code = eccb_put(f"/daktronics/syscontrol/1.0/datetime?Time={now}")
-    return jsonify({"result": text, "time_sent": now, "status": code}), code
+    text, code = client.eccb_put(f"/daktronics/syscontrol/1.0/datetime?Time={now}")
+    return {"result": text, "time_sent": now, "status": code}
+
+@app.route("/api/sync-time", methods=["POST"])
+@app.route("/api/signs/<sign>/sync-time", methods=["POST"])
+def api_sync_time(sign=None):
+    result = _sync_time(_client(sign))
+    return jsonify(result), result["status"]
 
 @app.route("/api/brightness", methods=["POST"])
-def api_set_brightness():
+@app.route("/api/signs/<sign>/brightness", methods=["POST"])
+def api_set_brightness(sign=None):
     body = request.json or {}
-    text, code = eccb_put("/daktronics/syscontrol/1.0/configuration/output/0/dimming", data=body)
+    text, code = _client(sign).eccb_put("/daktronics/syscontrol/1.0/configuration/output/0/dimming", data=body)
+    _poller(sign).poke("dimming")
     return jsonify({"result": text, "status": code}), code
 
 @app.route("/api/settings", methods=["POST"])
-def api_update_settings():
-    global SIGN_IP, USERNAME, PASSWORD, BASE_URL, _session, _session_valid
-    body     = request.json or {}
-    SIGN_IP  = body.get("ip", SIGN_IP)
-    USERNAME = body.get("username", USERNAME)
-    PASSWORD = body.get("password", PASSWORD)
-    BASE_URL = f"http://{SIGN_IP}"
-    with _session_lock:
-        _session       = None
-        _session_valid = False
-    return jsonify({"ok": True, "ip": SIGN_IP, "username": USERNAME})
+@app.route("/api/signs/<sign>/settings", methods=["POST"])
+def api_update_settings(sign=None):
+    client = _client(sign)
+    body   = request.json or {}
+    client.configure(ip=body.get("ip"), username=body.get("username"),
+                     password=body.get("password"))
+    if shared.active:
+        shared.save_sign(client.name, client.ip, client.username, client.password)
+    _pollers[client.name].poke()
+    return jsonify({"ok": True, "ip": client.ip, "username": client.username})
 
 @app.route("/api/settings", methods=["GET"])
-def api_get_settings():
-    return jsonify({"ip": SIGN_IP, "username": USERNAME, "password": PASSWORD})
+@app.route("/api/signs/<sign>/settings", methods=["GET"])
+def api_get_settings(sign=None):
+    client = _client(sign)
+    return jsonify({"ip": client.ip, "username": client.username, "password": client.password})
 
 @app.route("/api/raw", methods=["POST"])
-def api_raw():
+@app.route("/api/signs/<sign>/raw", methods=["POST"])
+def api_raw(sign=None):
+    client = _client(sign)
     body   = request.json or {}
     path   = body.get("path", "/")
     method = body.get("method", "GET").upper()
     data   = body.get("body", None)
-    s      = get_session()
+    if method != "GET":
+        client.invalidate_messages()
     try:
-        r = s.request(method, f"{BASE_URL}{path}",
-                      json=json.loads(data) if data and method != "GET" else None,
-                      timeout=60)
+        r = client.call(method, path,
+                        json=json.loads(data) if data and method != "GET" else None)
         try:
             raw = strip_bom(r.content)
             return jsonify(json.loads(raw)), r.status_code
         except Exception:
             return jsonify({"raw": strip_bom(r.content)}), r.status_code
-    except requests.exceptions.ConnectionError:
-        return jsonify({"error": "Cannot reach sign"}), 503
+    except requests.exceptions.ConnectionError as e:
+        return _unreachable(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+# ─── Offline write queue ───────────────────────────────────────────────────────
+
+@app.route("/api/queue")
+@app.route("/api/signs/<sign>/queue")
+def api_queue(sign=None):
+    """Writes waiting for the sign to come back, oldest first, and the ones
+    it rejected MAX_ATTEMPTS times and were set aside."""
+    outbox = get_outbox(_client(sign).name)
+    return jsonify({**outbox.describe(), "pending": outbox.pending(),
+                    "rejected": outbox.pending(failed=True)})
+
+@app.route("/api/queue/retry", methods=["POST"])
+@app.route("/api/signs/<sign>/queue/retry", methods=["POST"])
+def api_queue_retry(sign=None):
+    """Replay now, including writes that were set aside."""
+    outbox = get_outbox(_client(sign).name)
+    requeued = outbox.retry_failed()
+    return jsonify({"ok": True, "requeued": requeued, **outbox.describe()})
+
+@app.route("/api/queue/discard", methods=["POST"])
+@app.route("/api/signs/<sign>/queue/discard", methods=["POST"])
+def api_queue_discard(sign=None):
+    outbox = get_outbox(_client(sign).name)
+    op_id  = (request.json or {}).get("id")
+    if not isinstance(op_id, int):
+        return jsonify({"error": "id required"}), 400
+    if not outbox.discard(op_id):
+        return jsonify({"error": f"No queued write {op_id}"}), 404
+    return jsonify({"ok": True, **outbox.describe()})
+
+# ─── Desired-state sync ────────────────────────────────────────────────────────
+
+@app.route("/api/sync", methods=["GET"])
+def api_sync_status():
+    if _reconciler is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **_reconciler.describe()})
+
+@app.route("/api/sync", methods=["POST"])
+def api_sync_now():
+    """Reconcile every sign in the desired-state file now."""
+    if _reconciler is None:
+        return jsonify({"error": "no desired-state file configured (SYNC_FILE)"}), 404
+    results = _reconciler.run_once(wait=30)
+    if results is None:
+        return jsonify({"error": "a sync is already running in another worker"}), 409
+    ok = all(r.get("ok") for r in results.values())
+    return jsonify({"ok": ok, "error": _reconciler.error, "results": results}), 200 if ok else 207
+
+@app.route("/api/sync/plan", methods=["GET", "POST"])
+@app.route("/api/signs/<sign>/sync/plan", methods=["GET", "POST"])
+def api_sync_plan(sign=None):
+    """What a sync would write, without writing it. GET plans from the
+    configured file; POST a desired-state document to check it first."""
+    if sign is not None:
+        _client(sign)
+    if request.method == "POST":
+        try:
+            desired = parse_desired(request.json)
+        except SyncError as e:
+            return jsonify({"error": str(e)}), 400
+    elif _reconciler is None:
+        return jsonify({"error": "no desired-state file configured (SYNC_FILE)"}), 404
+    else:
+        desired = _reconciler.desired()
+        if _reconciler.error:
+            return jsonify({"error": _reconciler.error}), 409
+    if sign is not None and sign not in desired:
+        return jsonify({"error": f"sign '{sign}' is not in the desired state"}), 404
+    return jsonify({"plans": plan_all(desired, sign)})
+
+# ─── Fleet ─────────────────────────────────────────────────────────────────────
+
+@app.route("/api/signs", methods=["GET"])
+def api_list_signs():
+    return jsonify({"default": DEFAULT_SIGN,
+                    "signs": [c.describe() for c in all_signs()]})
+
+@app.route("/api/signs", methods=["POST"])
+def api_add_sign():
+    body = request.json or {}
+    name = (body.get("name") or "").strip()
+    ip   = (body.get("ip") or "").strip()
+    if not name or not ip:
+        return jsonify({"error": "name and ip required"}), 400
+    if get_sign(name):
+        return jsonify({"error": f"Sign '{name}' already exists"}), 409
+    client = _register_sign(name, ip, body.get("username", USERNAME),
+                            body.get("password", PASSWORD))
+    if shared.active:
+        shared.save_sign(name, client.ip, client.username, client.password)
+    return jsonify({"ok": True, "sign": client.describe()}), 201
+
+@app.route("/api/signs/<sign>", methods=["DELETE"])
+def api_remove_sign(sign):
+    if sign == DEFAULT_SIGN:
+        return jsonify({"error": "Cannot remove the default sign"}), 400
+    if get_sign(sign) is None:
+        return jsonify({"error": f"Unknown sign '{sign}'"}), 404
+    _forget_sign(sign)
+    if shared.active:
+        shared.delete_sign(sign)
+    return jsonify({"ok": True})
+
+def _fleet_targets(body):
+    """Clients named in body["signs"], or every registered sign."""
+    names = body.get("signs")
+    if not names:
+        return all_signs()
+    missing = [n for n in names if get_sign(n) is None]
+    if missing:
+        abort(make_response(jsonify({"error": f"Unknown signs: {', '.join(missing)}"}), 404))
+    return [get_sign(n) for n in names]
+
+def _fleet_response(results):
+    ok = all(r["ok"] and 200 <= r["result"].get("status", 200) < 300
+             for r in results.values())
+    return jsonify({"ok": ok, "signs": results}), 200 if ok else 207
+
+@app.route("/api/fleet/messages", methods=["POST"])
+def api_fleet_push_message():
+    """Create (or overwrite) one message on every sign, concurrently."""
+    body = request.json or {}
+    msg, error = build_message(body)
+    if error:
+        return jsonify({"error": error}), 400
+
+    def push(client):
+        result, code = client.save_message_obj(msg)
+        return {"result": result, "status": code}
+
+    return _fleet_response(fan_out(_fleet_targets(body), push))
+
+@app.route("/api/fleet/messages/delete", methods=["POST"])
+def api_fleet_delete_message():
+    body = request.json or {}
+    name = body.get("Name") or body.get("name")
+    if not name:
+        return jsonify({"error": "Name required"}), 400
+
+    def delete(client):
+        result, code = client.delete_message_by_name(name)
+        return {"result": result, "status": code}
+
+    return _fleet_response(fan_out(_fleet_targets(body), delete))
+
+@app.route("/api/fleet/sync-time", methods=["POST"])
+def api_fleet_sync_time():
+    return _fleet_response(fan_out(_fleet_targets(request.json or {}), _sync_time))
+
+@app.route("/api/fleet/status")
+def api_fleet_status():
+    def status(client):
+        data, code = _pollers[client.name].get("status")
+        return {"result": data, "status": code}
+
+    return _fleet_response(fan_out(all_signs(), status))
+
+
+@app.route("/metrics")
+def metrics():
+    if METRICS_TOKEN:
+        allowed = hmac.compare_digest(request.headers.get("Authorization", ""),
+                                      f"Bearer {METRICS_TOKEN}")
+    else:
+        allowed = request.remote_addr in ("127.0.0.1", "::1")
+    if not (allowed or current_user.is_authenticated):
+        return jsonify({"error": "forbidden"}), 403
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+PUBLIC_ENDPOINTS.add("metrics")
+
+
+@app.route("/api/debug/logging", methods=["GET", "POST"])
+def api_debug_logging():
+    """Change the log level, or capture full payloads for some message names.
+
+    POST {"level": "DEBUG"} and/or {"payloads": {"names": ["Easter"], "sample": 1.0}}
+    ({"all": true} captures every message; {"names": []} turns capture off).
+    """
+    if request.method == "POST":
+        body = request.json or {}
+        try:
+            if body.get("level"):
+                set_level(body["level"])
+            if body.get("payloads") is not None:
+                p = body["payloads"]
+                payloads.enable(p.get("names") or (), p.get("all", False), p.get("sample", 1.0))
+        except (ValueError, TypeError) as e:
+            return jsonify({"error": str(e)}), 400
+    return jsonify({"level": get_level(), "payloads": payloads.describe()})
+
+
 @app.route("/diag")
 def api_diag():
-    """Hit /diag in a browser for a full readable diagnostic of sign connectivity and save/delete formats."""
-    results = []
+    """Hit /diag in a browser for a full readable diagnostic of sign connectivity and save/delete formats.
+
+    Add ?sign=<name> to diagnose a sign other than the default one.
+    """
+    client   = _client(request.args.get("sign"))
+    base_url = client.base_url
+    username = client.username
+    password = client.password
+    results  = []
 
     def test(label, fn):
         try:
@@ -495,12 +1030,12 @@ def api_diag():
     # 1. Basic connectivity
     test("GET getmessagelist.php", lambda: (
         lambda r: {"status": r.status_code, "bytes": len(r.content), "bom": r.content[:6].hex()}
-    )(requests.get(f"{BASE_URL}/ECCB/getmessagelist.php", auth=HTTPBasicAuth(USERNAME, PASSWORD), timeout=30)))
+    )(requests.get(f"{base_url}/ECCB/getmessagelist.php", auth=HTTPBasicAuth(username, password), timeout=30)))
 
     # 2. Get first real message name
     msg_name = None
     try:
-        r = requests.get(f"{BASE_URL}/ECCB/getmessagelist.php", auth=HTTPBasicAuth(USERNAME, PASSWORD), timeout=30)
+        r = requests.get(f"{base_url}/ECCB/getmessagelist.php", auth=HTTPBasicAuth(username, password), timeout=30)
         raw = strip_bom(r.content)
         msgs = json.loads(raw).get("Messages", [])
         real = [m for m in msgs if m.get("Name","").strip()]
@@ -516,15 +1051,15 @@ def api_diag():
         msg_json = json.dumps(msg_obj)
         headers_xhr = {
             "X-Requested-With": "XMLHttpRequest",
-            "Referer": f"{BASE_URL}/ECCB/EditMessage.html",
-            "Origin": BASE_URL,
+            "Referer": f"{base_url}/ECCB/EditMessage.html",
+            "Origin": base_url,
         }
-        auth = HTTPBasicAuth(USERNAME, PASSWORD)
+        auth = HTTPBasicAuth(username, password)
 
         # 3. Test every save format - look for 34 or 45 byte response
         for field in ["message", "Message", "data", "json", "msg", "content", "payload"]:
             def do_save(f=field):
-                r = requests.post(f"{BASE_URL}/ECCB/savemessage.php",
+                r = requests.post(f"{base_url}/ECCB/savemessage.php",
                     data={f: msg_json}, headers=headers_xhr, auth=auth, timeout=30)
                 body = strip_bom(r.content)
                 return {"status": r.status_code, "bytes": len(r.content), "body": body[:80] or "(bom-only)"}
@@ -532,7 +1067,7 @@ def api_diag():
 
         # 4. Raw JSON body
         def do_raw():
-            r = requests.post(f"{BASE_URL}/ECCB/savemessage.php",
+            r = requests.post(f"{base_url}/ECCB/savemessage.php",
                 json=msg_obj, headers=headers_xhr, auth=auth, timeout=30)
             body = strip_bom(r.content)
             return {"status": r.status_code, "bytes": len(r.content), "body": body[:80] or "(bom-only)"}
@@ -540,14 +1075,14 @@ def api_diag():
 
         # 5. Delete via GET
         def do_del_get():
-            r = requests.get(f"{BASE_URL}/ECCB/deletemessage.php",
+            r = requests.get(f"{base_url}/ECCB/deletemessage.php",
                 params={"Name": msg_name}, headers=headers_xhr, auth=auth, timeout=30)
             return {"status": r.status_code, "bytes": len(r.content), "body": strip_bom(r.content)[:80] or "(bom-only)"}
         test("delete GET ?Name=", do_del_get)
 
         # 6. Delete via POST form
         def do_del_post():
-            r = requests.post(f"{BASE_URL}/ECCB/deletemessage.php",
+            r = requests.post(f"{base_url}/ECCB/deletemessage.php",
                 data={"Name": msg_name}, headers=headers_xhr, auth=auth, timeout=30)
             return {"status": r.status_code, "bytes": len(r.content), "body": strip_bom(r.content)[:80] or "(bom-only)"}
         test("delete POST form", do_del_post)
@@ -556,14 +1091,16 @@ def api_diag():
         def do_del_browser():
             browser_headers = {
                 "Accept": "application/json, text/javascript, */*; q=0.01",
-                "Referer": f"{BASE_URL}/ECCB/EditMessage.html",
+                "Referer": f"{base_url}/ECCB/EditMessage.html",
                 "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/144.0.0.0 Safari/537.36",
             }
-            r = requests.post(f"{BASE_URL}/ECCB/deletemessage.php",
+            r = requests.post(f"{base_url}/ECCB/deletemessage.php",
                 data={"Name": msg_name}, headers=browser_headers, auth=auth, timeout=30)
             return {"status": r.status_code, "bytes": len(r.content), "body": strip_bom(r.content)[:80] or "(bom-only)"}
         test("delete POST browser-headers", do_del_browser)
 
+        client.invalidate_messages()
+
         # 8. Check what our Flask server IP appears as
         try:
             import socket
@@ -584,7 +1121,7 @@ def api_diag():
             "pre{background:#111;padding:12px;border-radius:4px;overflow:auto}",
             "</style></head><body>",
             "<h1>DAK SIGN DIAGNOSTIC</h1>",
-            f"<p style='color:#666;margin-bottom:16px'>Sign: {BASE_URL} &nbsp; User: {USERNAME}</p>",
+            f"<p style='color:#666;margin-bottom:16px'>Sign: {base_url} &nbsp; User: {username}</p>",
             "<div>"]
 
     for r in results:
@@ -4,11 +4,17 @@ Uses Authlib directly — no Flask-Dance — so the redirect URI is fully hardco
 Restricts access to @cedargroveleeds.org and @cedargroveleedsmedia.org accounts.
 """
 import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
 from datetime import timedelta
-from flask import redirect, url_for, session, request, render_template_string
+from flask import redirect, url_for, session, request, render_template_string, g
 from flask_login import LoginManager, UserMixin, login_user, logout_user, current_user
 from authlib.integrations.requests_client import OAuth2Session
 
+import metrics
+
 ALLOWED_DOMAINS  = {"cedargroveleeds.org", "cedargroveleedsmedia.org"}
 SESSION_DAYS     = 7
 REDIRECT_URI     = "https://dak.cedargroveleedsmedia.org/oauth/callback"
@@ -17,6 +23,27 @@ GOOGLE_TOKEN_URL = "https://oauth2.googleapis.com/token"
 GOOGLE_INFO_URL  = "https://www.googleapis.com/oauth2/v2/userinfo"
 SCOPES           = "openid email profile"
 
+# Everyone who has logged in is kept here, so remember-me cookies still work
+# after a restart and in every worker process. The most recently seen users
+# are also held in memory.
+USERS_FILE      = os.environ.get("DAK_USERS_FILE") or os.path.join(
+    os.environ.get("DAK_STATE_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                    "state"), "users.db")
+USER_CACHE_SIZE = 256
+
+# Endpoints reachable without a Google login. Anything added here must do its
+# own access check (see /metrics in app.py).
+PUBLIC_ENDPOINTS = {"login", "logout", "oauth_login", "oauth_callback", "static"}
+
+# Paths that skip the login check outright, before any user is loaded.
+PUBLIC_PATHS = ("/static/", "/favicon.ico", "/robots.txt")
+
+AUTH_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005, 0.025)
+auth_check   = metrics.Histogram("dak_auth_check_seconds",
+                                 "Time spent on the login check, by where the user came from"
+                                 " (public/cache/cookie/store/anonymous).", ["source"],
+                                 buckets=AUTH_BUCKETS)
+
 # ── User model ────────────────────────────────────────────────────
 class User(UserMixin):
     def __init__(self, email, name, picture):
@@ -25,12 +52,78 @@ class User(UserMixin):
         self.name    = name
         self.picture = picture
 
-_users = {}
+
+def allowed_email(email):
+    return "@" in email and email.split("@")[-1].lower() in ALLOWED_DOMAINS
+
+
+class UserStore:
+    """Users in a SQLite file, with an LRU of the most recently seen in front."""
+
+    def __init__(self, path, cache_size=USER_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._cache     = OrderedDict()   # email -> User, least recently used first
+        self._lock      = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS users (email TEXT PRIMARY KEY, name TEXT,"
+                         " picture TEXT, last_login REAL)")
+
+    def cached(self, email):
+        with self._lock:
+            user = self._cache.get(email)
+            if user is not None:
+                self._cache.move_to_end(email)
+            return user
+
+    def remember(self, user):
+        with self._lock:
+            self._cache[user.id] = user
+            self._cache.move_to_end(user.id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return user
+
+    def load(self, email):
+        """A stored user, or None; goes to the file."""
+        with self._lock:
+            row = self._db.execute("SELECT name, picture FROM users WHERE email = ?",
+                                   (email,)).fetchone()
+        return self.remember(User(email, *row)) if row else None
+
+    def save(self, email, name, picture):
+        with self._lock:
+            self._db.execute("INSERT INTO users VALUES (?, ?, ?, ?) ON CONFLICT(email) DO UPDATE SET"
+                             " name = excluded.name, picture = excluded.picture,"
+                             " last_login = excluded.last_login", (email, name, picture, time.time()))
+        return self.remember(User(email, name, picture))
+
+
+_store = None   # set by init_auth()
 
 def get_or_create_user(email, name, picture):
-    if email not in _users:
-        _users[email] = User(email, name, picture)
-    return _users[email]
+    """Called at each Google login; refreshes the stored name and picture."""
+    return _store.save(email, name, picture)
+
+def get_user(email):
+    """A user who has logged in before, or None. Checked in order: this
+    process's LRU, the profile in the signed session cookie, the store."""
+    if not allowed_email(email):
+        return None
+    user = _store.cached(email)
+    if user is not None:
+        g.auth_source = "cache"
+        return user
+    profile = session.get("profile")
+    if session.get("_user_id") == email and profile:
+        g.auth_source = "cookie"
+        return _store.remember(User(email, *profile))
+    user = _store.load(email)
+    if user is not None:
+        g.auth_source = "store"
+        session["profile"] = [user.name, user.picture]   # next request takes the cookie path
+    return user
 
 # ── Templates ─────────────────────────────────────────────────────
 LOGIN_HTML = """<!DOCTYPE html>
@@ -101,6 +194,8 @@ DENIED_HTML = """<!DOCTYPE html>
 
 
 def init_auth(app):
+    global _store
+    _store = UserStore(USERS_FILE)
     app.secret_key = os.environ.get("SECRET_KEY", "change-me-use-env-var")
     app.config["REMEMBER_COOKIE_DURATION"] = timedelta(days=SESSION_DAYS)
     app.config["REMEMBER_COOKIE_HTTPONLY"] = True
@@ -112,7 +207,7 @@ def init_auth(app):
 
     @login_manager.user_loader
     def load_user(user_id):
-        return _users.get(user_id)
+        return get_user(user_id)
 
     # ── Auth routes ───────────────────────────────────────────────
 
@@ -172,21 +267,28 @@ def init_auth(app):
         email   = info.get("email", "")
         name    = info.get("name", email)
         picture = info.get("picture", "")
-        domain  = email.split("@")[-1].lower() if "@" in email else ""
 
-        if domain not in ALLOWED_DOMAINS:
+        if not allowed_email(email):
             return render_template_string(DENIED_HTML, email=email)
 
         user = get_or_create_user(email, name, picture)
         login_user(user, remember=True)
+        session["profile"] = [name, picture]
         return redirect("/")
 
     # ── Protect all routes ────────────────────────────────────────
 
     @app.before_request
     def require_login():
-        public = {"login", "logout", "oauth_login", "oauth_callback", "static"}
-        if request.endpoint in public:
-            return
-        if not current_user.is_authenticated:
-            return redirect("/login")
+        started = time.perf_counter()
+        g.auth_source = "public"
+        try:
+            if request.path.startswith(PUBLIC_PATHS) or request.endpoint in PUBLIC_ENDPOINTS:
+                return
+            g.auth_source = "anonymous"   # get_user() says where it found them
+            if not current_user.is_authenticated:
+                return redirect("/login")
+        finally:
+            elapsed = time.perf_counter() - started
+            auth_check.observe(elapsed, source=g.auth_source)
+            metrics.add_timing("auth", elapsed)
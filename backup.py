@@ -0,0 +1,155 @@
+"""
+Backup and restore of a sign's messages for DAK Sign Controller.
+A backup is JSON Lines: one header line ({"_backup": {...}}) and then one
+ECCB message object per line, optionally gzipped. Both directions stream,
+so neither a backup nor a restore ever holds the whole file in memory, and
+a restore reports progress as it goes.
+"""
+import json
+import zlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timezone
+
+import requests
+
+from messages import diff_messages
+from model import Message, InvalidMessage
+from sign import SignOffline, BATCH_WRITE_WIDTH
+
+BACKUP_VERSION  = 1
+RESTORE_WORKERS = BATCH_WRITE_WIDTH   # concurrent writes to the sign during a restore
+READ_CHUNK      = 64 * 1024
+MAX_LINE        = 1024 * 1024         # longest accepted line; a message is a few KB
+
+
+# ── Backup ────────────────────────────────────────────────────────
+
+def backup_lines(client, msgs):
+    """JSONL lines (bytes) for a backup of `msgs`, taken from `client`."""
+    header = {"_backup": {"version": BACKUP_VERSION, "sign": client.name, "ip": client.ip,
+                          "taken": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                          "count": len(msgs)}}
+    yield json.dumps(header).encode() + b"\n"
+    for msg in msgs:
+        yield json.dumps(msg.to_eccb(), separators=(",", ":")).encode() + b"\n"
+
+
+def gzip_stream(chunks):
+    """Gzip an iterable of bytes on the fly."""
+    z = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        out = z.compress(chunk)
+        if out:
+            yield out
+    yield z.flush()
+
+
+# ── Restore ───────────────────────────────────────────────────────
+
+def read_lines(stream):
+    """Lines of an uploaded backup, gunzipping it if it starts with the gzip magic."""
+    first = stream.read(READ_CHUNK)
+    unzip = zlib.decompressobj(16 + zlib.MAX_WBITS) if first[:2] == b"\x1f\x8b" else None
+    buf   = b""
+    chunk = first
+    while chunk:
+        buf += unzip.decompress(chunk) if unzip else chunk
+        *lines, buf = buf.split(b"\n")
+        yield from lines
+        if len(buf) > MAX_LINE:
+            raise ValueError(f"line longer than {MAX_LINE} bytes; not a backup file?")
+        chunk = stream.read(READ_CHUNK)
+    if unzip:
+        buf += unzip.flush()
+    if buf:
+        yield buf
+
+
+def _parse(lines):
+    """(line number, header dict / Message / error string) for each non-blank line."""
+    for number, raw in enumerate(lines, 1):
+        if not raw.strip():
+            continue
+        try:
+            obj = json.loads(raw)
+            if isinstance(obj, dict) and "_backup" in obj:
+                yield number, obj["_backup"]
+                continue
+            msg = Message.from_eccb(obj)
+            msg.validate()
+            yield number, msg
+        except (ValueError, InvalidMessage) as e:
+            yield number, f"{type(e).__name__}: {e}"
+
+
+def _write(client, current, msg):
+    try:
+        if current is None:
+            text, code = client.save_message_obj(msg)
+            action = "created"
+        else:
+            text, code, action, _ = client.replace_message(current, msg)
+        ok = 200 <= code < 300
+        return {"ok": ok, "status": code, "action": action if ok else "failed",
+                **({} if ok else {"error": text[:200]})}
+    except SignOffline as e:
+        return {"ok": False, "status": 503, "action": "failed", "error": str(e)}
+    except requests.exceptions.ConnectionError:
+        return {"ok": False, "status": 503, "action": "failed", "error": "Cannot reach sign"}
+
+
+def restore(client, lines, dry_run=False, skip_unchanged=True, workers=RESTORE_WORKERS):
+    """Apply a backup to `client`, yielding progress events as dicts.
+
+    Events: one "start", then one "message" per message line (action
+    created/saved/replaced/renamed/unchanged/failed, or would-create /
+    would-update in a dry run) or "error" per unreadable line, then "done"
+    with the totals. Writes run `workers` at a time; with more than one,
+    the sign may list restored messages in a different order.
+    """
+    existing = {m.name: m for m in client.get_messages(fresh=True)}
+    yield {"event": "start", "sign": client.name, "existing": len(existing),
+           "dry_run": dry_run, "skip_unchanged": skip_unchanged}
+    counts  = Counter()
+    pending = {}   # future -> (line, name)
+
+    def finished(futures):
+        for f in futures:
+            number, name = pending.pop(f)
+            result = f.result()
+            counts[result["action"]] += 1
+            yield {"event": "message", "line": number, "name": name, **result}
+
+    with ThreadPoolExecutor(max_workers=max(1, workers),
+                            thread_name_prefix=f"restore-{client.name}") as pool:
+        for number, item in _parse(lines):
+            if isinstance(item, str):
+                counts["invalid"] += 1
+                yield {"event": "error", "line": number, "error": item}
+                continue
+            if isinstance(item, dict):
+                yield {"event": "header", "line": number, **item}
+                continue
+            current = existing.get(item.name)
+            if current is not None and skip_unchanged and not diff_messages(current, item):
+                counts["unchanged"] += 1
+                yield {"event": "message", "line": number, "name": item.name,
+                       "ok": True, "action": "unchanged"}
+                continue
+            if dry_run:
+                action = "would-create" if current is None else "would-update"
+                counts[action] += 1
+                yield {"event": "message", "line": number, "name": item.name,
+                       "ok": True, "action": action}
+                continue
+            pending[pool.submit(_write, client, current, item)] = (number, item.name)
+            # Keep only a few writes queued so the upload is read as it is applied
+            while len(pending) >= 2 * max(1, workers):
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                yield from finished(done)
+        while pending:
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            yield from finished(done)
+
+    yield {"event": "done", "ok": not counts["failed"] and not counts["invalid"], **counts}
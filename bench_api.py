@@ -0,0 +1,283 @@
+"""
+Benchmark: the Flask API under concurrent load, against a simulated sign.
+
+    python bench_api.py [--concurrency 1,8,32] [--requests 200] [--latency 0.05]
+                        [--messages 50] [--scenarios index,messages,status,update,toggle]
+                        [--out FILE] [--compare OLD.json]
+
+Starts signsim.py's sign with `--latency` seconds per request, points the
+app's default sign at it and runs each scenario from N threads, each with its
+own logged-in test client. For every scenario and concurrency it reports
+throughput, p50/p95/p99 latency, ECCB calls per request (from the app's own
+metrics) and time spent waiting on the sign's session lock. Results are
+saved as JSON (bench-results/ by default); --compare prints the change from
+an earlier file.
+
+The app is imported as configured, so its message cache and status poller
+are the real ones; only the history sampler is stopped, so it doesn't add
+sign calls to the counts. Its state directory (queue, users, cookies,
+shared state) is a temporary one, so a run leaves `state/` untouched.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+os.environ["DAK_STATE_DIR"] = tempfile.mkdtemp(prefix="dak-bench-")
+os.environ.pop("DAK_USERS_FILE", None)
+
+from bench_messages import make_list
+from signsim import SignSimulator
+
+BENCH_USER = "bench@cedargroveleeds.org"
+SIM_PORT   = 18081
+
+# Request numbers run on across runs, so each edit and toggle differs from
+# what the sign already holds and is really written
+_sequence = itertools.count(1)
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    i = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[i]
+
+
+# ── Scenarios ─────────────────────────────────────────────────────
+# Each takes (test client, request number, message names) and returns a response.
+
+def _index(c, i, names):
+    return c.get("/")
+
+
+def _messages(c, i, names):
+    return c.get("/api/messages")
+
+
+def _status(c, i, names):
+    return c.get("/api/status")
+
+
+def _update(c, i, names):
+    return c.post("/api/messages/update", json={
+        "name": names[i % len(names)],
+        "frames": [{"frameIndex": 0, "lines": [f"B{i}", "BENCH", "RUN"]}]})
+
+
+_enabled      = {}   # message name -> state last asked for
+_enabled_lock = threading.Lock()
+
+
+def _toggle(c, i, names):
+    # Flip each message every time, so every request is a real write
+    name = names[i % len(names)]
+    with _enabled_lock:
+        enabled = _enabled[name] = not _enabled.get(name, True)
+    return c.post("/api/messages/toggle", json={"name": name, "enabled": enabled})
+
+
+SCENARIOS = {"index": _index, "messages": _messages, "status": _status,
+             "update": _update, "toggle": _toggle}
+
+
+# ── Runner ────────────────────────────────────────────────────────
+
+def _counter_total(counter, **match):
+    idx = {l: i for i, l in enumerate(counter.labels)}
+    return sum(v for k, v in counter.values().items()
+               if all(k[idx[l]] == str(want) for l, want in match.items()))
+
+
+def _sign_calls(metrics, sign):
+    """{path: calls} to one sign so far."""
+    out = {}
+    idx = metrics.sign_requests.labels.index("path")
+    for key, value in metrics.sign_requests.values().items():
+        if key[0] == sign:
+            out[key[idx]] = out.get(key[idx], 0) + value
+    return out
+
+
+def _lock_waits(metrics, sign):
+    """(waits, seconds waited, waits over the first bucket) for one sign."""
+    counts = metrics.lock_wait.values().get((sign,))
+    if counts is None:
+        return 0, 0.0, 0
+    return counts[-2], counts[-1], counts[-2] - counts[0]
+
+
+def run(A, metrics, scenario, concurrency, total, names):
+    fn      = SCENARIOS[scenario]
+    sign    = A.DEFAULT_SIGN
+    clients = [_logged_in(A) for _ in range(concurrency)]
+    fn(clients[0], next(_sequence), names)   # warm: logs in, fills the cache
+
+    times, statuses = [], {}
+    lock          = threading.Lock()
+    remaining     = [total]
+
+    def worker(c):
+        while True:
+            with lock:
+                if not remaining[0]:
+                    return
+                remaining[0] -= 1
+                i = next(_sequence)
+            started = time.perf_counter()
+            r       = fn(c, i, names)
+            elapsed = time.perf_counter() - started
+            with lock:
+                times.append(elapsed)
+                statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+    calls_before = _sign_calls(metrics, sign)
+    waits_before = _lock_waits(metrics, sign)
+    hits_before  = _counter_total(metrics.cache_requests, sign=sign, result="hit")
+    threads = [threading.Thread(target=worker, args=(c,)) for c in clients]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+
+    calls = {p: n - calls_before.get(p, 0) for p, n in _sign_calls(metrics, sign).items()}
+    calls = {p: n for p, n in calls.items() if n}
+    waits = [a - b for a, b in zip(_lock_waits(metrics, sign), waits_before)]
+    times.sort()
+    ms = lambda s: round(s * 1000, 2) if s is not None else None
+    return {
+        "scenario": scenario, "concurrency": concurrency, "requests": len(times),
+        "statuses": statuses,
+        "errors": sum(n for code, n in statuses.items() if code >= 400),
+        "throughput": round(len(times) / wall, 1),
+        "p50_ms": ms(percentile(times, 50)), "p95_ms": ms(percentile(times, 95)),
+        "p99_ms": ms(percentile(times, 99)), "max_ms": ms(times[-1] if times else None),
+        "sign_calls_per_request": round(sum(calls.values()) / max(1, len(times)), 3),
+        "sign_calls": calls,
+        "cache_hits": _counter_total(metrics.cache_requests, sign=sign, result="hit") - hits_before,
+        "lock_waits": waits[0], "lock_wait_ms": ms(waits[1]), "lock_contended": waits[2],
+    }
+
+
+def _logged_in(A):
+    c = A.app.test_client()
+    with c.session_transaction() as s:
+        s["_user_id"] = BENCH_USER
+        s["_fresh"]   = True
+        s["profile"]  = ["Benchmark", ""]
+    return c
+
+
+def _git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+                              timeout=10).stdout.strip() or None
+    except OSError:
+        return None
+
+
+# ── Reporting ─────────────────────────────────────────────────────
+
+COLUMNS = (("throughput", "req/s"), ("p50_ms", "p50 ms"), ("p95_ms", "p95 ms"),
+           ("p99_ms", "p99 ms"), ("sign_calls_per_request", "calls/req"),
+           ("lock_wait_ms", "lock ms"))
+
+
+def report(results, previous=None):
+    prev = {(r["scenario"], r["concurrency"]): r for r in (previous or {}).get("results", [])}
+    print(f"  {'scenario':<10} {'conc':>4}" + "".join(f" {h:>10}" for _, h in COLUMNS) + "  errors")
+    for r in results:
+        row = f"  {r['scenario']:<10} {r['concurrency']:>4}"
+        for key, _ in COLUMNS:
+            row += f" {r[key] if r[key] is not None else '-':>10}"
+        print(row + f"  {r['errors'] or ''}")
+        old = prev.get((r["scenario"], r["concurrency"]))
+        if old:
+            row = f"  {'  vs old':<10} {'':>4}"
+            for key, _ in COLUMNS:
+                a, b = old.get(key), r[key]
+                row += f" {f'{(b - a) / a * 100:+.0f}%' if a and b is not None else '-':>10}"
+            print(row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load and latency benchmark for the Flask API.")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated thread counts")
+    parser.add_argument("--requests", type=int, default=200, help="per scenario and concurrency")
+    parser.add_argument("--latency", type=float, default=0.05, help="sign response time, seconds")
+    parser.add_argument("--messages", type=int, default=50, help="messages on the simulated sign")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--cassette", help="replay this signsim cassette instead of --latency")
+    parser.add_argument("--out", help="results file (default bench-results/api-<time>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare with")
+    args = parser.parse_args()
+
+    scenarios = args.scenarios.split(",")
+    unknown   = [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s) {unknown}; choose from {sorted(SCENARIOS)}")
+    levels = [int(n) for n in args.concurrency.split(",")]
+
+    if args.cassette:
+        from signsim import Cassette
+        sim = SignSimulator(Cassette.load(args.cassette))
+    else:
+        sim = SignSimulator(delay=args.latency, scale=0)
+        sim.messages = json.loads(make_list(args.messages))["Messages"]
+    sim.serve(port=SIM_PORT)
+
+    import logging
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    import app as A
+    import auth
+    import metrics
+    from history import remove_history
+    from logs import set_level
+    set_level("WARNING")
+    remove_history(A.DEFAULT_SIGN)
+    auth.get_or_create_user(BENCH_USER, "Benchmark", "")
+    r = _logged_in(A).post("/api/settings", json={"ip": f"127.0.0.1:{SIM_PORT}"})
+    if r.status_code != 200:
+        sys.exit(f"could not point the app at the simulated sign: {r.status_code} {r.json}")
+    names = [m["Name"] for m in sim.messages]
+    if not names:
+        sys.exit("the simulated sign has no messages")
+
+    print(f"{len(names)} messages, sign latency "
+          f"{'from ' + args.cassette if args.cassette else f'{args.latency * 1000:.0f} ms'}, "
+          f"{args.requests} requests per run\n")
+    results = []
+    for scenario in scenarios:
+        for n in levels:
+            results.append(run(A, metrics, scenario, n, args.requests, names))
+
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)
+    report(results, previous)
+
+    out = args.out or os.path.join("bench-results", f"api-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({"taken": datetime.now().isoformat(timespec="seconds"), "git": _git_rev(),
+                   "python": platform.python_version(),
+                   "settings": {"requests": args.requests, "latency": args.latency,
+                                "messages": len(names), "cassette": args.cassette,
+                                "cache_ttl": A.MESSAGE_CACHE_TTL},
+                   "results": results}, f, indent=2)
+    print(f"\nresults written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark: typed message model vs. the plain-dict path it replaced.
+
+    python bench_messages.py [count]
+
+Builds a synthetic getmessagelist.php response (500 messages by default) and
+times, for both representations, parsing it, serializing it back, editing one
+line in every message and diffing each edit against the original. The dict
+path edits with copy.deepcopy, as app.py used to.
+"""
+import copy
+import json
+import sys
+import timeit
+
+from messages import apply_update, apply_toggle, diff_messages
+from model import parse_messages, DEFAULT_FONT
+
+
+def make_list(count):
+    msgs = []
+    for i in range(count):
+        frames = [{"HoldTime": "P0Y0M0DT0H0M5S", "LineSpacing": 0,
+                   "Lines": [{"Font": DEFAULT_FONT, "FontSize": 23, "Text": f"MSG {i} F{f} L{l}"}
+                             for l in range(3)]}
+                  for f in range(1 + i % 3)]
+        msgs.append({"Name": f"Message {i}", "Height": 32, "Width": 72, "IsPermanent": False,
+                     "Frames": frames, "Notes": "", "Priority": i % 5,
+                     "CurrentSchedule": {"Enabled": True, "StartTime": "PT8H0M0S",
+                                         "EndTime": "PT17H0M0S", "Dow": 62, "IsAllDay": False}})
+    return json.dumps({"Messages": msgs})
+
+
+# ── The dict path, as it was ──────────────────────────────────────
+
+def dict_update(current, body):
+    msg = copy.deepcopy(current)
+    for fu in body["frames"]:
+        for line, text in zip(msg["Frames"][fu["frameIndex"]]["Lines"], fu["lines"]):
+            line["Text"] = text
+    return msg
+
+
+def dict_toggle(current, enabled):
+    msg = copy.deepcopy(current)
+    msg["CurrentSchedule"]["Enabled"] = enabled
+    msg["CurrentSchedule"]["Dow"] = 127 if enabled else 0
+    return msg
+
+
+# ── Runner ────────────────────────────────────────────────────────
+
+def bench(label, fn, number):
+    best = min(timeit.repeat(fn, number=number, repeat=5)) / number
+    print(f"  {label:<34} {best * 1000:8.3f} ms")
+    return best
+
+
+def main(count=500):
+    raw   = make_list(count)
+    dicts = json.loads(raw)["Messages"]
+    model = parse_messages(json.loads(raw)["Messages"])
+    body  = {"frames": [{"frameIndex": 0, "lines": ["EDITED", "MSG", "X"]}]}
+    n     = 20
+
+    print(f"{count} messages, {len(raw) // 1024} KB of JSON; best of 5, per pass over the list\n")
+    rows = [
+        ("parse (json.loads)",
+         lambda: json.loads(raw)["Messages"],
+         lambda: parse_messages(json.loads(raw)["Messages"])),
+        ("serialize (json.dumps)",
+         lambda: json.dumps({"messages": dicts}),
+         lambda: json.dumps({"messages": [m.to_eccb() for m in model]})),
+        ("edit one line",
+         lambda: [dict_update(m, body) for m in dicts],
+         lambda: [apply_update(m, body) for m in model]),
+        ("toggle",
+         lambda: [dict_toggle(m, False) for m in dicts],
+         lambda: [apply_toggle(m, False) for m in model]),
+    ]
+    edited_d = [dict_update(m, body) for m in dicts]
+    edited_m = [apply_update(m, body) for m in model]
+    rows.append(("diff edit against original",
+                 lambda: [diff_messages(a, b) for a, b in zip(dicts, edited_d)],
+                 lambda: [diff_messages(a, b) for a, b in zip(model, edited_m)]))
+    rows.append(("edit + diff",
+                 lambda: [diff_messages(m, dict_update(m, body)) for m in dicts],
+                 lambda: [diff_messages(m, apply_update(m, body)) for m in model]))
+
+    for label, with_dicts, with_model in rows:
+        print(label)
+        d = bench("dicts", with_dicts, n)
+        m = bench("model", with_model, n)
+        print(f"  {'':<34} {d / m:8.2f}x\n")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
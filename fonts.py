@@ -0,0 +1,374 @@
+"""
+Font metrics and text fitting for DAK Sign Controller.
+Reads the advance widths and vertical metrics of the sign's TrueType fonts
+once into small lookup tables, then finds the largest font size at which a
+frame's lines fit the face. Fonts are looked up by file name in FONT_DIR;
+copy them there from the sign's web UI. Without the file, sizes fall back
+to the fixed lines-per-frame table the app has always used.
+"""
+import logging
+import os
+import struct
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+
+log = logging.getLogger(__name__)
+
+FONT_DIR      = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts")
+LEGACY_SIZES  = {1: 39, 2: 29, 3: 23, 4: 17.5}   # lines per frame -> font size
+MIN_SIZE      = 6
+MAX_SIZE      = 64
+SIZE_STEP     = 0.5
+FIT_MEMO      = 4096
+FONT_RETRY    = 60   # seconds before looking for a missing font file again
+DESCENDERS    = frozenset("gjpqyQ,;_()[]{}|")
+
+
+class FontError(Exception):
+    """A font file that is missing or can't be parsed."""
+
+
+# ── TrueType parsing ──────────────────────────────────────────────
+
+def _tables(data):
+    if len(data) < 12 or data[:4] not in (b"\x00\x01\x00\x00", b"true"):
+        raise FontError("not a TrueType font")
+    num = struct.unpack_from(">H", data, 4)[0]
+    tables = {}
+    for i in range(num):
+        tag, _, offset, length = struct.unpack_from(">4sIII", data, 12 + 16 * i)
+        tables[tag.decode("latin-1")] = (offset, length)
+    for tag in ("head", "hhea", "hmtx", "cmap"):
+        if tag not in tables:
+            raise FontError(f"font has no {tag} table")
+    return tables
+
+
+def _cmap(data, offset):
+    """Code point -> glyph id, from the best Unicode subtable (format 12 or 4)."""
+    _, count = struct.unpack_from(">HH", data, offset)
+    subtables = {}
+    for i in range(count):
+        platform, encoding, sub = struct.unpack_from(">HHI", data, offset + 4 + 8 * i)
+        subtables[(platform, encoding)] = offset + sub
+    for key in ((3, 10), (0, 4), (0, 6), (3, 1), (0, 3), (0, 2), (0, 1), (0, 0)):
+        if key not in subtables:
+            continue
+        at  = subtables[key]
+        fmt = struct.unpack_from(">H", data, at)[0]
+        if fmt == 12:
+            return _cmap12(data, at)
+        if fmt == 4:
+            return _cmap4(data, at)
+    raise FontError("font has no Unicode cmap (format 4 or 12)")
+
+
+def _cmap4(data, at):
+    seg_count = struct.unpack_from(">H", data, at + 6)[0] // 2
+    ends      = struct.unpack_from(f">{seg_count}H", data, at + 14)
+    starts    = struct.unpack_from(f">{seg_count}H", data, at + 16 + 2 * seg_count)
+    deltas    = struct.unpack_from(f">{seg_count}h", data, at + 16 + 4 * seg_count)
+    ro_at     = at + 16 + 6 * seg_count
+    offsets   = struct.unpack_from(f">{seg_count}H", data, ro_at)
+    out = {}
+    for i in range(seg_count):
+        for cp in range(starts[i], ends[i] + 1):
+            if cp == 0xFFFF:
+                continue
+            if offsets[i] == 0:
+                glyph = (cp + deltas[i]) & 0xFFFF
+            else:
+                g_at  = ro_at + 2 * i + offsets[i] + 2 * (cp - starts[i])
+                glyph = struct.unpack_from(">H", data, g_at)[0]
+                if glyph:
+                    glyph = (glyph + deltas[i]) & 0xFFFF
+            if glyph:
+                out[cp] = glyph
+    return out
+
+
+def _cmap12(data, at):
+    groups = struct.unpack_from(">I", data, at + 12)[0]
+    out = {}
+    for i in range(groups):
+        start, end, glyph = struct.unpack_from(">III", data, at + 16 + 12 * i)
+        for cp in range(start, min(end, 0x10FFFF) + 1):
+            out[cp] = glyph + cp - start
+    return out
+
+
+class _Glyf:
+    """Glyph outlines from the loca/glyf tables, parsed on first use."""
+
+    def __init__(self, data, loca, glyf):
+        self.data  = data
+        self.loca  = loca
+        self.glyf  = glyf
+        self._memo = {}
+
+    def contours(self, gid, depth=0):
+        """Contours of glyph `gid` as lists of (x, y, on_curve), in font units."""
+        if gid in self._memo:
+            return self._memo[gid]
+        out = []
+        if gid + 1 < len(self.loca) and self.loca[gid] != self.loca[gid + 1] and depth < 8:
+            at = self.glyf + self.loca[gid]
+            n  = struct.unpack_from(">h", self.data, at)[0]
+            out = self._simple(at, n) if n >= 0 else self._compound(at, depth)
+        self._memo[gid] = out
+        return out
+
+    def _simple(self, at, n):
+        data = self.data
+        ends = struct.unpack_from(f">{n}H", data, at + 10)
+        at  += 10 + 2 * n
+        at  += 2 + struct.unpack_from(">H", data, at)[0]   # skip instructions
+        count = ends[-1] + 1 if n else 0
+        flags = []
+        while len(flags) < count:
+            flag = data[at]
+            at  += 1
+            repeat = 1
+            if flag & 8:
+                repeat += data[at]
+                at     += 1
+            flags.extend([flag] * repeat)
+        coords = []
+        for short, same in ((2, 16), (4, 32)):
+            value, values = 0, []
+            for flag in flags[:count]:
+                if flag & short:
+                    delta = data[at]
+                    at   += 1
+                    value += delta if flag & same else -delta
+                elif not flag & same:
+                    value += struct.unpack_from(">h", data, at)[0]
+                    at    += 2
+                values.append(value)
+            coords.append(values)
+        points = [(x, y, bool(f & 1)) for x, y, f in zip(coords[0], coords[1], flags)]
+        out, start = [], 0
+        for end in ends:
+            out.append(points[start:end + 1])
+            start = end + 1
+        return out
+
+    def _compound(self, at, depth):
+        data = self.data
+        at  += 10
+        out  = []
+        while True:
+            flags, gid = struct.unpack_from(">HH", data, at)
+            at += 4
+            if flags & 1:
+                dx, dy = struct.unpack_from(">hh", data, at)
+                at += 4
+            else:
+                dx, dy = struct.unpack_from(">bb", data, at)
+                at += 2
+            if not flags & 2:
+                dx = dy = 0   # point-matched placement; rare enough to ignore
+            a, b, c, d = 1.0, 0.0, 0.0, 1.0
+            if flags & 8:
+                a = d = struct.unpack_from(">h", data, at)[0] / 16384
+                at += 2
+            elif flags & 0x40:
+                a, d = (v / 16384 for v in struct.unpack_from(">hh", data, at))
+                at += 4
+            elif flags & 0x80:
+                a, b, c, d = (v / 16384 for v in struct.unpack_from(">hhhh", data, at))
+                at += 8
+            for contour in self.contours(gid, depth + 1):
+                out.append([(x * a + y * c + dx, x * b + y * d + dy, on) for x, y, on in contour])
+            if not flags & 0x20:
+                return out
+
+
+class Font:
+    """Metrics (and, for TrueType outlines, glyph shapes) for one font, in font units.
+
+    `advances` maps code point to advance width; kerning is not applied,
+    which only ever makes a fit slightly conservative.
+    """
+
+    __slots__ = ("name", "units_per_em", "cap_height", "descent", "advances", "default_advance",
+                 "glyph_ids", "_glyf")
+
+    def __init__(self, name, units_per_em, cap_height, descent, advances, default_advance,
+                 glyph_ids=None, glyf=None):
+        self.name            = name
+        self.units_per_em    = units_per_em
+        self.cap_height      = cap_height
+        self.descent         = descent
+        self.advances        = advances
+        self.default_advance = default_advance
+        self.glyph_ids       = glyph_ids or {}
+        self._glyf           = glyf
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError as e:
+            raise FontError(f"cannot read font {path}: {e}")
+        try:
+            t = _tables(data)
+            head = t["head"][0]
+            upem = struct.unpack_from(">H", data, head + 18)[0]
+            hhea = t["hhea"][0]
+            ascender, descender = struct.unpack_from(">hh", data, hhea + 4)
+            n_metrics = struct.unpack_from(">H", data, hhea + 34)[0]
+            widths = struct.unpack_from(f">{2 * n_metrics}H", data, t["hmtx"][0])[0::2]
+            cap = None
+            if "OS/2" in t:
+                os2, length = t["OS/2"]
+                version = struct.unpack_from(">H", data, os2)[0]
+                if version >= 2 and length >= 90:
+                    cap = struct.unpack_from(">h", data, os2 + 88)[0] or None
+            cmap = _cmap(data, t["cmap"][0])
+            glyf = None
+            if "loca" in t and "glyf" in t and "maxp" in t:
+                n_glyphs = struct.unpack_from(">H", data, t["maxp"][0] + 4)[0]
+                if struct.unpack_from(">h", data, head + 50)[0]:
+                    loca = struct.unpack_from(f">{n_glyphs + 1}I", data, t["loca"][0])
+                else:
+                    loca = [o * 2 for o in struct.unpack_from(f">{n_glyphs + 1}H", data, t["loca"][0])]
+                glyf = _Glyf(data, loca, t["glyf"][0])
+        except struct.error:
+            raise FontError(f"truncated or corrupt font {path}")
+        last = widths[-1] if widths else upem // 2
+        advances = {cp: widths[g] if g < len(widths) else last for cp, g in cmap.items()}
+        font = cls(os.path.basename(path), upem, cap or ascender, -descender, advances,
+                   advances.get(ord("n"), upem // 2), cmap, glyf)
+        if cap is None and font.contours("H"):
+            # Older fonts have no cap height in OS/2; measure the H instead
+            font.cap_height = max(y for contour in font.contours("H") for _, y, _ in contour)
+        return font
+
+    def line_units(self, text):
+        """(advance, count) pairs for `text`, so a width at any size is a short sum."""
+        get = self.advances.get
+        return tuple(Counter(get(ord(c), self.default_advance) for c in text).items())
+
+    @property
+    def has_outlines(self):
+        return self._glyf is not None
+
+    def contours(self, char):
+        """Outline of `char` as contours of (x, y, on_curve) points; [] if it has none."""
+        gid = self.glyph_ids.get(ord(char), 0)
+        try:
+            return self._glyf.contours(gid) if self._glyf else []
+        except (struct.error, IndexError):
+            return []
+
+
+_fonts      = {}   # file name -> Font, or the monotonic time it was found missing
+_fonts_lock = threading.Lock()
+generation  = 0    # bumped by reload_fonts(), for caches of anything drawn with them
+
+
+def get_font(name):
+    """The Font for a file name in FONT_DIR, loaded once; None if unavailable."""
+    name = os.path.basename(name or "")
+    with _fonts_lock:
+        font = _fonts.get(name)
+    if isinstance(font, Font):
+        return font
+    if font is not None and time.monotonic() - font < FONT_RETRY:
+        return None
+    try:
+        font = Font.load(os.path.join(FONT_DIR, name))
+    except FontError as e:
+        if font is None:   # first miss only; it is retried every FONT_RETRY seconds
+            log.warning("%s; font sizes fall back to LEGACY_SIZES", e)
+        font = None
+    with _fonts_lock:
+        _fonts[name] = font if font is not None else time.monotonic()
+    return font
+
+
+def available(name):
+    """True if `name` is in FONT_DIR and readable, so fit() measures rather than guesses."""
+    return get_font(name) is not None
+
+
+def reload_fonts():
+    """Forget loaded fonts and fits, e.g. after replacing a font in FONT_DIR."""
+    global generation
+    with _fonts_lock:
+        _fonts.clear()
+        generation += 1
+    _fit.cache_clear()
+
+
+# ── Fitting ───────────────────────────────────────────────────────
+
+def _px(units, size, upem):
+    """Pixel width of `units` font units at `size`, snapped like the sign draws glyphs."""
+    return sum(count * round(adv * size / upem) for adv, count in units)
+
+
+def line_metrics(font, text, size):
+    """(width, cap height, descent) of one line in pixels, laid out as fit() does.
+
+    Descent is 0 unless the text has characters that reach below the baseline.
+    """
+    upem = font.units_per_em
+    deep = any(c in DESCENDERS for c in text)
+    return (_px(font.line_units(text), size, upem), round(font.cap_height * size / upem),
+            round(font.descent * size / upem) if deep else 0)
+
+
+def _measure(font, lines, size, spacing):
+    upem   = font.units_per_em
+    widths = [_px(units, size, upem) for units, _ in lines]
+    cap    = round(font.cap_height * size / upem)
+    desc   = round(font.descent * size / upem)
+    height = sum(cap + (desc if deep else 0) for _, deep in lines) + spacing * (len(lines) - 1)
+    return widths, height
+
+
+def fit(texts, font_name, width, height, spacing=0):
+    """Largest font size at which `texts`, one per line, fit a width x height box.
+
+    Returns {"fontSize", "fits", "widths", "height", "approximate"}; widths
+    and height are in pixels at that size. "approximate" means the font file
+    isn't available and the size comes from LEGACY_SIZES.
+    """
+    font = get_font(font_name)
+    if not texts:
+        return {"fontSize": None, "fits": True, "widths": [], "height": 0,
+                "approximate": font is None}
+    if font is None:
+        return {"fontSize": LEGACY_SIZES.get(len(texts), LEGACY_SIZES[4]),
+                "fits": None, "widths": None, "height": None, "approximate": True}
+    return dict(_fit(tuple(texts), font, width, height, spacing))
+
+
+@lru_cache(maxsize=FIT_MEMO)
+def _fit(texts, font, width, height, spacing):
+    lines = [(font.line_units(t), any(c in DESCENDERS for c in t)) for t in texts]
+
+    def fits(size):
+        widths, h = _measure(font, lines, size, spacing)
+        return h <= height and all(w <= width for w in widths)
+
+    # Sizes are MIN_SIZE + k * SIZE_STEP; find the largest k that fits.
+    lo, hi = 0, int((MAX_SIZE - MIN_SIZE) / SIZE_STEP)
+    if not fits(MIN_SIZE):
+        hi = 0
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if fits(MIN_SIZE + mid * SIZE_STEP):
+            lo = mid
+        else:
+            hi = mid - 1
+    size = MIN_SIZE + lo * SIZE_STEP
+    widths, h = _measure(font, lines, size, spacing)
+    return {"fontSize": int(size) if size == int(size) else size,
+            "fits": h <= height and all(w <= width for w in widths),
+            "widths": tuple(widths), "height": h, "approximate": False}
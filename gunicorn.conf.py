@@ -0,0 +1,19 @@
+"""
+gunicorn settings for running DAK Sign Controller as several worker processes
+(gunicorn is in requirements.txt):
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Workers share sign settings, users, the sign login and polled sign status
+through state/shared.db (see shared.py); one worker polls each sign. Each
+keeps its own message cache; writes from any worker invalidate the others'.
+"""
+import os
+
+bind         = os.environ.get("DAK_BIND", "0.0.0.0:5000")
+workers      = int(os.environ.get("DAK_WORKERS", "4"))
+worker_class = "gthread"   # threaded workers: /api/stream holds a thread per open dashboard
+threads      = 16
+timeout      = 120         # a cold login plus a slow getmessagelist.php
+preload_app  = False       # sign clients and their threads must start in each worker
+raw_env      = ["DAK_SHARED_STATE=1"]
@@ -0,0 +1,358 @@
+"""
+Telemetry history for DAK Sign Controller.
+A sampler per sign records numeric fields of the polled status and dimming
+endpoints, one fixed-size file per field. Each file holds three ring buffers
+(raw, 1 minute, 1 hour) and every sample is folded into all three as it
+arrives, so there is no separate downsampling pass. A slot's place in its
+ring follows from its start time, so a range query reads only the slots it
+covers, and the files never grow.
+"""
+import logging
+import math
+import os
+import re
+import struct
+import threading
+import time
+from datetime import datetime
+from urllib.parse import quote, unquote
+
+import shared
+
+log = logging.getLogger(__name__)
+
+HISTORY_INTERVAL = 10    # seconds between samples (the status poll interval)
+MAX_FIELDS       = 32    # fields recorded per sign when they are discovered
+MAX_POINTS       = 2000  # per query; a finer step is coarsened to fit
+HISTORY_LEASE    = 60    # seconds; one worker process samples each sign
+SAMPLED          = ("status", "dimming")   # endpoints fields are discovered in
+
+# (name, step in seconds, slots): a day of raw samples, a week of minutes, a year of hours
+TIERS = (("raw", 10, 8640), ("1m", 60, 10080), ("1h", 3600, 8760))
+
+_RECORD = struct.Struct("<IIfff")   # slot start, count, min, max, sum
+_MAGIC  = b"DAKH"
+_EXT    = ".ring"
+
+
+class HistoryError(Exception):
+    """A history query that can't be answered."""
+
+
+def _header(tiers):
+    return struct.pack("<4sHH", _MAGIC, 1, len(tiers)) + b"".join(
+        struct.pack("<II", step, slots) for _, step, slots in tiers)
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return float(value)
+    if isinstance(value, (int, float)):
+        return float(value) if math.isfinite(value) else None
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            return None
+        return value if math.isfinite(value) else None
+    return None
+
+
+def _extract(data, path):
+    """The number at a dotted path ("Sensors.0.Value") in a JSON value, or None."""
+    for part in path.split(".") if path else ():
+        if isinstance(data, dict):
+            data = data.get(part)
+        elif isinstance(data, list) and part.isdigit() and int(part) < len(data):
+            data = data[int(part)]
+        else:
+            return None
+    return _number(data)
+
+
+def numeric_paths(data, prefix=""):
+    """Dotted paths of every numeric (or boolean) leaf in a JSON value."""
+    if isinstance(data, dict):
+        items = data.items()
+    elif isinstance(data, list):
+        items = ((str(i), v) for i, v in enumerate(data))
+    else:
+        if _number(data) is not None and not isinstance(data, str):
+            yield prefix
+        return
+    for key, value in items:
+        yield from numeric_paths(value, f"{prefix}.{key}" if prefix else str(key))
+
+
+_DURATION = re.compile(r"^-(\d+(?:\.\d+)?)([smhd])$")
+_UNITS    = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_time(value, now):
+    """Epoch seconds, ISO 8601, or a relative "-6h" / "-30m" / "-7d"."""
+    m = _DURATION.match(value)
+    if m:
+        t = now - float(m.group(1)) * _UNITS[m.group(2)]
+    else:
+        try:
+            t = float(value)
+        except ValueError:
+            try:
+                t = datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+            except ValueError:
+                raise HistoryError(f"can't read time {value!r}") from None
+    if not math.isfinite(t):   # "nan", "inf", "-1e309d"
+        raise HistoryError(f"time {value!r} is out of range")
+    return t
+
+
+# ── Storage ───────────────────────────────────────────────────────
+
+class Series:
+    """One field's ring buffers, in one file."""
+
+    def __init__(self, path, tiers=TIERS):
+        self.path     = path
+        self.tiers    = tiers
+        self._lock    = threading.Lock()
+        header        = _header(tiers)
+        self._offsets = []
+        offset = len(header)
+        for _, _, slots in tiers:
+            self._offsets.append(offset)
+            offset += slots * _RECORD.size
+        self.size = offset
+        fresh = not os.path.exists(path)
+        self._f = open(path, "w+b" if fresh else "r+b", buffering=0)
+        if fresh or self._f.read(len(header)) != header:
+            if not fresh:
+                log.warning("history file %s has another layout; starting it afresh", path)
+            self._f.truncate(0)
+            self._f.truncate(self.size)   # sparse where the filesystem allows
+            self._f.seek(0)
+            self._f.write(header)
+
+    def _slot(self, tier, start):
+        _, step, slots = self.tiers[tier]
+        return self._offsets[tier] + (start // step % slots) * _RECORD.size
+
+    def add(self, t, value):
+        """Fold one sample into the slot covering `t` in every tier."""
+        with self._lock:
+            for tier, (_, step, _) in enumerate(self.tiers):
+                start = int(t) // step * step
+                pos   = self._slot(tier, start)
+                self._f.seek(pos)
+                have, n, lo, hi, total = _RECORD.unpack(self._f.read(_RECORD.size))
+                if have != start or n == 0:
+                    record = (start, 1, value, value, value)
+                else:
+                    record = (start, n + 1, min(lo, value), max(hi, value), total + value)
+                self._f.seek(pos)
+                self._f.write(_RECORD.pack(*record))
+
+    def read(self, tier, t0, t1):
+        """Filled slots of one tier from t0 to t1: [(start, count, min, max, sum)].
+        Reads at most two runs of the file, however long the ring."""
+        _, step, slots = self.tiers[tier]
+        first, last = int(t0) // step, int(t1) // step
+        first = max(first, last - slots + 1)
+        out = []
+        with self._lock:
+            i = first
+            while i <= last:
+                idx = i % slots
+                n   = min(last - i + 1, slots - idx)
+                self._f.seek(self._offsets[tier] + idx * _RECORD.size)
+                raw = self._f.read(n * _RECORD.size)
+                for k, record in enumerate(_RECORD.iter_unpack(raw)):
+                    if record[1] and record[0] == (i + k) * step:
+                        out.append(record)
+                i += n
+        return out
+
+    def close(self):
+        with self._lock:
+            self._f.close()
+
+
+# ── Sampler and queries ───────────────────────────────────────────
+
+class History:
+    """Samples one sign's StatusPoller into a Series per field under `root`.
+
+    `fields` maps names to "endpoint:dotted.path" (e.g. "status:Temperature");
+    None records every numeric field found in SAMPLED, up to MAX_FIELDS."""
+
+    def __init__(self, poller, root, fields=None, interval=HISTORY_INTERVAL):
+        self.poller   = poller
+        self.root     = root
+        self.interval = interval
+        self.samples  = 0
+        self.errors   = 0
+        self._fixed   = fields is not None   # True: no more fields are discovered
+        self._fields  = {n: tuple(p.split(":", 1)) for n, p in (fields or {}).items()}
+        self._series  = {}
+        self._seen    = {}                   # endpoint -> "updated" of the last sample
+        self._lock    = threading.Lock()
+        self._stop    = threading.Event()
+        self._thread  = None
+        os.makedirs(root, exist_ok=True)
+        # Fields recorded before a restart stay queryable and keep recording
+        self._scan()
+
+    @property
+    def name(self):
+        return self.poller.client.name
+
+    def _scan(self):
+        """Add the fields that have a file under `root`. Only the worker
+        holding the history lease discovers fields, so the others learn of
+        them here rather than from their own samples."""
+        if self._fixed:
+            return
+        header = _header(TIERS)
+        for entry in sorted(os.listdir(self.root)):
+            name = unquote(entry[:-len(_EXT)]) if entry.endswith(_EXT) else ""
+            with self._lock:
+                if ":" not in name or name in self._fields or len(self._fields) >= MAX_FIELDS:
+                    continue
+            try:
+                with open(os.path.join(self.root, entry), "rb") as f:
+                    ready = f.read(len(header)) == header   # not still being created
+            except OSError:
+                continue
+            if ready:
+                with self._lock:
+                    self._fields.setdefault(name, tuple(name.split(":", 1)))
+
+    def fields(self):
+        self._scan()
+        with self._lock:
+            return sorted(self._fields)
+
+    def _get_series(self, name):
+        with self._lock:
+            series = self._series.get(name)
+            if series is None:
+                path   = os.path.join(self.root, quote(name, safe="") + _EXT)
+                series = self._series[name] = Series(path)
+            return series
+
+    def _discover(self, endpoint, data):
+        if self._fixed:
+            return
+        with self._lock:
+            for path in numeric_paths(data):
+                name = f"{endpoint}:{path}"
+                if name in self._fields:
+                    continue
+                if len(self._fields) >= MAX_FIELDS:
+                    log.warning("[%s] history is full (%d fields); not recording %s",
+                                self.name, MAX_FIELDS, name)
+                    self._fixed = True   # stop looking
+                    return
+                self._fields[name] = (endpoint, path)
+
+    def sample(self):
+        """Record each field from the poller's latest data, if it is new."""
+        endpoints = SAMPLED if not self._fixed else sorted({e for e, _ in self._fields.values()})
+        for endpoint in endpoints:
+            entry = self.poller.latest(endpoint)
+            if entry is None or entry["status"] != 200 or entry["updated"] == self._seen.get(endpoint):
+                continue
+            self._seen[endpoint] = entry["updated"]
+            self._discover(endpoint, entry["data"])
+            with self._lock:
+                fields = [(n, p) for n, (e, p) in self._fields.items() if e == endpoint]
+            for name, path in fields:
+                value = _extract(entry["data"], path)
+                if value is not None:
+                    self._get_series(name).add(entry["updated"], value)
+        self.samples += 1
+
+    def query(self, field, t0, t1, step=None):
+        """Points [time, mean, min, max] for one field, bucketed by `step` seconds
+        (chosen from the range if None), from the coarsest tier that fits."""
+        if field not in self.fields():
+            raise HistoryError(f"no history for {field!r}")
+        if not all(math.isfinite(v) for v in (t0, t1, t1 - t0, step or 0)) or (step or 0) < 0:
+            raise HistoryError("times and step must be finite, and step not negative")
+        if t1 <= t0:
+            raise HistoryError("'from' must be before 'to'")
+        step = max(step or 0, (t1 - t0) / MAX_POINTS)
+        now  = time.time()
+        covering = [i for i, (_, s, slots) in enumerate(TIERS) if now - s * slots <= t0]
+        fitting  = [i for i in covering if TIERS[i][1] <= step]
+        tier     = (fitting[-1] if fitting else covering[0]) if covering else len(TIERS) - 1
+        tname, tstep, _ = TIERS[tier]
+        step = max(tstep, math.ceil(step / tstep) * tstep)
+
+        buckets = {}
+        for start, n, lo, hi, total in self._get_series(field).read(tier, t0, t1):
+            key = start // step * step
+            b   = buckets.get(key)
+            buckets[key] = [n, lo, hi, total] if b is None else \
+                [b[0] + n, min(b[1], lo), max(b[2], hi), b[3] + total]
+        return {"sign": self.name, "field": field, "from": t0, "to": t1,
+                "step": step, "tier": tname,
+                "points": [[t, round(total / n, 3), round(lo, 3), round(hi, 3)]
+                           for t, (n, lo, hi, total) in sorted(buckets.items())]}
+
+    def describe(self):
+        with self._lock:
+            files = len(self._series)
+        return {"sign": self.name, "fields": self.fields(), "interval": self.interval,
+                "samples": self.samples, "errors": self.errors,
+                "tiers": [{"name": n, "step": s, "span": s * slots} for n, s, slots in TIERS],
+                "bytes_per_field": len(_header(TIERS)) + sum(n for *_, n in TIERS) * _RECORD.size,
+                "open_files": files}
+
+    # ── Thread ────────────────────────────────────────────────────
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"history-{self.name}",
+                                            daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            # Under several workers one samples each sign, holding the lease
+            # for as long as it keeps sampling
+            if not shared.active or shared.try_lease(f"history:{self.name}", HISTORY_LEASE):
+                try:
+                    self.sample()
+                except Exception as e:
+                    self.errors += 1
+                    log.debug("[%s] history sample failed: %s", self.name, e)
+            self._stop.wait(self.interval)
+        with self._lock:
+            for series in self._series.values():
+                series.close()
+            self._series.clear()
+
+
+# ── Registry ──────────────────────────────────────────────────────
+
+_histories = {}   # sign name -> History
+
+
+def add_history(history):
+    _histories[history.name] = history
+    history.start()
+    return history
+
+
+def remove_history(name):
+    history = _histories.pop(name, None)
+    if history is not None:
+        history.stop()
+    return history
+
+
+def get_history(name):
+    return _histories.get(name)
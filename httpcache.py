@@ -0,0 +1,100 @@
+"""
+HTTP caching and compression for DAK Sign Controller's JSON API.
+Snapshots of upstream data (the cached message list, the poller's status
+entries) are serialized, hashed and compressed once, then served with a weak
+ETag so a browser that already has them gets a 304 without the sign being
+touched. Other large responses are gzip/deflate-compressed on the way out.
+"""
+import gzip
+import hashlib
+import json
+import threading
+import zlib
+from collections import OrderedDict
+
+from flask import Response, request
+
+COMPRESS_MIN_SIZE = 1024   # bytes; smaller bodies aren't worth compressing
+SNAPSHOT_MEMO     = 64     # serialized snapshots kept in memory
+
+_ENCODERS = {
+    "gzip":    lambda data: gzip.compress(data, compresslevel=6),
+    "deflate": lambda data: zlib.compress(data, 6),
+}
+
+
+class JSONSnapshot:
+    """A payload serialized once, with its content-hash ETag and compressed forms."""
+
+    def __init__(self, payload):
+        self.body     = json.dumps(payload, separators=(",", ":")).encode()
+        self.etag     = hashlib.blake2b(self.body, digest_size=12).hexdigest()
+        self._encoded = {}
+
+    def encoded(self, encoding):
+        if encoding not in self._encoded:
+            self._encoded[encoding] = _ENCODERS[encoding](self.body)
+        return self._encoded[encoding]
+
+
+# Upstream snapshots are immutable and replaced wholesale when they change, so
+# the identity of the object is its version. The memo holds a reference to
+# each object so its id() can't be reused while the entry is alive.
+_memo      = OrderedDict()   # (id(obj), extra) -> (obj, JSONSnapshot)
+_memo_lock = threading.Lock()
+
+
+def snapshot_for(obj, payload_fn, extra=None):
+    """The JSONSnapshot for upstream object `obj`, building it on first use."""
+    key = (id(obj), extra)
+    with _memo_lock:
+        hit = _memo.get(key)
+        if hit is not None and hit[0] is obj:
+            _memo.move_to_end(key)
+            return hit[1]
+    snap = JSONSnapshot(payload_fn())
+    with _memo_lock:
+        _memo[key] = (obj, snap)
+        while len(_memo) > SNAPSHOT_MEMO:
+            _memo.popitem(last=False)
+    return snap
+
+
+def _pick_encoding(size):
+    if size < COMPRESS_MIN_SIZE:
+        return None
+    return request.accept_encodings.best_match(list(_ENCODERS))
+
+
+def snapshot_response(snap, status=200):
+    """Serve a JSONSnapshot, answering 304 if the client's copy is current."""
+    encoding = _pick_encoding(len(snap.body))
+    resp = Response(snap.encoded(encoding) if encoding else snap.body,
+                    status=status, mimetype="application/json")
+    if encoding:
+        resp.headers["Content-Encoding"] = encoding
+    resp.vary.add("Accept-Encoding")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.set_etag(snap.etag, weak=True)
+    if status == 200:
+        resp.make_conditional(request)
+    return resp
+
+
+def init_compression(app):
+    @app.after_request
+    def compress_response(resp):
+        if (resp.direct_passthrough or resp.is_streamed
+                or "Content-Encoding" in resp.headers
+                or not 200 <= resp.status_code < 300 or resp.status_code == 204
+                or not (resp.mimetype == "application/json"
+                        or resp.mimetype.startswith("text/"))
+                or resp.mimetype == "text/event-stream"):
+            return resp
+        data     = resp.get_data()
+        encoding = _pick_encoding(len(data))
+        if encoding:
+            resp.set_data(_ENCODERS[encoding](data))
+            resp.headers["Content-Encoding"] = encoding
+            resp.vary.add("Accept-Encoding")
+        return resp
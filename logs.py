@@ -0,0 +1,167 @@
+"""
+Logging for DAK Sign Controller.
+Sets up one handler for the whole app, plain text or one JSON object per
+line. Records go through a queue to a background thread, so a slow
+stdout/journald never holds up a request. Full message payloads are only
+serialized when capture is switched on for that message name, and even then
+only a few times a minute.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+
+LOG_LEVEL      = os.environ.get("DAK_LOG_LEVEL", "INFO")
+LOG_FORMAT     = os.environ.get("DAK_LOG_FORMAT", "text")   # "text" or "json"
+LOG_ASYNC      = True
+PAYLOAD_RATE   = 5    # payload dumps per message name per PAYLOAD_WINDOW
+PAYLOAD_WINDOW = 60   # seconds
+
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def _fields(record):
+    """Anything passed to a log call with extra={...}."""
+    return {k: v for k, v in vars(record).items() if k not in _RESERVED}
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+
+    def format(self, record):
+        line   = super().format(record)
+        fields = _fields(record)
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return line
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {"ts": round(record.created, 3), "level": record.levelname,
+                 "logger": record.name, "msg": record.getMessage(), **_fields(record)}
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue records unformatted, so %-args are rendered on the listener thread.
+
+    Safe here because what we log is immutable by convention (message objects
+    are copy-on-write, see messages.py). Records with a traceback are
+    formatted up front as usual.
+    """
+
+    def prepare(self, record):
+        if record.exc_info:
+            return super().prepare(record)
+        return record
+
+
+_listener = None
+
+
+def init_logging(level=LOG_LEVEL, fmt=LOG_FORMAT, use_queue=LOG_ASYNC):
+    """Configure the root logger. Call once, before anything logs."""
+    global _listener
+    root = logging.getLogger()
+    if _listener is not None or root.handlers:
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(JSONFormatter() if fmt == "json" else TextFormatter())
+    if use_queue:
+        q = queue.SimpleQueue()
+        _listener = logging.handlers.QueueListener(q, handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+        handler = _DeferredQueueHandler(q)
+    root.addHandler(handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+
+
+def set_level(level):
+    logging.getLogger().setLevel(level.upper())
+
+
+def get_level():
+    return logging.getLevelName(logging.getLogger().level)
+
+
+# ── Payload capture ───────────────────────────────────────────────
+
+class _Pretty:
+    """Serializes its object only if the log record is actually written."""
+
+    __slots__ = ("obj",)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __str__(self):
+        return json.dumps(self.obj.to_eccb(), indent=2)
+
+
+class PayloadCapture:
+    """Debug dumps of messages (model.Message), off unless enabled for a name.
+
+    Enable with enable(names=[...]) or enable(all=True); `sample` is the
+    fraction of matching payloads considered, and each name is further
+    limited to PAYLOAD_RATE dumps per PAYLOAD_WINDOW seconds.
+    """
+
+    def __init__(self, logger_name="payloads"):
+        self.log     = logging.getLogger(logger_name)
+        self.log.setLevel(logging.DEBUG)
+        self._lock   = threading.Lock()
+        self._names  = frozenset()
+        self._all    = False
+        self._sample = 1.0
+        self._recent = {}   # name -> dump times in the current window
+
+    @property
+    def active(self):
+        return self._all or bool(self._names)
+
+    def enable(self, names=(), all=False, sample=1.0):
+        if isinstance(names, str):
+            names = [names]
+        with self._lock:
+            self._names  = frozenset(names)
+            self._all    = bool(all)
+            self._sample = min(max(float(sample), 0.0), 1.0)
+            self._recent.clear()
+
+    def disable(self):
+        self.enable()
+
+    def describe(self):
+        return {"names": sorted(self._names), "all": self._all, "sample": self._sample}
+
+    def dump(self, event, sign, msg):
+        """Log `msg` pretty-printed, if capture is on for its name."""
+        if not self.active:
+            return
+        name = msg.name
+        if not (self._all or name in self._names):
+            return
+        if self._sample < 1.0 and random.random() >= self._sample:
+            return
+        now = time.monotonic()
+        with self._lock:
+            recent = [t for t in self._recent.get(name, ()) if now - t < PAYLOAD_WINDOW]
+            if len(recent) >= PAYLOAD_RATE:
+                self._recent[name] = recent
+                return
+            recent.append(now)
+            self._recent[name] = recent
+        self.log.debug("[%s] %s %r: %s", sign, event, name, _Pretty(msg))
+
+
+payloads = PayloadCapture()
@@ -0,0 +1,274 @@
+"""
+Message editing for DAK Sign Controller.
+Pure functions that build and edit messages (model.Message) without talking
+to the sign, shared by the single-message routes and the batch endpoint.
+
+Edits are copy-on-write: the message returned shares every untouched frame,
+line and schedule with its input, so cached lists are never mutated and
+diff_messages() can skip shared subtrees by identity. Request bodies are
+validated here, at the edge, before anything reaches the sign.
+"""
+from fonts import fit
+from model import (Message, Frame, Line, Schedule, Record, InvalidMessage, MISSING,
+                   DEFAULT_FONT, DEFAULT_HOLD, ALL_DAYS, SIGN_WIDTH, SIGN_HEIGHT)
+
+
+class MessageError(Exception):
+    """A request that cannot be applied; status is the HTTP code to answer with."""
+
+    def __init__(self, error, status=400):
+        super().__init__(error)
+        self.status = status
+
+
+def build_message(body):
+    """Build a Message from a create request body.
+
+    Returns (msg, None) or (None, error string).
+    """
+    if not isinstance(body, dict):
+        return None, "expected a JSON object"
+    name       = body.get("name", "")
+    frames_in  = body.get("frames", [])  # New multi-frame structure
+    hold       = body.get("holdTime", DEFAULT_HOLD)
+    sched_in   = body.get("schedule", {})
+
+    if not isinstance(name, str) or not name.strip():
+        return None, "name is required"
+    name = name.strip()
+    if not isinstance(frames_in, list) or not all(isinstance(f, dict) for f in frames_in):
+        return None, "frames must be a list of objects"
+    if not isinstance(sched_in, dict):
+        return None, "schedule must be an object"
+
+    # Support both old format (text + extraLines) and new format (frames array)
+    if not frames_in and body.get("text"):
+        # Old format: single frame
+        text  = body.get("text")
+        extra = body.get("extraLines", [])
+        if not isinstance(text, str) or not isinstance(extra, list):
+            return None, "text must be a string and extraLines a list"
+        all_lines = [text.strip()] + [l for l in extra if isinstance(l, str)]
+        all_lines = [l for l in all_lines if l.strip()]
+        frames_in = [{"lines": all_lines}] if all_lines else []
+
+    if not frames_in:
+        return None, "at least one frame with text is required"
+
+    # Build frames, each at the largest font size its text fits
+    frames = []
+    for frame_data in frames_in:
+        lines = frame_data.get("lines", [])
+        if not isinstance(lines, list):
+            return None, "frame lines must be a list"
+        lines = [l for l in lines if isinstance(l, str) and l.strip()]
+        if not lines:
+            continue
+        font_size = fit(lines, DEFAULT_FONT, SIGN_WIDTH, SIGN_HEIGHT)["fontSize"]
+        frames.append(Frame([Line(l, DEFAULT_FONT, font_size) for l in lines], hold))
+
+    if not frames:
+        return None, "no valid frames with text"
+
+    enabled = body.get("enabled", True)
+    msg = Message(name, frames, Schedule(
+        enabled    = enabled,
+        start_time = sched_in.get("StartTime", "PT0H0M0S"),
+        end_time   = sched_in.get("EndTime",   "PT0H0M0S"),
+        dow        = sched_in.get("Dow", ALL_DAYS) if enabled else 0,
+        is_all_day = sched_in.get("IsAllDay", True),
+    ))
+    try:
+        msg.validate()
+    except InvalidMessage as e:
+        return None, str(e)
+    return msg, None
+
+
+def apply_update(current, body):
+    """Return `current` with an update request's edits applied.
+
+    Raises MessageError if the edits leave the message invalid.
+    """
+    msg = current
+
+    # Apply frame text edits — supports line count changes from template picker
+    frame_updates = body.get("frames") or []
+    if not isinstance(frame_updates, list) or not all(isinstance(f, dict) for f in frame_updates):
+        raise MessageError("frames must be a list of objects")
+    try:
+        if frame_updates:
+            frames = list(current.frames or ())   # MISSING: nothing to edit
+            for fu in frame_updates:
+                fi = fu.get("frameIndex", 0)
+                if isinstance(fi, bool) or not isinstance(fi, int) or fi < 0:
+                    raise MessageError(f"invalid frameIndex {fi!r}")
+                new_lines = fu.get("lines", [])
+                if not isinstance(new_lines, list):
+                    raise MessageError("frame lines must be a list")
+                if fi < len(frames):
+                    frame     = frames[fi]
+                    lines     = frame.lines or ()
+                    font      = (lines[0].font or DEFAULT_FONT) if lines else DEFAULT_FONT
+                    font_size = (lines[0].font_size or 17.5) if lines else 17.5
+                    if len(new_lines) != len(lines):
+                        # Line count changed — rebuild lines
+                        lines = tuple(Line(t, font, font_size) for t in new_lines)
+                    else:
+                        lines = tuple(l if l.text == t else l.replace(text=t)
+                                      for l, t in zip(lines, new_lines))
+                    for line in lines:
+                        line.validate()
+                    frames[fi] = frame.replace(lines=lines)
+            if current.frames is not MISSING:
+                msg = msg.replace(frames=tuple(frames))
+
+        # Apply schedule changes
+        if body.get("schedule") is not None:
+            if not isinstance(body["schedule"], dict):
+                raise MessageError("schedule must be an object")
+            sched = current.schedule.to_eccb() if current.schedule is not MISSING else {}
+            schedule = Schedule.from_eccb({**sched, **body["schedule"]})
+            schedule.validate()
+            msg = msg.replace(schedule=schedule)
+    except InvalidMessage as e:
+        raise MessageError(str(e))
+
+    # Rename if requested
+    new_name = body.get("newName") or ""
+    if not isinstance(new_name, str):
+        raise MessageError("newName must be a string")
+    new_name = new_name.strip()
+    if new_name and new_name != current.name:
+        msg = msg.replace(name=new_name)
+    return msg
+
+
+def apply_toggle(current, enabled):
+    """Return `current` enabled or disabled."""
+    sched = current.schedule or Schedule()
+    dow   = sched.dow
+    # When enabling, restore Dow to all days if it was 0 (disabled state)
+    if enabled and dow == 0:
+        dow = ALL_DAYS
+    # When disabling, set Dow to 0
+    elif not enabled:
+        dow = 0
+    return current.replace(schedule=sched.replace(enabled=enabled, dow=dow))
+
+
+# ── Diffing ───────────────────────────────────────────────────────
+
+def diff_messages(old, new, path=()):
+    """Paths at which two messages differ, as tuples of ECCB keys/indices.
+
+    An empty list means the sign already has what was asked for. Lists of
+    different lengths, and keys present on one side only, are reported as a
+    single path rather than element by element.
+    """
+    if old is new:
+        return []
+    if isinstance(old, Record) and type(old) is type(new):
+        out = []
+        for attr, key in old.FIELDS:
+            a, b = getattr(old, attr), getattr(new, attr)
+            if a is MISSING or b is MISSING:
+                if a is not b:
+                    out.append(path + (key,))
+            else:
+                out.extend(diff_messages(a, b, path + (key,)))
+        out.extend(diff_messages(old.extra, new.extra, path))
+        return out
+    if isinstance(old, dict) and isinstance(new, dict):
+        out = []
+        for key in sorted(old.keys() | new.keys(), key=str):
+            if key not in old or key not in new:
+                out.append(path + (key,))
+            else:
+                out.extend(diff_messages(old[key], new[key], path + (key,)))
+        return out
+    if (isinstance(old, (list, tuple)) and isinstance(new, (list, tuple))
+            and len(old) == len(new)):
+        out = []
+        for i, (a, b) in enumerate(zip(old, new)):
+            out.extend(diff_messages(a, b, path + (i,)))
+        return out
+    return [] if old == new else [path]
+
+
+def format_path(path):
+    """('Frames', 0, 'Lines', 1, 'Text') -> 'Frames[0].Lines[1].Text'"""
+    out = ""
+    for key in path:
+        out += f"[{key}]" if isinstance(key, int) else f".{key}" if out else key
+    return out
+
+
+# ── Batches ───────────────────────────────────────────────────────
+
+def _apply_op(state, op):
+    """Apply one batch operation to `state` (name -> Message) in place.
+
+    Returns the message names the operation touched.
+    """
+    if not isinstance(op, dict):
+        raise MessageError("each operation must be an object")
+    kind = op.get("op")
+    if kind == "create":
+        msg, error = build_message(op)
+        if error:
+            raise MessageError(error)
+        state[msg.name] = msg
+        return {msg.name}
+
+    name = op.get("name") or op.get("Name")
+    if not name:
+        raise MessageError("name required")
+    if not isinstance(name, str):
+        raise MessageError("name must be a string")
+    current = state.get(name)
+    if current is None:
+        raise MessageError(f"Message '{name}' not found", 404)
+
+    if kind == "update":
+        msg = apply_update(current, op)
+        del state[name]
+        state[msg.name] = msg
+        return {name, msg.name}
+    if kind == "toggle":
+        if op.get("enabled") is None:
+            raise MessageError("enabled required")
+        state[name] = apply_toggle(current, op["enabled"])
+        return {name}
+    if kind == "delete":
+        del state[name]
+        return {name}
+    raise MessageError(f"unknown op '{kind}'")
+
+
+def plan_batch(snapshot, operations):
+    """Resolve a list of operations against one snapshot of the message list.
+
+    Operations are applied in order to an in-memory copy, then collapsed to
+    the net difference from the snapshot, so a toggle followed by an update of
+    the same message is one save and a create followed by a delete is nothing.
+
+    Returns (deletes, saves, results): names that no longer exist afterwards,
+    Messages that are new or changed, and one result dict per
+    operation with the "names" it touched or its "error"/"status".
+    """
+    before  = {m.name: m for m in snapshot}
+    state   = dict(before)
+    results = []
+    for i, op in enumerate(operations):
+        result = {"index": i, "op": op.get("op") if isinstance(op, dict) else None}
+        try:
+            result["names"] = sorted(_apply_op(state, op))
+        except MessageError as e:
+            result.update(ok=False, error=str(e), status=e.status)
+        results.append(result)
+
+    deletes = [n for n in before if n not in state]
+    saves   = [m for n, m in state.items()
+               if n not in before or diff_messages(before[n], m)]
+    return deletes, saves, results
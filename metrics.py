@@ -0,0 +1,187 @@
+"""
+Instrumentation for DAK Sign Controller.
+Counters and histograms for our Flask routes, every ECCB request, logins,
+session-lock waits and cache hits, rendered in the Prometheus text format at
+/metrics. A request sent with `X-Timing: 1` (or ?timing=1) gets a
+Server-Timing header breaking its time down into app, lock and sign.
+"""
+import contextvars
+import threading
+import time
+
+from flask import g, request
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTES_BUCKETS   = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+MAX_SERIES      = 200   # per metric; further label sets are folded into "other"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs):
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name   = name
+        self.help   = help
+        self.labels = tuple(labels)
+        self._lock  = threading.Lock()
+        self._series = {}
+        _registry.append(self)
+
+    def _key(self, labels):
+        key = tuple(str(labels.get(l, "")) for l in self.labels)
+        if key not in self._series and len(self._series) >= MAX_SERIES:
+            key = tuple("other" for _ in self.labels)
+        return key
+
+    def values(self):
+        """{label values tuple: value} for every series, e.g. to diff two snapshots."""
+        with self._lock:
+            return {k: list(v) if isinstance(v, list) else v for k, v in self._series.items()}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            series = sorted(self._series.items())
+        for key, value in series:
+            lines.extend(self._render_series(list(zip(self.labels, key)), value))
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        with self._lock:
+            key = self._key(labels)
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def _render_series(self, pairs, value):
+        return [f"{self.name}{_labels(pairs)} {value}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        with self._lock:
+            key = self._key(labels)
+            counts = self._series.get(key)
+            if counts is None:
+                counts = self._series[key] = [0] * len(self.buckets) + [0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    def _render_series(self, pairs, counts):
+        lines = [f"{self.name}_bucket{_labels(pairs + [('le', b)])} {counts[i]}"
+                 for i, b in enumerate(self.buckets)]
+        lines.append(f"{self.name}_bucket{_labels(pairs + [('le', '+Inf')])} {counts[-2]}")
+        lines.append(f"{self.name}_sum{_labels(pairs)} {counts[-1]:.6f}")
+        lines.append(f"{self.name}_count{_labels(pairs)} {counts[-2]}")
+        return lines
+
+
+_registry   = []
+_collectors = []   # callables returning extra exposition lines at scrape time
+
+
+def add_collector(fn):
+    _collectors.append(fn)
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for fn in _collectors:
+        lines.extend(fn())
+    return "\n".join(lines) + "\n"
+
+
+# ── Metrics ───────────────────────────────────────────────────────
+
+http_latency   = Histogram("dak_http_request_duration_seconds",
+                           "Time spent handling a request, by Flask endpoint.", ["endpoint"])
+http_requests  = Counter("dak_http_requests_total",
+                         "Requests handled, by Flask endpoint and status.", ["endpoint", "status"])
+sign_latency   = Histogram("dak_sign_request_duration_seconds",
+                           "Round trip of one ECCB request.", ["sign", "path"])
+sign_requests  = Counter("dak_sign_requests_total",
+                         "ECCB requests, by path and status (or 'error').", ["sign", "path", "status"])
+sign_bytes     = Histogram("dak_sign_response_bytes",
+                           "ECCB response body size.", ["sign", "path"], buckets=BYTES_BUCKETS)
+sign_retries   = Counter("dak_sign_retries_total",
+                         "ECCB requests sent again, by reason (timeout/error/status).",
+                         ["sign", "path", "reason"])
+sign_logins    = Counter("dak_sign_logins_total",
+                         "login.cgi handshakes, by result.", ["sign", "result"])
+lock_wait      = Histogram("dak_sign_session_lock_wait_seconds",
+                           "Time spent waiting for a sign's session lock.", ["sign"])
+cache_requests = Counter("dak_message_cache_requests_total",
+                         "Message list reads, by cache result (hit/miss/bypass).", ["sign", "result"])
+
+
+# ── Per-request timing breakdown ──────────────────────────────────
+
+_timing = contextvars.ContextVar("dak_timing", default=None)
+
+
+def add_timing(part, seconds):
+    """Charge `seconds` to `part` (e.g. "sign", "lock") for the current request."""
+    parts = _timing.get()
+    if parts is not None:
+        parts[part] = parts.get(part, 0.0) + seconds
+
+
+def observe_sign_call(sign, path, started, status, size=None):
+    """Record one ECCB round trip that began at perf_counter() `started`."""
+    elapsed = time.perf_counter() - started
+    path = path.split("?", 1)[0]
+    sign_latency.observe(elapsed, sign=sign, path=path)
+    sign_requests.inc(sign=sign, path=path, status=status)
+    if size is not None:
+        sign_bytes.observe(size, sign=sign, path=path)
+    add_timing("sign", elapsed)
+
+
+def init_metrics(app):
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+        if request.headers.get("X-Timing") == "1" or request.args.get("timing") == "1":
+            g.metrics_timing = {}
+            _timing.set(g.metrics_timing)
+        else:
+            _timing.set(None)
+
+    @app.after_request
+    def record_request(resp):
+        started = g.pop("metrics_started", None)
+        if started is None:
+            return resp
+        elapsed  = time.perf_counter() - started
+        endpoint = request.endpoint or "unmatched"
+        http_latency.observe(elapsed, endpoint=endpoint)
+        http_requests.inc(endpoint=endpoint, status=resp.status_code)
+        parts = g.pop("metrics_timing", None)
+        if parts is not None:
+            app_time = max(0.0, elapsed - sum(parts.values()))
+            entries  = [f"app;dur={app_time * 1000:.1f}"]
+            entries += [f"{k};dur={v * 1000:.1f}" for k, v in sorted(parts.items())]
+            entries.append(f"total;dur={elapsed * 1000:.1f}")
+            resp.headers["Server-Timing"] = ", ".join(entries)
+        return resp
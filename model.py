@@ -0,0 +1,285 @@
+"""
+Typed message model for DAK Sign Controller.
+Message, Frame, Line and Schedule mirror the ECCB message JSON returned by
+getmessagelist.php and accepted by savemessage.php. They are slotted and
+treated as immutable: replace() returns a new object sharing every field
+that didn't change, so edits never copy a whole message and unchanged
+frames and lines can be compared by identity.
+
+Fields the model doesn't know about are kept in `extra` and written back
+untouched, and a known field the sign left out stays left out (MISSING), so
+a message read from the sign serializes back to the same JSON.
+"""
+import re
+from functools import lru_cache
+
+SIGN_WIDTH   = 72
+SIGN_HEIGHT  = 32
+DEFAULT_FONT = "dak_eccb_black-webfont.ttf"
+DEFAULT_HOLD = "P0Y0M0DT0H0M5S"
+ALL_DAYS     = 127   # Dow bitmask, Sunday..Saturday
+
+
+class InvalidMessage(ValueError):
+    """A message or message field that the sign would not accept."""
+
+
+class _Missing:
+    __slots__ = ()
+
+    def __repr__(self):
+        return "MISSING"
+
+    def __bool__(self):
+        return False
+
+
+MISSING   = _Missing()   # a known field absent from the sign's JSON
+_NO_EXTRA = {}           # shared by every record without unknown fields; never mutated
+
+
+# ── Durations ─────────────────────────────────────────────────────
+
+_DURATION = re.compile(r"P(?:(\d+)Y)?(?:(\d+)M)?(?:(\d+)W)?(?:(\d+)D)?"
+                       r"(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+(?:\.\d+)?)S)?)?")
+
+
+def parse_duration(text):
+    """ISO 8601 duration ("P0Y0M0DT0H0M5S", "PT8H30M0S") -> seconds.
+
+    Years and months count as 365 and 30 days; the sign only uses the time
+    part in practice. Results are cached, as the same few strings recur in
+    every message.
+    """
+    if not isinstance(text, str):
+        raise InvalidMessage(f"invalid duration {text!r}")
+    return _parse_duration(text)
+
+
+@lru_cache(maxsize=512)
+def _parse_duration(text):
+    m = _DURATION.fullmatch(text)
+    if m is None or text in ("P", "PT") or text.endswith("T"):
+        raise InvalidMessage(f"invalid duration {text!r}")
+    y, mo, w, d, h, mi, s = (float(g) if g else 0 for g in m.groups())
+    return (((y * 365 + mo * 30 + w * 7 + d) * 24 + h) * 60 + mi) * 60 + s
+
+
+# ── Records ───────────────────────────────────────────────────────
+
+class Record:
+    """Base for the model classes.
+
+    FIELDS maps attributes to ECCB keys, in the order they are serialized;
+    every class also has an `extra` slot for keys not listed there.
+    """
+
+    __slots__ = ()
+    FIELDS = ()
+
+    def replace(self, **changes):
+        """A copy with some fields changed; the rest are shared, not copied."""
+        new = object.__new__(type(self))
+        for attr in self.__slots__:
+            setattr(new, attr, changes.pop(attr) if attr in changes else getattr(self, attr))
+        if changes:
+            raise TypeError(f"{type(self).__name__} has no field(s) {', '.join(changes)}")
+        return new
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, a) == getattr(other, a) for a in self.__slots__)
+
+    __hash__ = None
+
+    def __repr__(self):
+        fields = ", ".join(f"{a}={getattr(self, a)!r}" for a, _ in self.FIELDS)
+        return f"{type(self).__name__}({fields})"
+
+    @classmethod
+    def _parse(cls, d):
+        """A record holding `d`'s known fields as-is; nested ones are up to the caller."""
+        if not isinstance(d, dict):
+            raise InvalidMessage(f"{cls.__name__} must be an object, not {type(d).__name__}")
+        obj = object.__new__(cls)
+        for attr, key in cls.FIELDS:
+            setattr(obj, attr, d.get(key, MISSING))
+        obj.extra = (_NO_EXTRA if d.keys() <= cls._KEYS
+                     else {k: v for k, v in d.items() if k not in cls._KEYS})
+        return obj
+
+    def _dump(self, nested=()):
+        out = {}
+        for attr, key in self.FIELDS:
+            value = getattr(self, attr)
+            if value is MISSING:
+                continue
+            if attr in nested:
+                value = ([v.to_eccb() for v in value] if isinstance(value, tuple)
+                         else value.to_eccb())
+            out[key] = value
+        if self.extra:
+            out.update(self.extra)
+        return out
+
+
+class Line(Record):
+    __slots__ = ("font", "font_size", "text", "extra")
+    FIELDS = (("font", "Font"), ("font_size", "FontSize"), ("text", "Text"))
+    _KEYS  = frozenset(k for _, k in FIELDS)
+
+    def __init__(self, text, font=DEFAULT_FONT, font_size=17.5, extra=_NO_EXTRA):
+        self.font      = font
+        self.font_size = font_size
+        self.text      = text
+        self.extra     = extra
+
+    @classmethod
+    def from_eccb(cls, d):
+        return cls._parse(d)
+
+    def to_eccb(self):
+        return self._dump()
+
+    def validate(self):
+        """Raise InvalidMessage for a bad field. Fields the sign left out are not checked."""
+        if not isinstance(self.text, str):
+            raise InvalidMessage("line text must be a string")
+        if self.font is not MISSING and (not isinstance(self.font, str) or not self.font):
+            raise InvalidMessage("line font must be a font file name")
+        if self.font_size is not MISSING and (
+                isinstance(self.font_size, bool) or not isinstance(self.font_size, (int, float))
+                or self.font_size <= 0):
+            raise InvalidMessage(f"invalid font size {self.font_size!r}")
+
+
+class Frame(Record):
+    __slots__ = ("hold_time", "lines", "line_spacing", "extra")
+    FIELDS = (("hold_time", "HoldTime"), ("lines", "Lines"), ("line_spacing", "LineSpacing"))
+    _KEYS  = frozenset(k for _, k in FIELDS)
+
+    def __init__(self, lines, hold_time=DEFAULT_HOLD, line_spacing=0, extra=_NO_EXTRA):
+        self.hold_time    = hold_time
+        self.lines        = tuple(lines)
+        self.line_spacing = line_spacing
+        self.extra        = extra
+
+    @classmethod
+    def from_eccb(cls, d):
+        frame = cls._parse(d)
+        if frame.lines is not MISSING:
+            frame.lines = tuple([Line.from_eccb(l) for l in _expect_list(frame.lines, "Lines")])
+        return frame
+
+    def to_eccb(self):
+        return self._dump(("lines",))
+
+    @property
+    def hold_seconds(self):
+        return parse_duration(self.hold_time) if self.hold_time is not MISSING else None
+
+    def validate(self):
+        if self.hold_time is not MISSING:
+            parse_duration(self.hold_time)
+        if not self.lines:
+            raise InvalidMessage("a frame needs at least one line")
+        for line in self.lines:
+            line.validate()
+
+
+class Schedule(Record):
+    __slots__ = ("enabled", "start_time", "end_time", "dow", "is_all_day", "extra")
+    FIELDS = (("enabled", "Enabled"), ("start_time", "StartTime"), ("end_time", "EndTime"),
+              ("dow", "Dow"), ("is_all_day", "IsAllDay"))
+    _KEYS  = frozenset(k for _, k in FIELDS)
+
+    def __init__(self, enabled=True, start_time="PT0H0M0S", end_time="PT0H0M0S",
+                 dow=ALL_DAYS, is_all_day=True, extra=_NO_EXTRA):
+        self.enabled    = enabled
+        self.start_time = start_time
+        self.end_time   = end_time
+        self.dow        = dow
+        self.is_all_day = is_all_day
+        self.extra      = extra
+
+    @classmethod
+    def from_eccb(cls, d):
+        return cls._parse(d)
+
+    def to_eccb(self):
+        return self._dump()
+
+    @property
+    def start_seconds(self):
+        return parse_duration(self.start_time) if self.start_time is not MISSING else None
+
+    @property
+    def end_seconds(self):
+        return parse_duration(self.end_time) if self.end_time is not MISSING else None
+
+    def validate(self):
+        for attr in ("enabled", "is_all_day"):
+            value = getattr(self, attr)
+            if value is not MISSING and not isinstance(value, bool):
+                raise InvalidMessage(f"schedule {attr} must be true or false")
+        if self.dow is not MISSING and (isinstance(self.dow, bool) or not isinstance(self.dow, int)
+                                        or not 0 <= self.dow <= ALL_DAYS):
+            raise InvalidMessage(f"invalid Dow {self.dow!r}, expected a 0-{ALL_DAYS} bitmask")
+        for value in (self.start_time, self.end_time):
+            if value is not MISSING:
+                parse_duration(value)
+
+
+class Message(Record):
+    __slots__ = ("name", "height", "width", "is_permanent", "frames", "schedule", "extra")
+    FIELDS = (("name", "Name"), ("height", "Height"), ("width", "Width"),
+              ("is_permanent", "IsPermanent"), ("frames", "Frames"),
+              ("schedule", "CurrentSchedule"))
+    _KEYS  = frozenset(k for _, k in FIELDS)
+
+    def __init__(self, name, frames, schedule=None, height=SIGN_HEIGHT, width=SIGN_WIDTH,
+                 is_permanent=False, extra=_NO_EXTRA):
+        self.name         = name
+        self.height       = height
+        self.width        = width
+        self.is_permanent = is_permanent
+        self.frames       = tuple(frames)
+        self.schedule     = schedule if schedule is not None else Schedule()
+        self.extra        = extra
+
+    @classmethod
+    def from_eccb(cls, d):
+        msg = cls._parse(d)
+        if msg.frames is not MISSING:
+            msg.frames = tuple([Frame.from_eccb(f) for f in _expect_list(msg.frames, "Frames")])
+        if msg.schedule is not MISSING:
+            msg.schedule = Schedule.from_eccb(msg.schedule)
+        return msg
+
+    def to_eccb(self):
+        return self._dump(("frames", "schedule"))
+
+    def validate(self):
+        """Check everything the sign relies on; raises InvalidMessage."""
+        if not isinstance(self.name, str) or not self.name.strip():
+            raise InvalidMessage("name is required")
+        if not self.frames:
+            raise InvalidMessage("at least one frame with text is required")
+        for frame in self.frames:
+            frame.validate()
+        if self.schedule is not MISSING:
+            self.schedule.validate()
+
+
+def _expect_list(value, key):
+    if not isinstance(value, list):
+        raise InvalidMessage(f"{key} must be a list")
+    return value
+
+
+def parse_messages(items):
+    """getmessagelist.php's "Messages" array -> list of Message."""
+    return [Message.from_eccb(m) for m in _expect_list(items, "Messages")]
@@ -0,0 +1,183 @@
+"""
+Message list index for DAK Sign Controller.
+A sign's message list is immutable once fetched (edits swap in a new list),
+so an index is built once per list and shared by everyone holding it. It
+maps names to messages and answers the list page's filters without
+walking every message: enabled state, the days each message runs (Dow
+bitmask), whether it is showing at a given time, and a text search over
+names and line text.
+
+Which messages are active at a time comes from the list's compiled
+schedule timeline (timeline.py).
+"""
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from model import MISSING, ALL_DAYS
+from timeline import timeline_for
+
+QUERY_PARAMS = ("enabled", "activeAt", "dow", "q", "offset", "limit")
+INDEX_MEMO   = 16   # indexes kept in memory (each sign's current list, outbox views)
+
+
+class QueryError(ValueError):
+    """A message query parameter that can't be read."""
+
+
+def parse_when(value):
+    """"now", epoch seconds or ISO 8601 (sign-local if it has no offset) -> a
+    naive local datetime, to the minute, as schedules are."""
+    if value == "now":
+        when = datetime.now()
+    else:
+        try:
+            when = datetime.fromtimestamp(float(value))
+        except ValueError:
+            try:
+                when = datetime.fromisoformat(value.replace("Z", "+00:00"))
+            except ValueError:
+                raise QueryError(f"can't read time {value!r}") from None
+            if when.tzinfo is not None:
+                when = when.astimezone().replace(tzinfo=None)
+        except (OverflowError, OSError):
+            raise QueryError(f"time {value!r} is out of range") from None
+    return when.replace(second=0, microsecond=0)
+
+
+def _schedule(msg):
+    sched = msg.schedule
+    if sched is MISSING:
+        return None
+    dow = sched.dow if isinstance(sched.dow, int) else ALL_DAYS
+    return sched.enabled is True, dow
+
+
+# ── Index ─────────────────────────────────────────────────────────
+
+class MessageIndex:
+    """Lookups over one message list; positions are indexes into `msgs`."""
+
+    def __init__(self, msgs):
+        self.msgs     = msgs
+        self._names   = {}
+        self._enabled = set()
+        self._days    = [set() for _ in range(7)]   # Dow bit number -> enabled positions
+        self._text    = []                          # lower-cased name and lines
+        for i, m in enumerate(msgs):
+            self._names.setdefault(m.name, i)
+            self._text.append("\n".join([str(m.name)] + [
+                str(line.text) for frame in (m.frames or ()) for line in (frame.lines or ())
+                if line.text]).lower())
+            sched = _schedule(m)
+            if sched is None or not sched[0]:
+                continue
+            self._enabled.add(i)
+            for bit in range(7):
+                if sched[1] & (1 << bit):
+                    self._days[bit].add(i)
+
+    def __len__(self):
+        return len(self.msgs)
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def get(self, name, default=None):
+        i = self._names.get(name)
+        return self.msgs[i] if i is not None else default
+
+    def active_at(self, when):
+        """Positions of the messages showing at `when` (a naive local datetime)."""
+        return set(timeline_for(self.msgs).at(when))
+
+    def query(self, enabled=None, active_at=None, days=None, text=None):
+        """Positions, in list order, of the messages matching every filter given:
+        enabled state, showing at a datetime, scheduled on any of a Dow
+        bitmask's days, and a case-insensitive substring of name or text."""
+        sets = []
+        if active_at is not None:
+            sets.append(self.active_at(active_at))
+        if days is not None:
+            sets.append(set().union(*(self._days[b] for b in range(7) if days & (1 << b))))
+        if enabled is True:
+            sets.append(self._enabled)
+        if sets:
+            sets.sort(key=len)
+            hits = sets[0].intersection(*sets[1:])
+        else:
+            hits = range(len(self.msgs))
+        if enabled is False:
+            hits = [i for i in hits if i not in self._enabled]
+        if text:
+            text = text.lower()
+            hits = [i for i in hits if text in self._text[i]]
+        return sorted(hits)
+
+
+# ── Queries ───────────────────────────────────────────────────────
+
+_BOOLS = {"1": True, "true": True, "yes": True, "0": False, "false": False, "no": False}
+
+
+def _count(args, key, default):
+    value = args.get(key, "")
+    if value == "":
+        return default
+    if not value.isdigit():
+        raise QueryError(f"{key} must be a whole number, got {value!r}")
+    return int(value)
+
+
+def parse_query(args):
+    """/api/messages?enabled=&activeAt=&dow=&q=&offset=&limit= -> keyword
+    arguments for page(), or None if no filter or paging was asked for."""
+    if not any(key in args for key in QUERY_PARAMS):
+        return None
+    enabled = args.get("enabled", "")
+    if enabled and enabled.lower() not in _BOOLS:
+        raise QueryError(f"enabled must be true or false, got {enabled!r}")
+    days = _count(args, "dow", None)
+    if days is not None and days > ALL_DAYS:
+        raise QueryError(f"dow must be a 0-{ALL_DAYS} bitmask")
+    return {"enabled":   _BOOLS[enabled.lower()] if enabled else None,
+            "active_at": parse_when(args["activeAt"]) if args.get("activeAt") else None,
+            "days":      days,
+            "text":      args.get("q", "").strip() or None,
+            "offset":    _count(args, "offset", 0),
+            "limit":     _count(args, "limit", None)}
+
+
+def page(msgs, enabled=None, active_at=None, days=None, text=None, offset=0, limit=None):
+    """The matching messages from `offset`, at most `limit` of them, with the
+    total that match: the body of a filtered /api/messages."""
+    hits = index_for(msgs).query(enabled, active_at, days, text)
+    end  = offset + limit if limit is not None else None
+    out  = {"messages": [msgs[i].to_eccb() for i in hits[offset:end]],
+            "total": len(hits), "offset": offset, "limit": limit}
+    if active_at is not None:
+        out["activeAt"] = active_at.isoformat(timespec="minutes")
+    return out
+
+
+# ── Memo ──────────────────────────────────────────────────────────
+
+# Indexes are built on first use and kept by the list's identity, like
+# httpcache's snapshots; the memo holds the list so its id() isn't reused.
+_memo      = OrderedDict()   # id(msgs) -> MessageIndex
+_memo_lock = threading.Lock()
+
+
+def index_for(msgs):
+    """The MessageIndex for a message list, building it on first use."""
+    with _memo_lock:
+        index = _memo.get(id(msgs))
+        if index is not None and index.msgs is msgs:
+            _memo.move_to_end(id(msgs))
+            return index
+    index = MessageIndex(msgs)
+    with _memo_lock:
+        _memo[id(msgs)] = index
+        while len(_memo) > INDEX_MEMO:
+            _memo.popitem(last=False)
+    return index
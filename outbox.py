@@ -0,0 +1,284 @@
+"""
+Offline write queue for DAK Sign Controller.
+When a sign can't be reached, message saves and deletes are kept in a
+SQLite file instead of failing, and replayed in order once the sign answers
+again. Only the last write to each message name is kept: five toggles of
+one message while the link is down are one save when it comes back, and a
+delete drops any save queued before it. Queued writes survive a restart.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import requests
+
+import metrics
+import shared
+from model import Message
+from msgindex import index_for
+
+log = logging.getLogger(__name__)
+
+REPLAY_INTERVAL = 15   # seconds between replay attempts while the sign is down
+MAX_ATTEMPTS    = 5    # a write the sign keeps rejecting is set aside after this many
+REPLAY_LEASE    = 300  # seconds; see shared.py
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    sign       TEXT    NOT NULL,
+    name       TEXT    NOT NULL,
+    op         TEXT    NOT NULL,   -- "save" or "delete"
+    body       TEXT,               -- ECCB message JSON, for saves
+    queued     REAL    NOT NULL,
+    attempts   INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    failed     INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (sign, failed, id);
+"""
+
+
+class Outbox:
+    """Queued writes for one sign, and the thread that replays them."""
+
+    def __init__(self, client, path, retry=REPLAY_INTERVAL):
+        self.client     = client
+        self.path       = path
+        self.retry      = retry
+        self.replayed   = 0
+        self.superseded = 0
+        self.last_error = None
+        self._lock      = threading.Lock()
+        self._wake      = threading.Event()
+        self._thread    = None
+        self._closed    = False
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        if self.depth:
+            log.info("[%s] %d queued write(s) from a previous run", client.name, self.depth)
+            self.kick()
+
+    # ── Queueing ──────────────────────────────────────────────────
+
+    @property
+    def depth(self):
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM outbox WHERE sign = ? AND failed = 0",
+                (self.client.name,)).fetchone()[0]
+
+    def put(self, op, name, msg=None):
+        """Queue a "save" of `msg` or a "delete" of `name`, superseding any
+        earlier queued write to the same name. Returns the queue depth."""
+        body = json.dumps(msg.to_eccb()) if msg is not None else None
+        with self._lock:
+            cur = self._db.execute("DELETE FROM outbox WHERE sign = ? AND name = ? AND failed = 0",
+                                   (self.client.name, name))
+            self.superseded += cur.rowcount
+            self._db.execute("INSERT INTO outbox (sign, name, op, body, queued) VALUES (?, ?, ?, ?, ?)",
+                             (self.client.name, name, op, body, time.time()))
+        log.info("[%s] queued %s %r%s", self.client.name, op, name,
+                 f" (replacing {cur.rowcount} earlier)" if cur.rowcount else "")
+        self.kick()
+        return self.depth
+
+    def pending(self, failed=False):
+        """Queued writes, oldest first (or the ones set aside, with failed=True)."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, name, op, queued, attempts, last_error FROM outbox"
+                " WHERE sign = ? AND failed = ? ORDER BY id", (self.client.name, int(failed))).fetchall()
+        return [dict(r) for r in rows]
+
+    def _pending_messages(self):
+        """{name: Message, or None for a delete} for every queued write."""
+        with self._lock:
+            rows = self._db.execute("SELECT name, op, body FROM outbox WHERE sign = ? AND failed = 0",
+                                    (self.client.name,)).fetchall()
+        return {r["name"]: Message.from_eccb(json.loads(r["body"])) if r["op"] == "save" else None
+                for r in rows}
+
+    def view(self, msgs):
+        """`msgs` as they will be once the queue is replayed, and the pending names."""
+        queued = self._pending_messages()
+        if not queued:
+            return msgs, []
+        out = [queued[m.name] if m.name in queued else m for m in msgs]
+        names = {m.name for m in msgs}
+        out = [m for m in out if m is not None]
+        out += [m for n, m in queued.items() if m is not None and n not in names]
+        return out, sorted(queued)
+
+    def find(self, name):
+        """A message as the user last left it: its queued version if there
+        is one, else the sign's, else the last copy we saw if it's down."""
+        queued = self._pending_messages()
+        if name in queued:
+            return queued[name]
+        try:
+            return self.client.find_message(name)
+        except requests.exceptions.ConnectionError:
+            known = self.client.last_known_messages()
+            if known is None:
+                raise
+            return index_for(known).get(name)
+
+    def discard(self, op_id):
+        with self._lock:
+            return self._db.execute("DELETE FROM outbox WHERE sign = ? AND id = ?",
+                                    (self.client.name, op_id)).rowcount > 0
+
+    def retry_failed(self):
+        """Put writes that were set aside back in the queue."""
+        with self._lock:
+            n = self._db.execute("UPDATE outbox SET failed = 0, attempts = 0 WHERE sign = ? AND failed = 1",
+                                 (self.client.name,)).rowcount
+        self.kick()
+        return n
+
+    def describe(self):
+        with self._lock:
+            depth, oldest = self._db.execute(
+                "SELECT COUNT(*), MIN(queued) FROM outbox WHERE sign = ? AND failed = 0",
+                (self.client.name,)).fetchone()
+            failed = self._db.execute("SELECT COUNT(*) FROM outbox WHERE sign = ? AND failed = 1",
+                                      (self.client.name,)).fetchone()[0]
+        return {"depth": depth, "oldest_age": round(time.time() - oldest, 1) if oldest else None,
+                "failed": failed, "replayed": self.replayed, "superseded": self.superseded,
+                "last_error": self.last_error}
+
+    def close(self):
+        """Stop replaying and close the database (the sign was removed).
+        Queued writes stay in the file for the next Outbox of that sign."""
+        with self._lock:
+            self._closed = True
+            self._db.close()
+        self._wake.set()
+
+    # ── Replay ────────────────────────────────────────────────────
+
+    def kick(self):
+        """Try to replay now, starting the replay thread if it isn't running."""
+        self._wake.set()
+        with self._lock:
+            if self._thread is not None or self._closed:
+                return
+            self._thread = threading.Thread(target=self._run, name=f"outbox-{self.client.name}",
+                                            daemon=True)
+            self._thread.start()
+
+    def _next(self):
+        with self._lock:
+            if self._closed:
+                self._thread = None
+                return None
+            row = self._db.execute("SELECT * FROM outbox WHERE sign = ? AND failed = 0 ORDER BY id LIMIT 1",
+                                   (self.client.name,)).fetchone()
+            if row is None:
+                self._thread = None   # kick() starts a new one for the next write
+            return row
+
+    def _run(self):
+        refresh = True
+        while True:
+            self._wake.clear()
+            # Under several workers, one replays a sign's queue at a time
+            with shared.lease(f"outbox:{self.client.name}", REPLAY_LEASE) as held:
+                row = self._next()
+                if row is None:
+                    return
+                done = held and self._attempt(row, refresh)
+            refresh = not done
+            if not done:
+                self._wake.wait(self.retry)
+
+    def _attempt(self, row, refresh):
+        """Send one queued write; False if the queue should wait before going on."""
+        try:
+            if refresh:
+                self.client.get_messages(fresh=True)
+            code, text = self._replay(row)
+        except requests.exceptions.ConnectionError as e:
+            self.last_error = str(e)
+            return False
+        except Exception as e:
+            code, text = 500, str(e)
+
+        ok = 200 <= code < 300
+        with self._lock:
+            if self._closed:
+                return False
+            if ok:
+                self._db.execute("DELETE FROM outbox WHERE id = ?", (row["id"],))
+            else:
+                failed = row["attempts"] + 1 >= MAX_ATTEMPTS
+                self._db.execute("UPDATE outbox SET attempts = attempts + 1, last_error = ?,"
+                                 " failed = ? WHERE id = ?", (f"{code} {text[:200]}",
+                                                              int(failed), row["id"]))
+        if ok:
+            self.replayed  += 1
+            self.last_error = None
+            log.info("[%s] replayed queued %s %r", self.client.name, row["op"], row["name"])
+            return True
+        self.last_error = f"{row['op']} {row['name']!r}: {code} {text[:200]}"
+        log.warning("[%s] queued %s %r rejected (%s)%s", self.client.name, row["op"],
+                    row["name"], code, "; set aside" if failed else "")
+        return failed   # a write set aside doesn't hold up the rest
+
+    def _replay(self, row):
+        """Apply one queued write to what is on the sign now."""
+        current = self.client.find_message(row["name"])
+        if row["op"] == "delete":
+            if current is None:
+                return 200, ""
+            text, code = self.client.delete_message_by_name(row["name"])
+            return code, text
+        msg = Message.from_eccb(json.loads(row["body"]))
+        if current is None:
+            text, code = self.client.save_message_obj(msg)
+        else:
+            text, code, _, _ = self.client.replace_message(current, msg)
+        return code, text
+
+
+# ── Registry ──────────────────────────────────────────────────────
+
+_outboxes = {}   # sign name -> Outbox
+
+
+def add_outbox(outbox):
+    _outboxes[outbox.client.name] = outbox
+    return outbox
+
+
+def remove_outbox(name):
+    outbox = _outboxes.pop(name, None)
+    if outbox is not None:
+        outbox.close()
+    return outbox
+
+
+def get_outbox(name):
+    return _outboxes.get(name)
+
+
+def _collect_metrics():
+    boxes = list(_outboxes.values())
+    stats = [(b.client.name, b.describe()) for b in boxes]
+    lines = ["# HELP dak_outbox_depth Writes queued for a sign that couldn't be reached.",
+             "# TYPE dak_outbox_depth gauge"]
+    lines += [f'dak_outbox_depth{{sign="{n}"}} {s["depth"]}' for n, s in stats]
+    lines += ["# HELP dak_outbox_oldest_seconds Age of the oldest queued write.",
+              "# TYPE dak_outbox_oldest_seconds gauge"]
+    lines += [f'dak_outbox_oldest_seconds{{sign="{n}"}} {s["oldest_age"] or 0}' for n, s in stats]
+    return lines
+
+
+metrics.add_collector(_collect_metrics)
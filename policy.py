@@ -0,0 +1,202 @@
+"""
+Timeouts and retries for sign HTTP calls.
+Each sign keeps a rolling sample of round-trip times per endpoint, and
+derives its timeouts from them: a read timeout of a few times the endpoint's
+p99, and a connect timeout from the sign's round trips overall. A dropped
+packet then costs seconds on an endpoint that answers in 200 ms, while a
+slow getmessagelist.php keeps a long timeout. Timeouts are recorded at the
+timeout value, so a sign that slows down raises its own limits.
+
+Reads (GET) are retried with jittered exponential backoff after a network
+error or a 502/503/504. Writes are retried only when the request provably
+never left us (the connection could not be opened): a savemessage.php that
+may have reached the sign is never sent twice.
+"""
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+WINDOW          = 200    # round trips kept per endpoint
+MIN_SAMPLES     = 20     # before this many, the defaults below apply
+READ_FACTOR     = 4      # read timeout = READ_FACTOR x p99 ...
+READ_MIN        = 2.0    # ... but at least this (seconds)
+WRITE_READ_MIN  = 15.0   # a write cut short has an unknown outcome; give it longer
+READ_MAX        = 60.0
+READ_DEFAULT    = 60.0
+CONNECT_FACTOR  = 3      # connect timeout = CONNECT_FACTOR x the sign's p90 ...
+CONNECT_MIN     = 1.0
+CONNECT_MAX     = 10.0
+CONNECT_DEFAULT = 5.0
+READ_RETRIES    = 2      # extra attempts for idempotent requests
+RETRY_BUDGET    = 30.0   # seconds; no retry starts later than this after the first try
+BACKOFF_BASE    = 0.25   # seconds; attempt n waits up to BACKOFF_BASE * 2**n
+BACKOFF_MAX     = 4.0
+RETRY_STATUSES  = {502, 503, 504}
+IDEMPOTENT      = {"GET", "HEAD", "OPTIONS"}
+_NO_COUNTS      = {"timeouts": 0, "retries": 0, "errors": 0, "pool_timeouts": 0}
+
+# Keep-alive pool per sign session. Embedded controllers serve few
+# connections at once, so at most POOL_SIZE calls go to a sign together;
+# further calls (batch writes, request threads) wait for a free slot rather
+# than opening extra connections. requests gives urllib3's blocking pool no
+# timeout, so Policy.send does the waiting on its own slots and gives up
+# after POOL_WAIT seconds; the pool itself then never has to wait.
+POOL_SIZE = 4
+POOL_WAIT = 10.0   # seconds
+
+
+def make_adapter():
+    """HTTP adapter for a sign session: small blocking keep-alive pool, no
+    urllib3 retries (Policy does those, where they are safe)."""
+    return HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, pool_block=True,
+                       max_retries=0)
+
+
+class PoolBusy(requests.exceptions.ConnectionError):
+    """Raised when no connection to the sign came free within POOL_WAIT.
+    Nothing was sent, and it says nothing about whether the sign is up."""
+
+    def __init__(self, name):
+        super().__init__(f"Sign '{name}' busy: no free connection after {POOL_WAIT:g} s")
+
+
+def _never_sent(e):
+    """True if the request can't have reached the sign: the connection didn't open."""
+    if isinstance(e, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(e.args[0], "reason", None) if e.args else None
+    # urllib3's NewConnectionError subclasses its ConnectTimeoutError
+    return reason is not None and type(reason).__name__ in ("NewConnectionError", "ConnectTimeoutError")
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+class Policy:
+    """Timeouts and retry rules for one sign, learned from its round trips."""
+
+    def __init__(self, name):
+        self.name    = name
+        self._lock   = threading.Lock()
+        self._rtts   = {}   # path -> deque of seconds
+        self._counts = {}   # path -> {"timeouts", "retries", "errors", "pool_timeouts"}
+        self._slots  = threading.BoundedSemaphore(POOL_SIZE)
+
+    # ── Observations ──────────────────────────────────────────────
+
+    def observe(self, path, seconds):
+        with self._lock:
+            rtts = self._rtts.get(path)
+            if rtts is None:
+                rtts = self._rtts[path] = deque(maxlen=WINDOW)
+            rtts.append(seconds)
+
+    def _count(self, path, what):
+        with self._lock:
+            counts = self._counts.setdefault(path, dict(_NO_COUNTS))
+            counts[what] += 1
+
+    def reset(self):
+        with self._lock:
+            self._rtts.clear()
+            self._counts.clear()
+
+    # ── Derived settings ──────────────────────────────────────────
+
+    def connect_timeout(self):
+        with self._lock:
+            every = [x for rtts in self._rtts.values() for x in rtts]
+        if len(every) < MIN_SAMPLES:
+            return CONNECT_DEFAULT
+        # Opening a connection takes less than a whole round trip
+        return min(CONNECT_MAX, max(CONNECT_MIN, CONNECT_FACTOR * _percentile(every, 90)))
+
+    def read_timeout(self, method, path):
+        with self._lock:
+            rtts = list(self._rtts.get(path, ()))
+        if len(rtts) < MIN_SAMPLES:
+            return READ_DEFAULT
+        floor = READ_MIN if method in IDEMPOTENT else WRITE_READ_MIN
+        return min(READ_MAX, max(floor, READ_FACTOR * _percentile(rtts, 99)))
+
+    def timeout(self, method, path):
+        """(connect, read) timeouts for a request, as requests takes them."""
+        return (round(self.connect_timeout(), 2), round(self.read_timeout(method, path), 2))
+
+    @staticmethod
+    def backoff(attempt):
+        """Full-jitter delay before retry number `attempt` (1-based)."""
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+    # ── Sending ───────────────────────────────────────────────────
+
+    @staticmethod
+    def _over_budget(first):
+        """True if it is too late to start another attempt."""
+        return time.perf_counter() - first + BACKOFF_MAX > RETRY_BUDGET
+
+    def send(self, method, path, send):
+        """Run send(timeout) -> Response under this policy, retrying where safe.
+        Raises the last error if every attempt fails, or PoolBusy if no
+        connection slot comes free. Only time spent holding a slot (on the
+        network) is recorded as a round trip, not the wait for one."""
+        idempotent = method in IDEMPOTENT
+        attempt    = 0
+        first      = time.perf_counter()
+        while True:
+            attempt += 1
+            timeout  = self.timeout(method, path)
+            if not self._slots.acquire(timeout=POOL_WAIT):
+                self._count(path, "pool_timeouts")
+                raise PoolBusy(self.name)
+            started  = time.perf_counter()
+            try:
+                r = send(timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if isinstance(e, requests.exceptions.ReadTimeout):
+                    self.observe(path, timeout[1])   # it took at least this long
+                    self._count(path, "timeouts")
+                else:
+                    self._count(path, "errors")
+                if (attempt > READ_RETRIES or not (idempotent or _never_sent(e))
+                        or self._over_budget(first)):
+                    raise
+                reason = "timeout" if isinstance(e, requests.exceptions.Timeout) else "error"
+            else:
+                self.observe(path, time.perf_counter() - started)
+                if not (idempotent and r.status_code in RETRY_STATUSES and attempt <= READ_RETRIES
+                        and not self._over_budget(first)):
+                    return r
+                reason = str(r.status_code)
+            finally:
+                self._slots.release()
+            self._count(path, "retries")
+            metrics.sign_retries.inc(sign=self.name, path=path, reason=reason)
+            time.sleep(self.backoff(attempt))
+
+    def describe(self):
+        with self._lock:
+            paths  = {p: list(r) for p, r in self._rtts.items()}
+            counts = {p: dict(c) for p, c in self._counts.items()}
+        endpoints = {}
+        for path in sorted(set(paths) | set(counts)):
+            rtts = paths.get(path, [])
+            endpoints[path] = {
+                "samples": len(rtts),
+                **({f"p{p}_ms": round(_percentile(rtts, p) * 1000, 1) for p in (50, 95, 99)}
+                   if rtts else {}),
+                "read_timeout": round(self.read_timeout("GET", path), 2),
+                "write_read_timeout": round(self.read_timeout("POST", path), 2),
+                **counts.get(path, _NO_COUNTS),
+            }
+        return {"sign": self.name, "connect_timeout": round(self.connect_timeout(), 2),
+                "read_retries": READ_RETRIES, "pool_size": POOL_SIZE,
+                "pool_wait": POOL_WAIT, "endpoints": endpoints}
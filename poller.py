@@ -0,0 +1,197 @@
+"""
+Background status polling for DAK Sign Controller.
+One StatusPoller per sign refreshes the syscontrol status, configuration and
+dimming endpoints on a fixed interval and keeps the latest snapshot in memory,
+so sign load does not grow with the number of open dashboards. Browsers get
+changes pushed to them as Server-Sent Events.
+
+Under several worker processes the worker holding a sign's poll lease polls
+it and publishes each result through shared.py; the others follow those
+results instead of polling, so sign load doesn't grow with workers either.
+"""
+import json
+import logging
+import queue
+import threading
+import time
+
+import shared
+
+log = logging.getLogger(__name__)
+
+ENDPOINTS = {
+    "status":        "/daktronics/syscontrol/1.0/status",
+    "configuration": "/daktronics/syscontrol/1.0/configuration",
+    "dimming":       "/daktronics/syscontrol/1.0/configuration/output/0/dimming",
+}
+POLL_INTERVAL = 10    # seconds between polls of each endpoint
+IDLE_STOP     = 300   # stop polling after this long with no readers (history.py
+                      # reads every sample, so with history on it never stops)
+HEARTBEAT     = 15    # seconds between keep-alive comments on idle streams
+POLL_LEASE    = 30    # seconds; under several workers one polls each sign
+
+
+def _changed_fields(old, new):
+    """Top-level fields of `new` that differ from `old` (removed ones as None),
+    or None if the whole value should be resent."""
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        return None
+    changes = {k: v for k, v in new.items() if old.get(k, object()) != v}
+    changes.update({k: None for k in old.keys() - new.keys()})
+    return changes
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class StatusPoller:
+    """Polls one sign's status endpoints and fans changes out to subscribers."""
+
+    def __init__(self, client, interval=POLL_INTERVAL):
+        self.client       = client
+        self.interval     = interval
+        self._lock        = threading.Lock()
+        self._snapshot    = {}   # endpoint -> {"data", "status", "updated"}
+        self._subscribers = set()
+        self._thread      = None
+        self._wake        = threading.Event()
+        self._stopped     = False
+        self._last_read   = 0.0
+
+    # ── Readers ───────────────────────────────────────────────────
+
+    def get(self, key):
+        """Latest (data, status code) for an endpoint, polling now if we have none."""
+        self._touch()
+        with self._lock:
+            entry = self._snapshot.get(key)
+        if entry is None:
+            entry = self._follow(key) or self._poll(key)
+        return entry["data"], entry["status"]
+
+    def latest(self, key):
+        """The whole entry for an endpoint ({"data", "status", "updated"}),
+        polling now if we have none; keeps the poller running like get()."""
+        self.get(key)
+        with self._lock:
+            return self._snapshot.get(key)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._snapshot)
+
+    def poke(self, key=None):
+        """Refresh now, e.g. after we changed a setting on the sign."""
+        if key is not None:
+            self._poll(key)
+        self._wake.set()
+
+    def stop(self):
+        """Stop polling for good (the sign was removed); open streams end at
+        their next heartbeat."""
+        with self._lock:
+            self._stopped = True
+            self._subscribers.clear()
+        self._wake.set()
+
+    def stream(self):
+        """SSE generator: the full snapshot first, then only what changes."""
+        q = queue.Queue(maxsize=100)
+        with self._lock:
+            self._subscribers.add(q)
+        self._touch()
+        try:
+            yield _sse("snapshot", self.snapshot())
+            while True:
+                try:
+                    event, data = q.get(timeout=HEARTBEAT)
+                except queue.Empty:
+                    with self._lock:
+                        dropped = q not in self._subscribers
+                    if dropped:
+                        return   # fell behind; the browser reconnects and resyncs
+                    yield ": keep-alive\n\n"
+                    continue
+                yield _sse(event, data)
+        finally:
+            with self._lock:
+                self._subscribers.discard(q)
+
+    # ── Polling ───────────────────────────────────────────────────
+
+    def _touch(self):
+        self._last_read = time.monotonic()
+        with self._lock:
+            if self._thread is not None or self._stopped:
+                return
+            self._thread = threading.Thread(target=self._run, name=f"poller-{self.client.name}",
+                                            daemon=True)
+            self._thread.start()
+
+    def _idle(self):
+        with self._lock:
+            if not self._stopped and (self._subscribers
+                                      or time.monotonic() - self._last_read < IDLE_STOP):
+                return False
+            self._thread = None
+            return True
+
+    def _run(self):
+        log.info("[%s] status poller started", self.client.name)
+        lease = f"poller:{self.client.name}"
+        while not self._idle():
+            if not shared.active or shared.try_lease(lease, max(POLL_LEASE, 3 * self.interval)):
+                for key in ENDPOINTS:
+                    self._poll(key)
+            else:
+                for key in ENDPOINTS:
+                    self._follow(key)
+            self._wake.wait(self.interval)
+            self._wake.clear()
+        if shared.active:
+            shared.release_lease(lease)   # a no-op unless this thread held it
+        log.info("[%s] status poller %s", self.client.name,
+                 "stopped" if self._stopped else "idle, stopped")
+
+    def _poll(self, key):
+        data, code = self.client.eccb_get(ENDPOINTS[key])
+        entry = self._apply(key, data, code, time.time())
+        shared.put_snapshot(f"status:{self.client.name}:{key}", entry)
+        return entry
+
+    def _follow(self, key):
+        """Take the result another worker polled, if it is newer than ours."""
+        published = shared.get_snapshot(f"status:{self.client.name}:{key}")
+        if published is None:
+            return None
+        with self._lock:
+            entry = self._snapshot.get(key)
+        if entry is not None and entry["updated"] >= published["updated"]:
+            return entry
+        return self._apply(key, published["data"], published["status"], published["updated"])
+
+    def _apply(self, key, data, code, updated):
+        with self._lock:
+            old = self._snapshot.get(key)
+            if old is not None and old["data"] == data and old["status"] == code:
+                # Keep the old object so anything keyed on it (ETags) stays valid
+                data = old["data"]
+            entry = {"data": data, "status": code, "updated": updated}
+            self._snapshot[key] = entry
+            subscribers = list(self._subscribers)
+        if old is not None and old["data"] is data and old["status"] == code:
+            return entry
+        changes = _changed_fields(old["data"], data) if old else None
+        event = {"endpoint": key, "status": code, "updated": entry["updated"]}
+        if changes is None:
+            event["data"] = data
+        else:
+            event["changes"] = changes
+        for q in subscribers:
+            try:
+                q.put_nowait(("update", event))
+            except queue.Full:
+                with self._lock:
+                    self._subscribers.discard(q)   # too slow; it will reconnect
+        return entry
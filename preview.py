@@ -0,0 +1,227 @@
+"""
+Frame previews for DAK Sign Controller.
+Draws a frame onto a 72x32 on/off pixel grid from the sign fonts' outlines,
+laid out the same way fonts.fit() sizes it, and encodes it as a PNG (one
+frame) or an animated PNG (a whole message, each frame held for its
+HoldTime). Rendered frames are kept in an LRU keyed by a hash of the frame
+content, so list thumbnails cost nothing after the first draw and never
+touch the sign.
+"""
+import hashlib
+import json
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+
+import fonts
+from model import DEFAULT_FONT, MISSING, SIGN_WIDTH, SIGN_HEIGHT, InvalidMessage
+
+PREVIEW_CACHE = 1024             # rendered frames kept in memory
+LED_ON        = (255, 48, 32)
+LED_OFF       = (0, 0, 0)
+MAX_SCALE     = 16
+CURVE_STEPS   = 4                # line segments per quadratic curve
+
+
+class PreviewError(Exception):
+    """A frame that can't be drawn, e.g. because its font file is missing."""
+
+
+# ── Content keys ──────────────────────────────────────────────────
+
+def frame_key(frame, width=SIGN_WIDTH, height=SIGN_HEIGHT):
+    """Hash of everything that affects how `frame` looks."""
+    body = json.dumps(frame.to_eccb(), sort_keys=True, separators=(",", ":"))
+    raw  = f"{width}x{height}|{fonts.generation}|{body}".encode()
+    return hashlib.blake2b(raw, digest_size=12).hexdigest()
+
+
+def message_key(msg, width=SIGN_WIDTH, height=SIGN_HEIGHT):
+    raw = "|".join(frame_key(f, width, height) + f"@{f.hold_time}" for f in msg.frames)
+    return hashlib.blake2b(raw.encode(), digest_size=12).hexdigest()
+
+
+# ── Rasterizing ───────────────────────────────────────────────────
+
+def _flatten(contour, scale, ox, oy):
+    """A TrueType contour as a closed polygon in pixel space (y down)."""
+    pts = [(ox + x * scale, oy - y * scale, on) for x, y, on in contour]
+    if not pts:
+        return []
+    # Start on an on-curve point, inventing one between two off-curve points if need be
+    first = next((i for i, p in enumerate(pts) if p[2]), None)
+    if first is None:
+        a, b = pts[0], pts[1 % len(pts)]
+        pts.insert(0, ((a[0] + b[0]) / 2, (a[1] + b[1]) / 2, True))
+        first = 0
+    pts = pts[first:] + pts[:first]
+    poly = [pts[0][:2]]
+    i, n = 1, len(pts)
+    while i <= n:
+        x, y, on = pts[i % n]
+        if on:
+            poly.append((x, y))
+            i += 1
+            continue
+        nx, ny, non = pts[(i + 1) % n]
+        end = (nx, ny) if non else ((x + nx) / 2, (y + ny) / 2)
+        sx, sy = poly[-1]
+        for step in range(1, CURVE_STEPS + 1):
+            t = step / CURVE_STEPS
+            u = 1 - t
+            poly.append((u * u * sx + 2 * u * t * x + t * t * end[0],
+                         u * u * sy + 2 * u * t * y + t * t * end[1]))
+        i += 2 if non else 1
+    return poly
+
+
+def _fill(pixels, width, height, polygons):
+    """Set every pixel whose centre is inside `polygons` (nonzero winding)."""
+    edges = []
+    for poly in polygons:
+        for (x0, y0), (x1, y1) in zip(poly, poly[1:] + poly[:1]):
+            if y0 != y1:
+                edges.append((x0, y0, x1, y1, 1 if y1 > y0 else -1))
+    if not edges:
+        return
+    top    = max(0, int(min(min(e[1], e[3]) for e in edges)))
+    bottom = min(height, int(max(max(e[1], e[3]) for e in edges)) + 1)
+    for row in range(top, bottom):
+        yc = row + 0.5
+        crossings = sorted((x0 + (yc - y0) * (x1 - x0) / (y1 - y0), d)
+                           for x0, y0, x1, y1, d in edges
+                           if min(y0, y1) <= yc < max(y0, y1))
+        winding = 0
+        for (xa, d), (xb, _) in zip(crossings, crossings[1:]):
+            winding += d
+            if winding:
+                start = max(0, int(xa + 0.5))
+                end   = min(width, int(xb + 0.5))
+                base  = row * width
+                for col in range(start, end):
+                    pixels[base + col] = 1
+
+
+def available(name=DEFAULT_FONT):
+    """True if frames set in `name` can be drawn: its file is there, with outlines."""
+    font = fonts.get_font(name)
+    return font is not None and font.has_outlines
+
+
+def _line_style(line):
+    name = line.font if line.font is not MISSING else DEFAULT_FONT
+    font = fonts.get_font(name)
+    if font is None or not font.has_outlines:
+        raise PreviewError(f"font {name!r} is not available; copy it into {fonts.FONT_DIR}")
+    size = line.font_size if line.font_size is not MISSING else fonts.LEGACY_SIZES[4]
+    return font, size
+
+
+def _render(frame, width, height):
+    lines   = [l for l in (frame.lines or ()) if isinstance(l.text, str) and l.text.strip()]
+    spacing = frame.line_spacing if isinstance(frame.line_spacing, (int, float)) else 0
+    laid    = []
+    for line in lines:
+        font, size = _line_style(line)
+        laid.append((line.text, font, size) + fonts.line_metrics(font, line.text, size))
+    total = sum(cap + desc for *_, cap, desc in laid) + spacing * max(len(laid) - 1, 0)
+
+    pixels = bytearray(width * height)
+    y = (height - total) // 2
+    for text, font, size, line_width, cap, desc in laid:
+        baseline = y + cap
+        scale    = size / font.units_per_em
+        pen      = (width - line_width) // 2
+        polygons = []
+        for ch in text:
+            polygons.extend(_flatten(c, scale, pen, baseline) for c in font.contours(ch))
+            pen += round(font.advances.get(ord(ch), font.default_advance) * scale)
+        _fill(pixels, width, height, [p for p in polygons if p])
+        y = baseline + desc + spacing
+    return bytes(pixels)
+
+
+_cache      = OrderedDict()   # frame key -> pixels
+_cache_lock = threading.Lock()
+
+
+def render_frame(frame, width=SIGN_WIDTH, height=SIGN_HEIGHT, key=None):
+    """`frame` as width*height bytes, 1 for a lit LED; raises PreviewError."""
+    key = key or frame_key(frame, width, height)
+    with _cache_lock:
+        pixels = _cache.get(key)
+        if pixels is not None:
+            _cache.move_to_end(key)
+            return pixels
+    pixels = _render(frame, width, height)
+    with _cache_lock:
+        _cache[key] = pixels
+        while len(_cache) > PREVIEW_CACHE:
+            _cache.popitem(last=False)
+    return pixels
+
+
+# ── PNG encoding ──────────────────────────────────────────────────
+
+def _chunk(tag, data):
+    return (struct.pack(">I", len(data)) + tag + data
+            + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF))
+
+
+def _image_data(pixels, width, height, scale):
+    rows = []
+    for r in range(height):
+        row = bytes(p for p in pixels[r * width:(r + 1) * width] for _ in range(scale))
+        rows.extend([b"\x00" + row] * scale)
+    return zlib.compress(b"".join(rows), 9)
+
+
+def _header(width, height, frames):
+    out = [b"\x89PNG\r\n\x1a\n",
+           _chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 3, 0, 0, 0))]
+    if frames > 1:
+        out.append(_chunk(b"acTL", struct.pack(">II", frames, 0)))   # loop forever
+    out.append(_chunk(b"PLTE", bytes(LED_OFF + LED_ON)))
+    return out
+
+
+def encode_png(pixels, width=SIGN_WIDTH, height=SIGN_HEIGHT, scale=1):
+    out = _header(width * scale, height * scale, 1)
+    out += [_chunk(b"IDAT", _image_data(pixels, width, height, scale)), _chunk(b"IEND", b"")]
+    return b"".join(out)
+
+
+def encode_apng(frames, width=SIGN_WIDTH, height=SIGN_HEIGHT, scale=1):
+    """Animated PNG from [(pixels, seconds to show), ...]; a plain PNG if only one."""
+    if len(frames) == 1:
+        return encode_png(frames[0][0], width, height, scale)
+    w, h = width * scale, height * scale
+    out  = _header(w, h, len(frames))
+    seq  = 0
+    for i, (pixels, seconds) in enumerate(frames):
+        delay = min(max(int(round(seconds * 1000)), 1), 65535)
+        out.append(_chunk(b"fcTL", struct.pack(">IIIIIHHBB", seq, w, h, 0, 0, delay, 1000, 0, 0)))
+        seq += 1
+        data = _image_data(pixels, width, height, scale)
+        if i == 0:
+            out.append(_chunk(b"IDAT", data))
+        else:
+            out.append(_chunk(b"fdAT", struct.pack(">I", seq) + data))
+            seq += 1
+    out.append(_chunk(b"IEND", b""))
+    return b"".join(out)
+
+
+def render_message(msg, scale=1, width=SIGN_WIDTH, height=SIGN_HEIGHT):
+    """A whole message as an animated PNG; raises PreviewError."""
+    frames = []
+    for frame in msg.frames or ():
+        try:
+            hold = frame.hold_seconds
+        except InvalidMessage:
+            hold = None
+        frames.append((render_frame(frame, width, height), hold if hold else 5))
+    if not frames:
+        raise PreviewError("message has no frames")
+    return encode_apng(frames, width, height, scale)
@@ -0,0 +1,182 @@
+"""
+State shared between worker processes for DAK Sign Controller.
+Run under a multi-process server (see gunicorn.conf.py), every worker has
+its own sign clients, caches and background threads. This module keeps what
+they must agree on in one SQLite file: sign settings, version counters
+that tell a worker its cached message list is out of date, leases so
+that only one process at a time logs in to a sign or runs a given
+background job, and the latest status that job polled. (Users are in
+auth.py's own file, which every worker reads.)
+
+Until init_shared() is called everything here is a no-op, so a single
+process (python app.py) behaves exactly as before.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+LEASE_POLL = 0.2   # seconds between tries while waiting for a lease
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS signs (
+    name     TEXT PRIMARY KEY,
+    ip       TEXT NOT NULL,
+    username TEXT NOT NULL,
+    password TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS versions (
+    key   TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    key     TEXT PRIMARY KEY,
+    holder  TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    key  TEXT PRIMARY KEY,
+    body TEXT NOT NULL
+);
+"""
+
+_db    = None
+_lock  = threading.Lock()
+active = False
+
+
+def init_shared(path):
+    """Open (creating if need be) the shared state file; call once per process."""
+    global _db, active
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA busy_timeout=30000")
+    db.executescript(_SCHEMA)
+    _db, active = db, True
+    log.info("shared state in %s (pid %d)", path, os.getpid())
+
+
+def _query(sql, args=()):
+    with _lock:
+        return _db.execute(sql, args).fetchall()
+
+
+def _write(sql, args=()):
+    with _lock:
+        return _db.execute(sql, args).rowcount
+
+
+# ── Versions ──────────────────────────────────────────────────────
+
+def version(key):
+    """Current value of a change counter; 0 if never bumped or not shared."""
+    if not active:
+        return 0
+    rows = _query("SELECT value FROM versions WHERE key = ?", (key,))
+    return rows[0][0] if rows else 0
+
+
+def bump(key):
+    """Increment a change counter and return its new value (None if not shared)."""
+    if not active:
+        return None
+    return _query("INSERT INTO versions (key, value) VALUES (?, 1) ON CONFLICT(key)"
+                  " DO UPDATE SET value = value + 1 RETURNING value", (key,))[0][0]
+
+
+# ── Leases ────────────────────────────────────────────────────────
+
+def _holder():
+    return f"{os.getpid()}:{threading.get_ident()}"
+
+
+def try_lease(key, ttl):
+    """Take `key` for `ttl` seconds unless another holder has it; True if ours."""
+    now = time.time()
+    return _write("INSERT INTO leases (key, holder, expires) VALUES (?, ?, ?) ON CONFLICT(key)"
+                  " DO UPDATE SET holder = excluded.holder, expires = excluded.expires"
+                  " WHERE leases.expires < ? OR leases.holder = excluded.holder",
+                  (key, _holder(), now + ttl, now)) == 1
+
+
+def release_lease(key):
+    _write("DELETE FROM leases WHERE key = ? AND holder = ?", (key, _holder()))
+
+
+@contextmanager
+def lease(key, ttl, wait=0):
+    """Hold `key` across processes for the block, waiting up to `wait` seconds
+    for it. Yields whether it was taken; always True when not shared."""
+    if not active:
+        yield True
+        return
+    deadline = time.monotonic() + wait
+    held = try_lease(key, ttl)
+    while not held and time.monotonic() < deadline:
+        time.sleep(LEASE_POLL)
+        held = try_lease(key, ttl)
+    try:
+        yield held
+    finally:
+        if held:
+            release_lease(key)
+
+
+# ── Snapshots ─────────────────────────────────────────────────────
+
+def put_snapshot(key, value):
+    """Publish a JSON value (e.g. a polled status entry) for the other workers."""
+    if active:
+        _write("INSERT INTO snapshots VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET"
+               " body = excluded.body", (key, json.dumps(value)))
+
+
+def get_snapshot(key):
+    """The value last published under `key`, or None."""
+    if not active:
+        return None
+    rows = _query("SELECT body FROM snapshots WHERE key = ?", (key,))
+    return json.loads(rows[0][0]) if rows else None
+
+
+# ── Signs ─────────────────────────────────────────────────────────
+
+def seed_signs(signs):
+    """Store {name: (ip, username, password)} for signs not stored yet.
+    Once stored, a sign's settings only change through save_sign()."""
+    for name, (ip, username, password) in signs.items():
+        _write("INSERT OR IGNORE INTO signs VALUES (?, ?, ?, ?)", (name, ip, username, password))
+    bump("signs")
+
+
+def load_signs():
+    return {name: (ip, username, password)
+            for name, ip, username, password in _query("SELECT * FROM signs ORDER BY rowid")}
+
+
+def save_sign(name, ip, username, password):
+    _write("INSERT INTO signs VALUES (?, ?, ?, ?) ON CONFLICT(name) DO UPDATE SET"
+           " ip = excluded.ip, username = excluded.username, password = excluded.password",
+           (name, ip, username, password))
+    return bump("signs")
+
+
+def delete_sign(name):
+    _write("DELETE FROM signs WHERE name = ?", (name,))
+    return bump("signs")
+
+
+def describe():
+    if not active:
+        return {"active": False}
+    return {"active": True, "pid": os.getpid(),
+            "versions": dict(_query("SELECT key, value FROM versions")),
+            "leases": [{"key": k, "holder": h, "expires_in": round(e - time.time(), 1)}
+                       for k, h, e in _query("SELECT * FROM leases WHERE expires > ?",
+                                             (time.time(),))]}
@@ -0,0 +1,923 @@
+"""
+ECCB sign client for DAK Sign Controller.
+Each SignClient owns its own requests.Session, login state and message cache,
+so any number of signs can be driven from one process without shared globals.
+Fleet-wide operations fan out over a bounded thread pool.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+from requests.auth import HTTPBasicAuth
+
+import metrics
+import shared
+from logs import payloads
+from messages import diff_messages
+from model import parse_messages
+from msgindex import index_for
+from policy import Policy, PoolBusy, make_adapter
+
+log = logging.getLogger(__name__)
+
+FLEET_WORKERS = 8   # max concurrent sign calls for fleet-wide operations
+
+# Circuit breaker: after BREAKER_THRESHOLD consecutive connection failures (or
+# one failed login) calls to a sign fail fast with SignOffline. After a backoff
+# that doubles on every failed probe, one caller runs a cheap probe request.
+BREAKER_THRESHOLD   = 3
+BREAKER_BACKOFF     = 5     # seconds, first retry delay
+BREAKER_MAX_BACKOFF = 300   # seconds
+PROBE_TIMEOUT       = 3     # seconds
+
+BATCH_WRITE_WIDTH = 3   # concurrent writes to one sign during a batch
+
+# With several worker processes (shared.py), one logs in at a time and the
+# rest pick up the cookies it saved rather than logging in over it.
+LOGIN_LEASE = 150   # seconds; longer than a login's two 60 s requests
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def strip_bom(raw_bytes):
+    text = raw_bytes.decode("utf-8-sig").strip()
+    while text.startswith("\ufeff"):
+        text = text.lstrip("\ufeff").strip()
+    return text
+
+
+class SignOffline(requests.exceptions.ConnectionError):
+    """Raised without touching the network while a sign's breaker is open."""
+
+    def __init__(self, name, since):
+        self.since = since
+        stamp = datetime.fromtimestamp(since).strftime("%Y-%m-%d %H:%M:%S")
+        super().__init__(f"Sign '{name}' offline since {stamp}")
+
+    @property
+    def since_iso(self):
+        return datetime.fromtimestamp(self.since).astimezone().isoformat(timespec="seconds")
+
+
+class CircuitBreaker:
+    """Tracks whether a sign is reachable and fails fast while it is not.
+
+    Closed: calls go through. BREAKER_THRESHOLD consecutive failures, or a
+    trip(), open it. Open: check() raises SignOffline until the backoff has
+    passed; then exactly one caller runs probe() (half-open). Success closes
+    the breaker, failure re-opens it with double the backoff.
+    """
+
+    def __init__(self, name, probe):
+        self.name       = name
+        self._probe     = probe
+        self._lock      = threading.Lock()
+        self._failures  = 0
+        self._probing   = False
+        self.opened_at  = None   # wall-clock time the sign went offline
+        self._retry_at  = 0.0    # monotonic time of the next probe
+        self._backoff   = BREAKER_BACKOFF
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def check(self):
+        """Raise SignOffline if the sign is known to be down."""
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if self._probing or time.monotonic() < self._retry_at:
+                raise SignOffline(self.name, self.opened_at)
+            self._probing = True
+        try:
+            ok = self._probe()
+        except Exception:
+            ok = False
+        with self._lock:
+            self._probing = False
+            if ok:
+                log.info("[%s] probe succeeded, sign back online", self.name)
+                self._close()
+                return
+            self._backoff  = min(self._backoff * 2, BREAKER_MAX_BACKOFF)
+            self._retry_at = time.monotonic() + self._backoff
+            raise SignOffline(self.name, self.opened_at)
+
+    def record_success(self):
+        if self._failures or self.opened_at is not None:
+            with self._lock:
+                self._close()
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= BREAKER_THRESHOLD:
+                self._open()
+
+    def trip(self):
+        with self._lock:
+            self._open()
+
+    def reset(self):
+        with self._lock:
+            self._close()
+
+    def _open(self):
+        if self.opened_at is not None:
+            return
+        log.warning("[%s] sign unreachable, failing fast for %ss", self.name, self._backoff)
+        self.opened_at = time.time()
+        self._retry_at = time.monotonic() + self._backoff
+
+    def _close(self):
+        self._failures = 0
+        self.opened_at = None
+        self._backoff  = BREAKER_BACKOFF
+
+    def describe(self):
+        return {"online": self.opened_at is None,
+                "offline_since": self.opened_at,
+                "retry_in": max(0.0, round(self._retry_at - time.monotonic(), 1))
+                            if self.opened_at is not None else None}
+
+
+class _Flight:
+    """One in-progress operation whose result several threads can wait on."""
+
+    def __init__(self):
+        self._done  = threading.Event()
+        self.result = None
+
+    def finish(self, result):
+        self.result = result
+        self._done.set()
+
+    def wait(self):
+        self._done.wait()
+        return self.result
+
+
+class Coalescer:
+    """Single-flight for identical reads, without ever serving stale data.
+
+    A caller never joins a request that was already on the wire when it
+    arrived, since that response may predate it. Callers arriving while a
+    read for the same key is in flight queue for the next one instead, which
+    starts as soon as the current one finishes and answers all of them. So
+    there is at most one upstream read per key at a time, and every caller
+    gets a result fetched after it arrived. This holds with caching disabled.
+    """
+
+    def __init__(self):
+        self._lock      = threading.Lock()
+        self._running   = {}   # key -> _Flight on the wire
+        self._queued    = {}   # key -> _Flight waiting for the running one
+        self.calls      = 0
+        self.upstream   = 0
+        self.coalesced  = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            self.calls += 1
+            running = self._running.get(key)
+            flight  = self._queued.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                leader = False
+            elif running is not None:
+                flight = self._queued[key] = _Flight()
+                leader = True
+            else:
+                flight = self._running[key] = _Flight()
+                leader = True
+        if not leader:
+            ok, value = flight.wait()
+            if ok:
+                return value
+            raise value
+
+        if running is not None:
+            running.wait()
+            with self._lock:
+                del self._queued[key]
+                self._running[key] = flight
+        try:
+            value = fn()
+            flight.finish((True, value))
+            return value
+        except Exception as e:
+            flight.finish((False, e))
+            raise
+        finally:
+            with self._lock:
+                self.upstream += 1
+                if self._running.get(key) is flight:
+                    del self._running[key]
+
+    def stats(self):
+        return {"calls": self.calls, "upstream": self.upstream, "coalesced": self.coalesced}
+
+
+def _session_expired(r):
+    """True if a response means the sign no longer accepts our session cookie:
+    an auth-failure status, or the login page served in place of the data."""
+    if r.status_code in (401, 403):
+        return True
+    if "html" in r.headers.get("Content-Type", ""):
+        head = r.content[:4096].lower()
+        return b"login.cgi" in head or b'type="password"' in head
+    return False
+
+
+class SignClient:
+    """One ECCB controller: connection settings, session and message cache.
+
+    The ECCB PHP backend requires a valid session cookie set by login.cgi, so
+    we keep a persistent requests.Session per sign. Each session remembers the
+    base URL and settings generation it was created for: configure() swaps in
+    new settings without disturbing requests already in flight, and their
+    results are not written into the new sign's cache.
+    """
+
+    def __init__(self, name, ip, username, password, cache_ttl=30, cache_refresh=0,
+                 cookie_file=None):
+        self.name          = name
+        self.cache_ttl     = cache_ttl      # seconds, 0 disables the message cache
+        self.cache_refresh = cache_refresh  # seconds, 0 = no background refresh
+        self.cookie_file   = cookie_file    # where login cookies survive restarts
+        self._conf         = (ip, username, password)
+        self._generation   = 0
+
+        self._session_lock  = threading.Lock()
+        self._session       = None
+        self._session_valid = False
+        self._login_flight  = None
+        self.breaker        = CircuitBreaker(name, self._probe)
+        self.reads          = Coalescer()
+        self.policy         = Policy(name)   # timeouts and retries, learned per endpoint
+
+        # The cached list is never mutated in place: writes build a new list
+        # and swap it in, so callers may hold on to what get_messages() returned.
+        self._msg_cache_lock = threading.Lock()
+        self._msg_cache      = None   # list of message dicts, sign order
+        self._msg_index      = None   # msgindex.MessageIndex of the cached list
+        self._msg_cache_at   = 0.0
+        self._msg_refresher  = None
+        self._closed         = threading.Event()
+        self._msg_last_known = None   # last list read or written, kept past the TTL
+        self._msg_version    = 0      # shared change counter the cached list matches
+
+        # Whether savemessage.php replaces an existing message of the same
+        # name (rather than adding a duplicate). None until first observed.
+        self.supports_overwrite = None
+
+    # ── Settings ──────────────────────────────────────────────────
+
+    @property
+    def ip(self):
+        return self._conf[0]
+
+    @property
+    def username(self):
+        return self._conf[1]
+
+    @property
+    def password(self):
+        return self._conf[2]
+
+    @property
+    def base_url(self):
+        return f"http://{self.ip}"
+
+    def configure(self, ip=None, username=None, password=None):
+        """Point this client at new settings; the next call logs in afresh."""
+        with self._session_lock:
+            old_ip, old_user, old_pass = self._conf
+            self._conf = (ip or old_ip, username or old_user,
+                          old_pass if password is None else password)
+            self._generation   += 1
+            self._session       = None
+            self._session_valid = False
+            self._login_flight  = None
+        self.supports_overwrite = None
+        self.breaker.reset()
+        self.invalidate_messages()
+        if self.ip != old_ip:
+            with self._msg_cache_lock:
+                self._msg_last_known = None
+            self.policy.reset()   # another sign: its round trips tell us nothing
+
+    def close(self):
+        """Stop background work and drop the session's connections (the sign
+        was removed). Calls already under way finish."""
+        self._closed.set()
+        with self._session_lock:
+            session, self._session = self._session, None
+            self._session_valid = False
+        if session is not None:
+            session.close()
+
+    def describe(self):
+        return {"name": self.name, "ip": self.ip, "username": self.username,
+                **self.breaker.describe(), "reads": self.reads.stats()}
+
+    # ── Session management ────────────────────────────────────────
+
+    def _make_session(self):
+        ip, username, password = self._conf
+        s = requests.Session()
+        s.mount("http://", make_adapter())
+        s.auth        = HTTPBasicAuth(username, password)
+        s.base_url    = f"http://{ip}"
+        s.generation  = self._generation
+        s.login_epoch  = 0      # bumped on every successful login
+        s.cookie_stamp = None   # mtime of the cookie file these cookies match
+        # Cookies saved by a previous run are used as-is; if the sign has
+        # forgotten them, call() notices and logs in again.
+        self._session_valid = self._load_cookies(s)
+        return s
+
+    def _load_cookies(self, s):
+        if not self.cookie_file or not os.path.exists(self.cookie_file):
+            return False
+        try:
+            with open(self.cookie_file) as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            log.warning("[%s] ignoring unreadable cookie file: %s", self.name, e)
+            return False
+        if saved.get("base_url") != s.base_url or saved.get("username") != s.auth.username:
+            return False
+        for c in saved.get("cookies", []):
+            s.cookies.set_cookie(requests.cookies.create_cookie(
+                c["name"], c["value"], domain=c.get("domain", ""),
+                path=c.get("path", "/"), expires=c.get("expires")))
+        s.cookie_stamp = _mtime(self.cookie_file)
+        log.info("[%s] restored %d session cookie(s) from disk", self.name, len(s.cookies))
+        return bool(s.cookies)
+
+    def _save_cookies(self, s):
+        if not self.cookie_file:
+            return
+        saved = {
+            "base_url": s.base_url,
+            "username": s.auth.username,
+            "saved_at": time.time(),
+            "cookies":  [{"name": c.name, "value": c.value, "domain": c.domain,
+                          "path": c.path, "expires": c.expires} for c in s.cookies],
+        }
+        tmp = f"{self.cookie_file}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.cookie_file) or ".", exist_ok=True)
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w") as f:
+                json.dump(saved, f)
+            os.replace(tmp, self.cookie_file)
+            s.cookie_stamp = _mtime(self.cookie_file)
+        except OSError as e:
+            log.warning("[%s] could not save session cookies: %s", self.name, e)
+
+    def get_session(self):
+        """Return a logged-in session, creating/refreshing as needed.
+
+        Login is single-flight: the first caller to find the session logged out
+        performs the login outside the lock and everyone who arrives meanwhile
+        shares its outcome. Raises SignOffline if the login fails or the
+        breaker is open.
+        """
+        self.breaker.check()
+        waited = time.perf_counter()
+        with self._session_lock:
+            waited = time.perf_counter() - waited
+            metrics.lock_wait.observe(waited, sign=self.name)
+            metrics.add_timing("lock", waited)
+            if self._session is None:
+                self._session = self._make_session()
+            s = self._session
+            if self._session_valid:
+                return s
+            flight = self._login_flight
+            leader = flight is None
+            if leader:
+                flight = self._login_flight = _Flight()
+        if leader:
+            ok = self._login(s)
+            with self._session_lock:
+                if self._session is s:
+                    self._session_valid = ok
+                if self._login_flight is flight:
+                    self._login_flight = None
+            flight.finish(ok)
+        else:
+            started = time.perf_counter()
+            ok = flight.wait()
+            metrics.add_timing("login", time.perf_counter() - started)
+        if not ok:
+            raise SignOffline(self.name, self.breaker.opened_at or time.time())
+        return s
+
+    def _login(self, s):
+        """Log in, unless another worker process has just done so.
+
+        The login lease keeps worker processes from logging in over each
+        other; whoever waited for it first looks for cookies saved meanwhile.
+        """
+        with shared.lease(f"login:{self.name}", LOGIN_LEASE, wait=LOGIN_LEASE) as held:
+            if not held:
+                log.warning("[%s] another worker has been logging in for %ss; logging in anyway",
+                            self.name, LOGIN_LEASE)
+            if self._adopt_cookies(s):
+                return True
+            return self._post_login(s)
+
+    def _adopt_cookies(self, s):
+        """Take over cookies another worker saved since ours were loaded."""
+        if not shared.active or not self.cookie_file:
+            return False
+        stamp = _mtime(self.cookie_file)
+        if stamp is None or stamp == s.cookie_stamp:
+            return False
+        s.cookies.clear()
+        if not self._load_cookies(s):
+            return False
+        s.login_epoch += 1
+        log.info("[%s] using the session another worker logged in", self.name)
+        return True
+
+    def _post_login(self, s):
+        """POST credentials to login.cgi to obtain a session cookie."""
+        try:
+            # First hit cookiechecker so the sign knows we want a session
+            self._timed(s, "GET", "/cookiechecker?uri=/ECCB/index.html")
+            # Then POST to login.cgi with the credentials
+            r = self._timed(
+                s, "POST", "/login.cgi",
+                data={"username": s.auth.username, "password": s.auth.password,
+                      "uri": "/ECCB/index.html"},
+                allow_redirects=True,
+            )
+            log.info("[%s] login.cgi -> %s, cookies: %s", self.name, r.status_code, list(s.cookies.keys()))
+            metrics.sign_logins.inc(sign=self.name, result="ok")
+            s.login_epoch += 1
+            if s.generation == self._generation:
+                self.breaker.record_success()
+                self._save_cookies(s)
+            return True
+        except Exception as e:
+            log.error("[%s] Login failed: %s", self.name, e)
+            metrics.sign_logins.inc(sign=self.name, result="failed")
+            if s.generation == self._generation:
+                self.breaker.trip()
+            return False
+
+    def _probe(self):
+        """Cheap reachability check used by the breaker's half-open state."""
+        r = requests.get(f"{self.base_url}/cookiechecker?uri=/ECCB/index.html",
+                         timeout=PROBE_TIMEOUT)
+        return r.status_code < 500
+
+    def invalidate_session(self, s=None, login_epoch=None):
+        """Force the next call to log in again.
+
+        When s/login_epoch are given, only a session still on that login is
+        invalidated, so a burst of requests that all saw the same expired
+        cookie triggers one re-login rather than one each.
+        """
+        with self._session_lock:
+            if s is not None and (self._session is not s or s.login_epoch != login_epoch):
+                return
+            self._session_valid = False
+
+    def warm_up(self):
+        """Log in (or validate restored cookies) and prime the message cache
+        from a background thread, so the first user request is not the one
+        paying for the handshake."""
+        def run():
+            try:
+                self.get_messages(fresh=True)
+                log.info("[%s] warm-up complete", self.name)
+            except Exception as e:
+                log.warning("[%s] warm-up failed: %s", self.name, e)
+        threading.Thread(target=run, name=f"warm-up-{self.name}", daemon=True).start()
+
+    # ── Raw ECCB calls ────────────────────────────────────────────
+
+    def call(self, method, path, s=None, **kwargs):
+        """Send one request to the sign, feeding the circuit breaker.
+
+        If the sign answers as though our session cookie has expired, log in
+        again and retry once. A rejected request was not applied, so this is
+        safe for writes too.
+        """
+        if s is None:
+            s = self.get_session()
+        for attempt in (1, 2):
+            epoch = s.login_epoch
+            try:
+                r = self._timed(s, method, path, **kwargs)
+            except PoolBusy:
+                raise   # our own queue was full; the sign may be fine
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self.breaker.record_failure()
+                raise
+            self.breaker.record_success()
+            if attempt == 2 or not _session_expired(r):
+                return r
+            log.info("[%s] session expired (%s %s -> %s), logging in again",
+                     self.name, method, path, r.status_code)
+            self.invalidate_session(s, epoch)
+            s = self.get_session()
+
+    def _timed(self, s, method, path, timeout=None, **kwargs):
+        """One request to the sign with the timeouts and retries its Policy
+        gives the endpoint; every attempt is recorded in the metrics."""
+        def attempt(policy_timeout):
+            started = time.perf_counter()
+            try:
+                r = s.request(method, f"{s.base_url}{path}", timeout=timeout or policy_timeout,
+                              **kwargs)
+            except Exception:
+                metrics.observe_sign_call(self.name, path, started, "error")
+                raise
+            metrics.observe_sign_call(self.name, path, started, r.status_code, len(r.content))
+            return r
+
+        return self.policy.send(method, path.split("?", 1)[0], attempt)
+
+    def eccb_get(self, path):
+        """GET a syscontrol-style JSON endpoint; concurrent identical reads share one request."""
+        return self.reads.do(("GET", path), lambda: self._eccb_get(path))
+
+    def _eccb_get(self, path):
+        try:
+            r = self.call("GET", path)
+            raw = strip_bom(r.content)
+            try:
+                return json.loads(raw), r.status_code
+            except Exception:
+                return raw, r.status_code
+        except SignOffline as e:
+            return {"error": str(e), "offline_since": e.since_iso}, 503
+        except requests.exceptions.ConnectionError:
+            return {"error": "Cannot reach sign"}, 503
+        except Exception as e:
+            return {"error": str(e)}, 500
+
+    def eccb_put(self, path, data=None):
+        try:
+            r = self.call("PUT", path, json=data)
+            return r.text, r.status_code
+        except SignOffline as e:
+            return {"error": str(e), "offline_since": e.since_iso}, 503
+        except Exception as e:
+            return {"error": str(e)}, 500
+
+    # ── Messages ──────────────────────────────────────────────────
+
+    def fetch_messages(self):
+        """Fetch the message list straight from the sign, bypassing the cache."""
+        msgs, _ = self.reads.do("getmessagelist", self._fetch_messages)
+        return msgs
+
+    def _fetch_messages(self):
+        s = self.get_session()
+        r = self.call("GET", "/ECCB/getmessagelist.php", s)
+        raw = strip_bom(r.content)
+        data = json.loads(raw)
+        msgs = parse_messages(data.get("Messages") or data.get("messages") or [])
+        if payloads.active:
+            for m in msgs:
+                payloads.dump("fetched", self.name, m)
+        return msgs, s.generation
+
+    def get_messages(self, fresh=False):
+        """Return the message list, served from cache while younger than the TTL."""
+        self._ensure_message_refresher()
+        version = shared.version(f"messages:{self.name}")   # another worker may have written
+        with self._msg_cache_lock:
+            if (not fresh and self._msg_cache is not None and self._msg_version == version
+                    and time.monotonic() - self._msg_cache_at < self.cache_ttl):
+                metrics.cache_requests.inc(sign=self.name, result="hit")
+                return self._msg_cache
+        metrics.cache_requests.inc(sign=self.name, result="bypass" if fresh else "miss")
+        msgs, generation = self.reads.do("getmessagelist", self._fetch_messages)
+        with self._msg_cache_lock:
+            if generation == self._generation:
+                self._set_message_cache(msgs)
+                self._msg_version = version
+        return msgs
+
+    def find_message(self, name, fresh=False):
+        """Look up one message by name, or None."""
+        return index_for(self.get_messages(fresh=fresh)).get(name)
+
+    def last_known_messages(self):
+        """The most recent list we have, however old, or None; for use while
+        the sign can't be reached."""
+        with self._msg_cache_lock:
+            return self._msg_last_known
+
+    def invalidate_messages(self):
+        """Drop the cached list so the next read goes to the sign."""
+        with self._msg_cache_lock:
+            self._msg_cache = None
+        shared.bump(f"messages:{self.name}")
+
+    def _note_write(self):
+        """Mark other workers' copies of the list out of date after our write.
+        Ours, already patched, stays valid unless someone else wrote too."""
+        version = shared.bump(f"messages:{self.name}")
+        if version is None:
+            return
+        with self._msg_cache_lock:
+            if self._msg_version == version - 1:
+                self._msg_version = version
+
+    def _set_message_cache(self, msgs):
+        self._msg_cache      = msgs
+        self._msg_index      = index_for(msgs)
+        self._msg_cache_at   = time.monotonic()
+        self._msg_last_known = msgs
+
+    def _cache_store_message(self, msg_obj, generation):
+        """Insert or replace a message in the cached list after a successful save."""
+        with self._msg_cache_lock:
+            if self._msg_cache is None or generation != self._generation:
+                return
+            name = msg_obj.name
+            if name in self._msg_index:
+                msgs = [msg_obj if m.name == name else m for m in self._msg_cache]
+            else:
+                msgs = self._msg_cache + [msg_obj]
+            self._set_message_cache(msgs)
+
+    def _cache_drop_message(self, name, generation):
+        """Remove a message from the cached list after a successful delete."""
+        with self._msg_cache_lock:
+            if (self._msg_cache is None or generation != self._generation
+                    or name not in self._msg_index):
+                return
+            self._set_message_cache([m for m in self._msg_cache if m.name != name])
+
+    def _ensure_message_refresher(self):
+        if self.cache_refresh <= 0 or self._msg_refresher is not None or self._closed.is_set():
+            return
+        with self._msg_cache_lock:
+            if self._msg_refresher is not None:
+                return
+            self._msg_refresher = threading.Thread(
+                target=self._refresh_messages_loop,
+                name=f"message-refresh-{self.name}", daemon=True)
+            self._msg_refresher.start()
+
+    def _refresh_messages_loop(self):
+        while not self._closed.wait(self.cache_refresh):
+            try:
+                self.get_messages(fresh=True)
+            except Exception as e:
+                log.warning("[%s] background message refresh failed: %s", self.name, e)
+
+    def save_message_obj(self, msg_obj):
+        """POST message to savemessage.php.
+
+        Confirmed from Fiddler capture of native UI:
+        - Content-Type: application/x-www-form-urlencoded
+        - Field name: 'json'
+        - Value: JSON-serialized message object
+        - Success response: BOM-only (0 bytes after stripping BOM) with HTTP 200
+          (BOM-only IS the success indicator — the sign does not return {"Status":"OK"})
+        """
+        msg_json = json.dumps(msg_obj.to_eccb())
+        s = self.get_session()
+        headers = {
+            "X-Requested-With": "XMLHttpRequest",
+            "Referer": f"{s.base_url}/ECCB/EditMessage.html",
+            "Origin": s.base_url,
+            "Accept": "application/json, text/javascript, */*; q=0.01",
+        }
+        r = self.call(
+            "POST", "/ECCB/savemessage.php", s,
+            data={"json": msg_json},
+            headers=headers,
+        )
+        log.info("[%s] savemessage status=%s bytes=%d", self.name, r.status_code, len(r.content))
+        if r.ok:
+            self._cache_store_message(msg_obj, s.generation)
+            self._note_write()
+        else:
+            self.invalidate_messages()
+        return strip_bom(r.content), r.status_code
+
+    def delete_message_by_name(self, name):
+        """Delete via POST to deletemessage.php.
+
+        Confirmed from Fiddler capture of native UI:
+        - Method: POST
+        - Content-Type: application/x-www-form-urlencoded
+        - Field name: 'Message'
+        - Value: 'name.vmpl'  (filename with .vmpl extension, not just the name)
+        - Success response: BOM-only with HTTP 200
+        """
+        s = self.get_session()
+        headers = {
+            "X-Requested-With": "XMLHttpRequest",
+            "Referer": f"{s.base_url}/ECCB/EditMessage.html",
+            "Accept": "*/*",
+        }
+        filename = f"{name}.vmpl"
+        r = self.call(
+            "POST", "/ECCB/deletemessage.php", s,
+            data={"Message": filename},
+            headers=headers,
+        )
+        log.info("[%s] deletemessage POST %r -> %s: %r", self.name, filename, r.status_code, r.content[:200])
+        if r.ok:
+            self._cache_drop_message(name, s.generation)
+            self._note_write()
+        else:
+            self.invalidate_messages()
+        return strip_bom(r.content), r.status_code
+
+    def replace_message(self, current, msg):
+        """Write `msg` in place of `current` with as few sign writes as possible.
+
+        Nothing is sent if the two are structurally equal. A rename saves the
+        new name before deleting the old one, and a same-name change is saved
+        in place once the sign is known to overwrite, so the message never
+        disappears mid-update. The first in-place save re-reads the list to
+        learn whether overwrite works; if not, delete-then-save is used.
+
+        Returns (result text, status code, action, changed paths) with action
+        one of "unchanged", "saved", "replaced" or "renamed".
+        """
+        changes = diff_messages(current, msg)
+        if not changes:
+            return "", 200, "unchanged", changes
+        old_name = current.name
+
+        if msg.name != old_name:
+            text, code = self.save_message_obj(msg)
+            if 200 <= code < 300:
+                del_text, del_code = self.delete_message_by_name(old_name)
+                if not 200 <= del_code < 300:
+                    log.warning("[%s] renamed %r but could not delete it: %s %s",
+                                self.name, old_name, del_code, del_text[:100])
+            return text, code, "renamed", changes
+
+        if self.supports_overwrite is not False:
+            text, code = self.save_message_obj(msg)
+            if self.supports_overwrite or not 200 <= code < 300:
+                return text, code, "saved", changes
+            if self._learn_overwrite(msg, changes):
+                return text, code, "saved", changes
+
+        self.delete_message_by_name(old_name)
+        text, code = self.save_message_obj(msg)
+        return text, code, "replaced", changes
+
+    def _learn_overwrite(self, msg, changes):
+        """After a first in-place save, check the sign holds exactly one copy
+        of the message with our changes applied, and remember the answer."""
+        same = [m for m in self.get_messages(fresh=True) if m.name == msg.name]
+        ok = len(same) == 1 and not set(diff_messages(msg, same[0])) & set(changes)
+        self.supports_overwrite = ok
+        log.info("[%s] savemessage.php %s existing messages",
+                 self.name, "overwrites" if ok else "does not overwrite")
+        return ok
+
+    def write_batch(self, deletes, saves, existing=()):
+        """Write a planned batch a few messages at a time.
+
+        `deletes` are names to remove, `saves` messages to write, `existing`
+        the names already on the sign. Changed messages are saved in place if
+        the sign is known to overwrite, otherwise deleted first; removals go
+        last so a renamed message is never missing. Writes go out
+        BATCH_WRITE_WIDTH at a time over the session's keep-alive connections,
+        and a failed delete does not stop the save that follows it.
+
+        Returns {message name: [{"op", "ok", "status", "result"/"error"}, ...]}.
+        """
+        writes = {}
+
+        def run(phase, name, fn, arg):
+            try:
+                text, code = fn(arg)
+                entry = {"op": phase, "ok": 200 <= code < 300, "status": code, "result": text}
+            except SignOffline as e:
+                entry = {"op": phase, "ok": False, "status": 503, "error": str(e)}
+            except requests.exceptions.ConnectionError:
+                entry = {"op": phase, "ok": False, "status": 503, "error": "Cannot reach sign"}
+            except Exception as e:
+                entry = {"op": phase, "ok": False, "status": 500, "error": str(e)}
+            writes.setdefault(name, []).append(entry)
+
+        replaced = [] if self.supports_overwrite else [
+            m.name for m in saves if m.name in existing]
+        phases = [[("delete", n, self.delete_message_by_name, n) for n in replaced],
+                  [("save", m.name, self.save_message_obj, m) for m in saves],
+                  [("delete", n, self.delete_message_by_name, n) for n in deletes]]
+        with ThreadPoolExecutor(max_workers=BATCH_WRITE_WIDTH,
+                                thread_name_prefix=f"batch-{self.name}") as pool:
+            for tasks in phases:
+                for f in [pool.submit(run, *t) for t in tasks]:
+                    f.result()
+        return writes
+
+    def reorder_messages(self, data):
+        """POST a new schedule order to updateMessageSchedulePosition.php."""
+        self.invalidate_messages()
+        r = self.call("POST", "/ECCB/updateMessageSchedulePosition.php", data=data)
+        return r.text, r.status_code
+
+    def set_message_order(self, names):
+        """Put the messages in the order of `names` (every message, first to last).
+
+        Not yet confirmed from a capture: sent like deletemessage.php's
+        field, as the .vmpl file names in a JSON array.
+        """
+        self.invalidate_messages()
+        r = self.call("POST", "/ECCB/updateMessageSchedulePosition.php",
+                      data={"Messages": json.dumps([f"{n}.vmpl" for n in names])})
+        log.info("[%s] reorder %d messages -> %s", self.name, len(names), r.status_code)
+        return strip_bom(r.content), r.status_code
+
+
+# ── Registry ──────────────────────────────────────────────────────
+
+_signs      = {}
+_signs_lock = threading.Lock()
+
+
+def add_sign(client):
+    with _signs_lock:
+        _signs[client.name] = client
+    return client
+
+
+def remove_sign(name):
+    with _signs_lock:
+        return _signs.pop(name, None)
+
+
+def get_sign(name):
+    return _signs.get(name)
+
+
+def all_signs():
+    with _signs_lock:
+        return list(_signs.values())
+
+
+# ── Fleet operations ──────────────────────────────────────────────
+
+_pool = ThreadPoolExecutor(max_workers=FLEET_WORKERS, thread_name_prefix="fleet")
+
+
+def fan_out(clients, fn):
+    """Run fn(client) for every client on the fleet pool.
+
+    Returns {sign name: {"ok": True, "result": ...} or {"ok": False, "error": ...}},
+    once the slowest sign has answered. fn must not itself call fan_out().
+    """
+    futures = {c.name: _pool.submit(fn, c) for c in clients}
+    results = {}
+    for name, fut in futures.items():
+        try:
+            results[name] = {"ok": True, "result": fut.result()}
+        except SignOffline as e:
+            results[name] = {"ok": False, "error": str(e)}
+        except requests.exceptions.ConnectionError:
+            results[name] = {"ok": False, "error": "Cannot reach sign"}
+        except Exception as e:
+            results[name] = {"ok": False, "error": str(e)}
+    return results
+
+
+def _collect_metrics():
+    """Per-sign gauges and counters that live on the clients themselves."""
+    clients = all_signs()
+    lines = ["# HELP dak_sign_online 1 if the sign's circuit breaker is closed.",
+             "# TYPE dak_sign_online gauge"]
+    lines += [f'dak_sign_online{{sign="{c.name}"}} {0 if c.breaker.is_open else 1}' for c in clients]
+    for field, help in (("calls", "Coalescable reads requested."),
+                        ("upstream", "Coalescable reads actually sent to the sign."),
+                        ("coalesced", "Reads answered by another caller's request.")):
+        lines += [f"# HELP dak_sign_reads_{field}_total {help}",
+                  f"# TYPE dak_sign_reads_{field}_total counter"]
+        lines += [f'dak_sign_reads_{field}_total{{sign="{c.name}"}} {c.reads.stats()[field]}'
+                  for c in clients]
+    return lines
+
+
+metrics.add_collector(_collect_metrics)
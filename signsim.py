@@ -0,0 +1,430 @@
+"""
+Stand-in for a Daktronics ECCB controller, for testing without a sign.
+
+    python signsim.py [--port 8081] [--cassette FILE] [--record http://SIGN_IP]
+                      [--scale 1.0] [--delay 0] [--drop 0] [--session-ttl 0]
+                      [--single-session] [--concurrency 0]
+
+Serves the part of the ECCB surface this app uses: cookiechecker, login.cgi,
+getmessagelist.php (BOM-prefixed), savemessage.php, deletemessage.php,
+updateMessageSchedulePosition.php and the syscontrol status, configuration,
+dimming and datetime endpoints. Point SIGN_IP at 127.0.0.1:8081.
+
+With --record the simulator is a proxy: every exchange with the real sign
+is passed through and appended to the cassette (a JSONL file; passwords,
+cookies and auth headers are left out). Without it, a cassette seeds the
+simulated sign: the last message list and syscontrol responses recorded
+become its starting state, and each endpoint answers after a delay drawn
+from the latencies recorded for it. Writes change the simulated state, so a
+save followed by a list read behaves as on a real sign.
+
+Faults can be set on the command line or while running, with
+POST /_sim/faults {"scale": 3, "drop": 0.1, "session_ttl": 60}:
+  scale, delay     multiply recorded latency, then add a fixed delay (seconds)
+  drop             fraction of requests whose connection is cut with no answer
+  session_ttl      seconds a login cookie lasts (0: forever)
+  single_session   a new login ends every earlier session, as some signs do
+  concurrency      requests served at once (0: unlimited); others queue
+POST /_sim/expire ends every session now; GET /_sim/state shows the sign.
+"""
+import argparse
+import base64
+import json
+import logging
+import random
+import secrets
+import socket
+import threading
+import time
+from statistics import median
+from urllib.parse import urlsplit
+
+import requests
+from flask import Flask, Response, jsonify, redirect, request
+
+log = logging.getLogger("signsim")
+
+BOM             = "\ufeff"
+DEFAULT_LATENCY = 0.05   # seconds, for endpoints with nothing recorded
+SESSION_COOKIE  = "sid"
+SYSCONTROL      = "/daktronics/syscontrol/1.0/"
+REDACTED        = {"password"}
+
+LOGIN_PAGE = """<html><body><form action="/login.cgi" method="post">
+<input name="username"><input type="password" name="password">
+<input type="hidden" name="uri" value="/ECCB/index.html"></form></body></html>"""
+
+DEFAULT_SYSCONTROL = {
+    "status":        {"Temperature": 35.0, "Brightness": 80, "FanOk": True, "Healthy": True},
+    "configuration": {"Width": 72, "Height": 32, "Name": "Simulated sign"},
+    "configuration/output/0/dimming": {"Mode": "Auto", "Level": 80},
+}
+
+
+def _key(method, path):
+    """Cassette/latency key for an exchange: method and path without the query."""
+    return f"{method} {path.split('?', 1)[0]}"
+
+
+def _bom_prefix(text):
+    return text[:len(text) - len(text.lstrip(BOM))]
+
+
+# ── Cassettes ─────────────────────────────────────────────────────
+
+class Cassette:
+    """Recorded exchanges with a sign, one JSON object per line."""
+
+    def __init__(self, path):
+        self.path      = path
+        self.exchanges = []
+        self._lock     = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        cassette = cls(path)
+        with open(path, encoding="utf-8") as f:
+            cassette.exchanges = [json.loads(line) for line in f if line.strip()]
+        return cassette
+
+    def append(self, exchange):
+        with self._lock:
+            self.exchanges.append(exchange)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(exchange, separators=(",", ":")) + "\n")
+
+    @staticmethod
+    def body(exchange):
+        if "body_b64" in exchange:
+            return base64.b64decode(exchange["body_b64"]).decode("utf-8", "replace")
+        return exchange.get("body", "")
+
+    def latencies(self):
+        """{key: [seconds, ...]} for every endpoint in the cassette."""
+        out = {}
+        for ex in self.exchanges:
+            out.setdefault(_key(ex["method"], ex["path"]), []).append(ex["latency"])
+        return out
+
+    def latest(self, method, path):
+        """The last successful exchange for an endpoint, or None."""
+        for ex in reversed(self.exchanges):
+            if _key(ex["method"], ex["path"]) == _key(method, path) and ex["status"] == 200:
+                return ex
+        return None
+
+
+# ── Simulator ─────────────────────────────────────────────────────
+
+class SignSimulator:
+    """A simulated ECCB controller, or (with `upstream`) a recording proxy."""
+
+    def __init__(self, cassette=None, upstream=None, username="Dak", password="DakPassword",
+                 scale=1.0, delay=0.0, drop=0.0, session_ttl=0, single_session=False,
+                 concurrency=0):
+        self.cassette    = cassette
+        self.upstream    = upstream.rstrip("/") if upstream else None
+        self.username    = username
+        self.password    = password
+        self.faults      = {"scale": scale, "delay": delay, "drop": drop,
+                            "session_ttl": session_ttl, "single_session": single_session}
+        self.concurrency = concurrency
+        self.stats       = {"requests": 0, "dropped": 0, "logins": 0, "expired": 0}
+        self.cookie      = SESSION_COOKIE
+        self.messages    = []               # ECCB message dicts, in schedule order
+        self.syscontrol  = json.loads(json.dumps(DEFAULT_SYSCONTROL))
+        self.bom         = BOM
+        self._sessions   = {}               # cookie value -> login time
+        self._latency    = {}               # "METHOD /path" -> recorded seconds
+        self._lock       = threading.Lock()
+        self._slots      = threading.BoundedSemaphore(concurrency) if concurrency else None
+        self._http       = requests.Session() if upstream else None
+        if cassette is not None and upstream is None:
+            self._seed(cassette)
+        self.app = self._make_app()
+
+    def _seed(self, cassette):
+        self._latency = cassette.latencies()
+        listing = cassette.latest("GET", "/ECCB/getmessagelist.php")
+        if listing is not None:
+            text = Cassette.body(listing)
+            self.bom = _bom_prefix(text) or BOM
+            data = json.loads(text.lstrip(BOM).strip() or "{}")
+            self.messages = data.get("Messages") or data.get("messages") or []
+        for key in self._latency:
+            method, path = key.split(" ", 1)
+            if method == "GET" and path.startswith(SYSCONTROL):
+                ex = cassette.latest("GET", path)
+                if ex is not None:
+                    try:
+                        self.syscontrol[path[len(SYSCONTROL):]] = json.loads(
+                            Cassette.body(ex).lstrip(BOM) or "null")
+                    except ValueError:
+                        pass
+        for ex in cassette.exchanges:
+            if ex["path"] == "/login.cgi" and ex.get("set_cookie"):
+                self.cookie = ex["set_cookie"][0]
+        log.info("seeded from %s: %d messages, %d endpoints with recorded latency",
+                 cassette.path, len(self.messages), len(self._latency))
+
+    # ── Faults ────────────────────────────────────────────────────
+
+    def set_faults(self, **faults):
+        unknown = set(faults) - set(self.faults) - {"concurrency"}
+        if unknown:
+            raise ValueError(f"unknown fault(s): {', '.join(sorted(unknown))}")
+        if "concurrency" in faults:
+            self.concurrency = int(faults.pop("concurrency"))
+            self._slots = threading.BoundedSemaphore(self.concurrency) if self.concurrency else None
+        self.faults.update(faults)
+
+    def expire_sessions(self):
+        with self._lock:
+            n = len(self._sessions)
+            self._sessions.clear()
+        self.stats["expired"] += n
+        return n
+
+    def _latency_for(self, method, path):
+        recorded = self._latency.get(_key(method, path))
+        if recorded:
+            base = random.choice(recorded)
+        elif self._latency:
+            base = median(x for xs in self._latency.values() for x in xs)
+        else:
+            base = DEFAULT_LATENCY
+        return base * self.faults["scale"] + self.faults["delay"]
+
+    def _drop(self):
+        """Cut the connection without an answer, as a sign that has gone away does."""
+        self.stats["dropped"] += 1
+        sock = request.environ.get("werkzeug.socket")
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        return Response(status=500)   # never reaches the client
+
+    # ── Sessions ──────────────────────────────────────────────────
+
+    def _login(self):
+        if (request.form.get("username") != self.username
+                or request.form.get("password") != self.password):
+            return Response(LOGIN_PAGE, status=200, mimetype="text/html")
+        sid = secrets.token_hex(16)
+        with self._lock:
+            if self.faults["single_session"]:
+                self.stats["expired"] += len(self._sessions)
+                self._sessions.clear()
+            self._sessions[sid] = time.monotonic()
+        self.stats["logins"] += 1
+        resp = redirect(request.form.get("uri") or "/ECCB/index.html")
+        resp.set_cookie(self.cookie, sid, httponly=True)
+        return resp
+
+    def _logged_in(self):
+        sid = request.cookies.get(self.cookie)
+        with self._lock:
+            started = self._sessions.get(sid)
+            if started is None:
+                return False
+            ttl = self.faults["session_ttl"]
+            if ttl and time.monotonic() - started > ttl:
+                del self._sessions[sid]
+                self.stats["expired"] += 1
+                return False
+        return True
+
+    def _basic_auth_ok(self):
+        auth = request.authorization
+        return auth is not None and (auth.username, auth.password) == (self.username, self.password)
+
+    # ── ECCB ──────────────────────────────────────────────────────
+
+    def _eccb(self, text=""):
+        return Response((self.bom + text).encode("utf-8"), mimetype="application/json")
+
+    def _find(self, name):
+        return next((i for i, m in enumerate(self.messages) if m.get("Name") == name), None)
+
+    def _handle(self, path):
+        method = request.method
+        if path == "cookiechecker":
+            return Response("<html><body>OK</body></html>", mimetype="text/html")
+        if path == "login.cgi" and method == "POST":
+            return self._login()
+        if path == "ECCB/index.html":
+            return Response("<html><body>ECCB</body></html>", mimetype="text/html")
+
+        if path.startswith(SYSCONTROL[1:]):
+            if not (self._logged_in() or self._basic_auth_ok()):
+                return Response("Unauthorized", status=401)
+            return self._syscontrol(path[len(SYSCONTROL) - 1:], method)
+
+        if not self._logged_in():
+            return Response(LOGIN_PAGE, mimetype="text/html")
+        with self._lock:
+            if path == "ECCB/getmessagelist.php":
+                return self._eccb(json.dumps({"Messages": self.messages}))
+            if path == "ECCB/savemessage.php" and method == "POST":
+                try:
+                    msg = json.loads(request.form.get("json", ""))
+                except ValueError:
+                    return Response("Bad message", status=400)
+                i = self._find(msg.get("Name"))
+                if i is None:
+                    self.messages.append(msg)
+                else:
+                    self.messages[i] = msg
+                return self._eccb()
+            if path == "ECCB/deletemessage.php" and method == "POST":
+                name = request.form.get("Message", "")
+                i = self._find(name[:-5] if name.endswith(".vmpl") else name)
+                if i is not None:
+                    del self.messages[i]
+                return self._eccb()
+            if path == "ECCB/updateMessageSchedulePosition.php" and method == "POST":
+                try:
+                    order = [n[:-5] if n.endswith(".vmpl") else n
+                             for n in json.loads(request.form.get("Messages", "[]"))]
+                except ValueError:
+                    return Response("Bad order", status=400)
+                rank = {n: i for i, n in enumerate(order)}
+                self.messages.sort(key=lambda m: rank.get(m.get("Name"), len(rank)))
+                return self._eccb()
+        return Response("Not found", status=404)
+
+    def _syscontrol(self, path, method):
+        if path == "datetime" and method == "PUT":
+            self.syscontrol["datetime"] = {"Time": request.args.get("Time")}
+            return Response("", status=200)
+        if path not in self.syscontrol:
+            return Response("Not found", status=404)
+        if method == "PUT":
+            body = request.get_json(silent=True)
+            if isinstance(body, dict) and isinstance(self.syscontrol[path], dict):
+                self.syscontrol[path].update(body)
+            return Response("", status=200)
+        return jsonify(self.syscontrol[path])
+
+    # ── Recording proxy ───────────────────────────────────────────
+
+    def _proxy(self, path):
+        url     = f"{self.upstream}/{path}"
+        headers = {k: v for k, v in request.headers.items()
+                   if k.lower() not in ("host", "content-length", "accept-encoding")}
+        started = time.perf_counter()
+        r = self._http.request(request.method, url, params=request.args, data=request.get_data(),
+                               headers=headers, allow_redirects=False, timeout=120)
+        latency = time.perf_counter() - started
+
+        exchange = {"t": time.time(), "method": request.method, "path": "/" + path,
+                    "query": request.query_string.decode(), "status": r.status_code,
+                    "content_type": r.headers.get("Content-Type", ""),
+                    "latency": round(latency, 4), "set_cookie": list(r.cookies.keys())}
+        if request.form:
+            exchange["form"] = {k: "***" if k in REDACTED else v for k, v in request.form.items()}
+        try:
+            exchange["body"] = r.content.decode("utf-8")
+        except UnicodeDecodeError:
+            exchange["body_b64"] = base64.b64encode(r.content).decode()
+        self.cassette.append(exchange)
+
+        resp = Response(r.content, status=r.status_code)
+        for k, v in r.headers.items():
+            if k.lower() in ("content-type", "location", "set-cookie"):
+                if k.lower() == "location" and v.startswith(self.upstream):
+                    v = v[len(self.upstream):] or "/"
+                resp.headers.add(k, v)
+        return resp
+
+    # ── Flask app ─────────────────────────────────────────────────
+
+    def _make_app(self):
+        app = Flask("signsim")
+
+        @app.route("/_sim/state")
+        def sim_state():
+            with self._lock:
+                sessions = len(self._sessions)
+            return jsonify({"mode": "record" if self.upstream else "simulate",
+                            "faults": {**self.faults, "concurrency": self.concurrency},
+                            "stats": self.stats, "sessions": sessions,
+                            "messages": [m.get("Name") for m in self.messages],
+                            "syscontrol": self.syscontrol})
+
+        @app.route("/_sim/faults", methods=["POST"])
+        def sim_faults():
+            try:
+                self.set_faults(**(request.get_json(silent=True) or {}))
+            except (ValueError, TypeError) as e:
+                return jsonify({"error": str(e)}), 400
+            return jsonify({**self.faults, "concurrency": self.concurrency})
+
+        @app.route("/_sim/expire", methods=["POST"])
+        def sim_expire():
+            return jsonify({"expired": self.expire_sessions()})
+
+        @app.route("/", defaults={"path": ""}, methods=["GET", "POST", "PUT"])
+        @app.route("/<path:path>", methods=["GET", "POST", "PUT"])
+        def sign(path):
+            self.stats["requests"] += 1
+            if self.upstream:
+                return self._proxy(path)
+            if self.faults["drop"] and random.random() < self.faults["drop"]:
+                return self._drop()
+            if self._slots is not None:
+                with self._slots:
+                    time.sleep(self._latency_for(request.method, "/" + path))
+                    return self._handle(path)
+            time.sleep(self._latency_for(request.method, "/" + path))
+            return self._handle(path)
+
+        return app
+
+    def serve(self, host="127.0.0.1", port=8081):
+        """Start serving from a background thread; returns the server."""
+        from werkzeug.serving import make_server
+        server = make_server(host, port, self.app, threaded=True)
+        threading.Thread(target=server.serve_forever, name="signsim", daemon=True).start()
+        return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated (or recorded) DAK ECCB sign.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--cassette", help="JSONL file to record into or replay from")
+    parser.add_argument("--record", metavar="URL", help="proxy to this sign and record (needs --cassette)")
+    parser.add_argument("--username", default="Dak")
+    parser.add_argument("--password", default="DakPassword")
+    parser.add_argument("--scale", type=float, default=1.0, help="latency multiplier")
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--drop", type=float, default=0.0, help="fraction of connections cut")
+    parser.add_argument("--session-ttl", type=float, default=0, help="seconds a login lasts")
+    parser.add_argument("--single-session", action="store_true", help="a login ends older sessions")
+    parser.add_argument("--concurrency", type=int, default=0, help="requests served at once")
+    args = parser.parse_args()
+
+    if args.record and not args.cassette:
+        parser.error("--record needs --cassette")
+    if args.record:
+        cassette = Cassette(args.cassette)
+    elif args.cassette:
+        cassette = Cassette.load(args.cassette)
+    else:
+        cassette = None
+    upstream = args.record if not args.record or urlsplit(args.record).scheme else f"http://{args.record}"
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)-7s %(message)s")
+    sim = SignSimulator(cassette, upstream, args.username, args.password, args.scale, args.delay,
+                        args.drop, args.session_ttl, args.single_session, args.concurrency)
+    log.info("%s on http://%s:%d", f"recording {upstream} into {args.cassette}" if upstream
+             else "simulated sign", args.host, args.port)
+    from werkzeug.serving import run_simple
+    run_simple(args.host, args.port, sim.app, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+"""
+Desired-state sync for DAK Sign Controller.
+A version-controlled file (JSON, or YAML if PyYAML is installed) lists the
+messages each sign should have. A background loop re-reads it when it
+changes, compares it with each sign's message list and writes only the
+difference: new and changed messages and, if the file asks for it,
+deletions and a new order.
+
+Messages are compared by hash of the fields the file sets, so fields the
+sign adds on its own are not drift. A sign whose list and desired state
+hash the same as when it was last found in sync is skipped without any
+diffing, so the loop can run every minute for one list read per sign.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import shared
+from messages import build_message, diff_messages, format_path
+from model import Message, InvalidMessage
+from outbox import get_outbox
+from sign import get_sign, fan_out
+
+log = logging.getLogger(__name__)
+
+SYNC_INTERVAL = 60    # seconds between passes
+SYNC_LEASE    = 600   # seconds a pass may hold the sync lease
+
+
+class SyncError(Exception):
+    """A desired-state file, or a sign in it, that can't be used."""
+
+
+def _digest(obj):
+    raw = json.dumps(obj, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+
+def _project(have, want):
+    """`have` cut down to the keys `want` sets."""
+    if isinstance(have, dict) and isinstance(want, dict):
+        return {k: _project(have[k], v) for k, v in want.items() if k in have}
+    if isinstance(have, list) and isinstance(want, list) and len(have) == len(want):
+        return [_project(h, w) for h, w in zip(have, want)]
+    return have
+
+
+def _overlay(have, want):
+    """`want` written over `have`, keeping whatever else `have` holds."""
+    if isinstance(have, dict) and isinstance(want, dict):
+        out = dict(have)
+        out.update({k: _overlay(have.get(k), v) for k, v in want.items()})
+        return out
+    if isinstance(have, list) and isinstance(want, list) and len(have) == len(want):
+        return [_overlay(h, w) for h, w in zip(have, want)]
+    return want
+
+
+# ── Desired state ─────────────────────────────────────────────────
+
+class Desired:
+    """What one sign should hold: messages in order, plus prune/order flags."""
+
+    def __init__(self, sign, messages, prune=False, order=False):
+        self.sign     = sign
+        self.prune    = prune    # delete messages the file doesn't list
+        self.order    = order    # keep the sign's list in file order
+        self.messages = {}       # name -> (Message, ECCB dict, digest)
+        for msg in messages:
+            want = msg.to_eccb()
+            self.messages[msg.name] = (msg, want, _digest(want))
+        self.digest = _digest([prune, order, [d for *_, d in self.messages.values()]])
+
+
+def _parse_message(spec):
+    """A message from the file: an ECCB object (with "Name") or a create body."""
+    if not isinstance(spec, dict):
+        raise SyncError("each message must be an object")
+    if "Name" in spec:
+        try:
+            msg = Message.from_eccb(spec)
+            msg.validate()
+        except InvalidMessage as e:
+            raise SyncError(f"{spec.get('Name')!r}: {e}") from None
+        return msg
+    msg, error = build_message(spec)
+    if error:
+        raise SyncError(f"{spec.get('name')!r}: {error}")
+    return msg
+
+
+def parse_desired(doc):
+    """{"signs": {name: {"messages": [...], "prune", "order"}}} -> {name: Desired}."""
+    signs = doc.get("signs") if isinstance(doc, dict) else None
+    if not isinstance(signs, dict):
+        raise SyncError('expected an object with a "signs" mapping')
+    out = {}
+    for sign, conf in signs.items():
+        if not isinstance(conf, dict) or not isinstance(conf.get("messages", []), list):
+            raise SyncError(f'sign {sign!r}: expected {{"messages": [...]}}')
+        try:
+            msgs = [_parse_message(m) for m in conf.get("messages", [])]
+        except SyncError as e:
+            raise SyncError(f"sign {sign!r}: {e}") from None
+        names = [m.name for m in msgs]
+        dupes = sorted({n for n in names if names.count(n) > 1})
+        if dupes:
+            raise SyncError(f"sign {sign!r}: duplicate message names {dupes}")
+        out[sign] = Desired(sign, msgs, bool(conf.get("prune")), bool(conf.get("order")))
+    return out
+
+
+def load_file(path):
+    """Parse a desired-state file; raises SyncError."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+    except OSError as e:
+        raise SyncError(f"cannot read {path}: {e.strerror}") from None
+    if path.endswith((".yaml", ".yml")):
+        try:
+            import yaml
+        except ImportError:
+            raise SyncError("install PyYAML to use a YAML desired-state file") from None
+        try:
+            doc = yaml.safe_load(text)
+        except yaml.YAMLError as e:
+            raise SyncError(f"{path}: {e}") from None
+    else:
+        try:
+            doc = json.loads(text)
+        except ValueError as e:
+            raise SyncError(f"{path}: {e}") from None
+    return parse_desired(doc)
+
+
+# ── Plans ─────────────────────────────────────────────────────────
+
+class Plan:
+    """The writes that take one sign from its current list to a Desired."""
+
+    def __init__(self, sign, creates, updates, deletes, order, unchanged, ignored):
+        self.sign      = sign
+        self.creates   = creates     # [Message]
+        self.updates   = updates     # [(current, new, have digest, want digest)]
+        self.deletes   = deletes     # [name]
+        self.order     = order       # [name] or None if already in order
+        self.unchanged = unchanged
+        self.ignored   = ignored     # names whose last write didn't stick
+
+    @property
+    def empty(self):
+        return not (self.creates or self.updates or self.deletes or self.order)
+
+    def describe(self):
+        return {"sign": self.sign, "in_sync": self.empty,
+                "create":  [m.name for m in self.creates],
+                "update":  [{"name": new.name,
+                             "changes": [format_path(p) for p in diff_messages(cur, new)]}
+                            for cur, new, *_ in self.updates],
+                "delete":  self.deletes,
+                "reorder": self.order,
+                "unchanged": self.unchanged,
+                "ignored": self.ignored}
+
+
+def make_plan(desired, msgs, stuck=None):
+    """Plan for a sign holding `msgs`. `stuck` maps names to the (have, want)
+    digests of a write the sign didn't keep; those are not retried."""
+    stuck   = stuck or {}
+    have    = {m.name: m for m in msgs}
+    creates, updates, ignored = [], [], []
+    unchanged = 0
+    for name, (msg, want, want_digest) in desired.messages.items():
+        current = have.get(name)
+        if current is None:
+            creates.append(msg)
+            continue
+        cur         = current.to_eccb()
+        have_digest = _digest(_project(cur, want))
+        if have_digest == want_digest:
+            unchanged += 1
+        elif stuck.get(name) == (have_digest, want_digest):
+            ignored.append(name)
+        else:
+            updates.append((current, Message.from_eccb(_overlay(cur, want)),
+                            have_digest, want_digest))
+
+    deletes = [n for n in have if n not in desired.messages] if desired.prune else []
+    order   = None
+    if desired.order:
+        # New messages land at the end of the sign's list
+        after  = [n for n in have if n not in deletes] + [m.name for m in creates]
+        target = list(desired.messages) + [n for n in after if n not in desired.messages]
+        if after != target:
+            order = target
+    return Plan(desired.sign, creates, updates, deletes, order, unchanged, ignored)
+
+
+def apply_plan(client, plan):
+    """Write a plan to the sign. Returns {"ok", "writes", "reorder"}.
+    Callers check first that no writes are queued for it (see outbox.py)."""
+    saves  = plan.creates + [new for _, new, *_ in plan.updates]
+    writes = {}
+    if saves or plan.deletes:
+        existing = {cur.name for cur, *_ in plan.updates}
+        writes   = client.write_batch(plan.deletes, saves, existing)
+    ok     = all(w["ok"] for entries in writes.values() for w in entries)
+    result = {"ok": ok, "writes": writes}
+    if plan.order and ok:
+        text, code = client.set_message_order(plan.order)
+        result["reorder"] = {"ok": 200 <= code < 300, "status": code, "result": text[:200]}
+        result["ok"]      = result["reorder"]["ok"]
+    return result
+
+
+def _client(name):
+    client = get_sign(name)
+    if client is None:
+        raise SyncError(f"sign {name!r} is not registered")
+    return client
+
+
+def plan_all(desired, only=None):
+    """Dry run: {sign: plan description or {"error": ...}} for every sign in
+    `desired` (or just `only`), from a fresh read of each sign's list."""
+    results = {}
+    clients = []
+    for name in desired:
+        if only is not None and name != only:
+            continue
+        try:
+            clients.append(_client(name))
+        except SyncError as e:
+            results[name] = {"ok": False, "error": str(e)}
+    for name, r in fan_out(clients, lambda c: make_plan(
+            desired[c.name], c.get_messages(fresh=True)).describe()).items():
+        results[name] = r["result"] if r["ok"] else r
+    return results
+
+
+# ── Reconcile loop ────────────────────────────────────────────────
+
+class Reconciler:
+    """Keeps every sign in a desired-state file in line with it."""
+
+    def __init__(self, path, interval=SYNC_INTERVAL, apply=True):
+        self.path      = path
+        self.interval  = interval
+        self.apply     = apply       # False: compute plans, never write
+        self.error     = None        # why the file couldn't be (re)loaded
+        self.last_run  = None
+        self.results   = {}          # sign -> outcome of the last pass
+        self._desired  = {}
+        self._mtime    = None
+        self._run_lock = threading.Lock()
+        self._synced   = {}          # sign -> (list digest, desired digest) when last in sync
+        self._written  = {}          # sign -> {name: (have, want)} written on the last pass
+        self._stuck    = {}          # sign -> {name: (have, want)} writes the sign didn't keep
+        self._wake     = threading.Event()
+        self._thread   = None
+
+    def desired(self):
+        """The file's contents, re-read if it changed; the last good copy if it's broken."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError as e:
+            self.error = f"cannot read {self.path}: {e.strerror}"
+            return self._desired
+        if mtime != self._mtime:
+            self._mtime = mtime
+            try:
+                self._desired = load_file(self.path)
+                self.error    = None
+                log.info("desired state loaded from %s: %s", self.path,
+                         ", ".join(f"{s} ({len(d.messages)} messages)"
+                                   for s, d in self._desired.items()) or "no signs")
+            except SyncError as e:
+                self.error = str(e)
+                log.error("desired state not reloaded, keeping the previous one: %s", e)
+        return self._desired
+
+    def _sync_sign(self, client, desired):
+        # Queued writes would land on top of ours; sync again once they're replayed
+        outbox = get_outbox(client.name)
+        depth  = outbox.depth if outbox is not None else 0
+        if depth:
+            return {"ok": True, "waiting": "queued writes", "queued": depth}
+        msgs = client.get_messages(fresh=True)
+        key  = (_digest([m.to_eccb() for m in msgs]), desired.digest)
+        if self._synced.get(client.name) == key:
+            return {"ok": True, "in_sync": True}
+
+        # A message we wrote last pass that still differs in the same way
+        # isn't being kept by the sign; don't rewrite it every minute.
+        stuck = self._stuck.setdefault(client.name, {})
+        plan  = make_plan(desired, msgs, stuck)
+        for cur, _, have_digest, want_digest in plan.updates:
+            if self._written.get(client.name, {}).get(cur.name) == (have_digest, want_digest):
+                log.warning("[%s] the sign doesn't keep our changes to %r; not retrying",
+                            client.name, cur.name)
+                stuck[cur.name] = (have_digest, want_digest)
+        if any(u[0].name in stuck for u in plan.updates):
+            plan = make_plan(desired, msgs, stuck)
+        self._written[client.name] = {}
+
+        if plan.empty:
+            self._synced[client.name] = key
+            return {"ok": True, "in_sync": True, **({"ignored": plan.ignored} if plan.ignored else {})}
+        self._synced.pop(client.name, None)
+        summary = plan.describe()
+        if not self.apply:
+            return {"ok": True, "applied": False, "plan": summary}
+
+        log.info("[%s] out of sync: create %d, update %d, delete %d%s", client.name,
+                 len(plan.creates), len(plan.updates), len(plan.deletes),
+                 ", reorder" if plan.order else "")
+        result = apply_plan(client, plan)
+        self._written[client.name] = {cur.name: (h, w) for cur, _, h, w in plan.updates}
+        return {"applied": True, "plan": summary, **result}
+
+    def run_once(self, wait=0):
+        """One pass over every sign in the file; returns {sign: outcome}, or
+        None if another worker process is running one (see shared.py)."""
+        with self._run_lock, shared.lease("sync", SYNC_LEASE, wait) as held:
+            if not held:
+                return None
+            desired = self.desired()
+            results = {}
+            clients = []
+            for name in desired:
+                try:
+                    clients.append(_client(name))
+                except SyncError as e:
+                    results[name] = {"ok": False, "error": str(e)}
+            for name, r in fan_out(clients, lambda c: self._sync_sign(c, desired[c.name])).items():
+                results[name] = r["result"] if r["ok"] else r
+            self.results  = results
+            self.last_run = time.time()
+            return results
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sync", daemon=True)
+            self._thread.start()
+
+    def poke(self):
+        """Run a pass now rather than at the next interval."""
+        self._wake.set()
+
+    def _run(self):
+        log.info("desired-state sync every %ss from %s%s", self.interval, self.path,
+                 "" if self.apply else " (plan only)")
+        while True:
+            try:
+                self.run_once()
+            except Exception:
+                log.exception("sync pass failed")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def describe(self):
+        return {"file": self.path, "interval": self.interval, "apply": self.apply,
+                "error": self.error, "signs": sorted(self._desired),
+                "last_run": self.last_run, "results": self.results}
@@ -0,0 +1,53 @@
+import struct
+
+import pytest
+
+import fonts
+
+UPEM, ASCENT, DESCENT, CAP = 1000, 800, 200, 700
+ADVANCE, SPACE = 600, 300   # every printable character is a 500x700 box on a 600 advance
+
+
+def _table_dir(tables):
+    out    = struct.pack(">IHHHH", 0x00010000, len(tables), 0, 0, 0)
+    offset = 12 + 16 * len(tables)
+    body   = b""
+    for tag, data in tables:
+        data += b"\0" * (-len(data) % 4)
+        out  += struct.pack(">4sIII", tag, 0, offset + len(body), len(data))
+        body += data
+    return out + body
+
+
+def make_font():
+    """A small but complete TrueType file: monospace boxes for U+0021..U+007E."""
+    first, last = 0x20, 0x7E
+    n_glyphs = 2 + last - first              # .notdef, space, then one box per character
+    box  = struct.pack(">hhhhh", 1, 50, 0, 550, CAP) + struct.pack(">HH", 3, 0) \
+        + bytes([1, 1, 1, 1]) + struct.pack(">4h", 50, 0, 500, 0) + struct.pack(">4h", 0, CAP, 0, -CAP)
+    glyf = box * (n_glyphs - 2)
+    loca = struct.pack(f">{n_glyphs + 1}H", 0, 0, *(len(box) * i // 2 for i in range(n_glyphs - 1)))
+    hmtx = struct.pack(">HhHh", ADVANCE, 0, SPACE, 0) + struct.pack(">Hh", ADVANCE, 50) * (n_glyphs - 2)
+    head = struct.pack(">IIIIHH16xhhhhHHhhh", 0x00010000, 0, 0, 0x5F0F3CF5, 0, UPEM,
+                       0, -DESCENT, ADVANCE, ASCENT, 0, 8, 2, 0, 0)
+    hhea = struct.pack(">Ihhh", 0x00010000, ASCENT, -DESCENT, 0) + b"\0" * 24 + struct.pack(">H", n_glyphs)
+    maxp = struct.pack(">IH", 0x00005000, n_glyphs)
+    os2  = struct.pack(">H", 2) + b"\0" * 86 + struct.pack(">h", CAP) + b"\0" * 6
+    segs = 2
+    cmap = struct.pack(">HHHHI", 0, 1, 3, 1, 12) + struct.pack(
+        ">HHHHHHH", 4, 16 + 8 * segs, 0, 2 * segs, 0, 0, 0) \
+        + struct.pack(">2H", last, 0xFFFF) + b"\0\0" + struct.pack(">2H", first, 0xFFFF) \
+        + struct.pack(">2h", 1 - first, 1) + struct.pack(">2H", 0, 0)
+    return _table_dir([(b"OS/2", os2), (b"cmap", cmap), (b"glyf", glyf), (b"head", head),
+                       (b"hhea", hhea), (b"hmtx", hmtx), (b"loca", loca), (b"maxp", maxp)])
+
+
+@pytest.fixture
+def font_dir(tmp_path, monkeypatch):
+    """FONT_DIR holding the test font under the sign font's name."""
+    from model import DEFAULT_FONT
+    (tmp_path / DEFAULT_FONT).write_bytes(make_font())
+    monkeypatch.setattr(fonts, "FONT_DIR", str(tmp_path))
+    fonts.reload_fonts()
+    yield tmp_path
+    fonts.reload_fonts()
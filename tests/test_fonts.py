@@ -0,0 +1,59 @@
+import pytest
+
+import fonts
+from conftest import ADVANCE, CAP, DESCENT, SPACE, UPEM
+from model import DEFAULT_FONT
+
+
+def test_parses_metrics(font_dir):
+    font = fonts.get_font(DEFAULT_FONT)
+    assert (font.units_per_em, font.cap_height, font.descent) == (UPEM, CAP, DESCENT)
+    assert font.advances[ord("W")] == ADVANCE and font.advances[ord(" ")] == SPACE
+    assert font.has_outlines
+    assert font.contours("H") == [[(50, 0, True), (50, CAP, True), (550, CAP, True), (550, 0, True)]]
+    assert font.contours(" ") == []
+
+
+def test_one_line_fits_the_width(font_dir):
+    # 3 x round(0.6 * size) <= 72 up to 40.5; round(0.7 * size) <= 32 up to 46
+    result = fonts.fit(["ABC"], DEFAULT_FONT, 72, 32)
+    assert result == {"fontSize": 40.5, "fits": True, "widths": (72,), "height": 28,
+                      "approximate": False}
+
+
+def test_descenders_add_height(font_dir):
+    # Two lines, one with a descender: 2 x round(0.7 s) + round(0.2 s) <= 32 up to 20.5
+    result = fonts.fit(["AB", "gy"], DEFAULT_FONT, 72, 32)
+    assert result["fontSize"] == 20.5 and result["height"] == 32
+
+
+def test_too_long_reports_min_size(font_dir):
+    result = fonts.fit(["X" * 40], DEFAULT_FONT, 72, 32)
+    assert result["fontSize"] == fonts.MIN_SIZE and result["fits"] is False
+
+
+@pytest.mark.parametrize("texts", [["A"], ["HELLO", "WORLD"], ["OPEN", "9 TO 5", "TODAY"],
+                                   ["a", "b", "c", "d"], ["ONE TWO THREE"], ["I", "WIDE LINE"]])
+def test_binary_search_matches_a_scan(font_dir, texts):
+    font = fonts.get_font(DEFAULT_FONT)
+    lines = [(font.line_units(t), any(c in fonts.DESCENDERS for c in t)) for t in texts]
+    sizes = [fonts.MIN_SIZE + k * fonts.SIZE_STEP
+             for k in range(int((fonts.MAX_SIZE - fonts.MIN_SIZE) / fonts.SIZE_STEP) + 1)]
+    fitting = [s for s in sizes if (lambda w, h: h <= 32 and max(w) <= 72)(
+        *fonts._measure(font, lines, s, 0))]
+    assert fonts.fit(texts, DEFAULT_FONT, 72, 32)["fontSize"] == max(fitting)
+
+
+def test_missing_font_falls_back(tmp_path, monkeypatch):
+    monkeypatch.setattr(fonts, "FONT_DIR", str(tmp_path))
+    fonts.reload_fonts()
+    assert not fonts.available(DEFAULT_FONT)
+    assert fonts.fit(["A", "B"], DEFAULT_FONT, 72, 32) == {
+        "fontSize": 29, "fits": None, "widths": None, "height": None, "approximate": True}
+    fonts.reload_fonts()
+
+
+def test_corrupt_font(tmp_path):
+    (tmp_path / "bad.ttf").write_bytes(b"\x00\x01\x00\x00" + b"\0" * 8)
+    with pytest.raises(fonts.FontError):
+        fonts.Font.load(str(tmp_path / "bad.ttf"))
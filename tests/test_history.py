@@ -0,0 +1,59 @@
+import time
+
+import pytest
+
+from history import History, HistoryError, parse_time
+
+NOW = 1_800_000_000.0
+
+
+class FakePoller:
+    class client:
+        name = "main"
+
+    def __init__(self):
+        self.entry = None
+
+    def latest(self, endpoint):
+        return self.entry if endpoint == "status" else None
+
+
+@pytest.mark.parametrize("value, expected", [("-6h", NOW - 6 * 3600), ("-30m", NOW - 1800),
+                                             ("1700000000", 1_700_000_000.0),
+                                             ("1970-01-01T00:01:00Z", 60.0)])
+def test_parse_time(value, expected):
+    assert parse_time(value, NOW) == expected
+
+
+@pytest.mark.parametrize("value", ["nan", "inf", "-inf", "1e999", "-1e309d", "yesterday"])
+def test_parse_time_rejects(value):
+    with pytest.raises(HistoryError):
+        parse_time(value, NOW)
+
+
+def _recorded(tmp_path):
+    poller  = FakePoller()
+    history = History(poller, str(tmp_path))
+    poller.entry = {"status": 200, "updated": time.time(), "data": {"Temperature": 31, "Name": "x"}}
+    history.sample()
+    return history
+
+
+def test_records_and_queries(tmp_path):
+    history = _recorded(tmp_path)
+    assert history.fields() == ["status:Temperature"]
+    result = history.query("status:Temperature", time.time() - 60, time.time() + 1)
+    assert result["tier"] == "raw" and [p[1:] for p in result["points"]] == [[31.0, 31.0, 31.0]]
+
+
+@pytest.mark.parametrize("t0, t1, step", [(float("nan"), 1, None), (0, float("inf"), None),
+                                          (0, 1, float("nan")), (-1e308, 1e308, None), (0, 1, -5)])
+def test_query_rejects_non_finite(tmp_path, t0, t1, step):
+    with pytest.raises(HistoryError):
+        _recorded(tmp_path).query("status:Temperature", t0, t1, step)
+
+
+def test_other_worker_sees_new_fields(tmp_path):
+    reader = History(FakePoller(), str(tmp_path))   # started before anything was recorded
+    _recorded(tmp_path)
+    assert reader.fields() == ["status:Temperature"]
@@ -0,0 +1,68 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+import requests
+
+from model import Message, Frame, Line
+from outbox import Outbox
+from poller import StatusPoller
+
+
+class DownSign:
+    """A sign client whose every call fails as if the sign were unplugged."""
+
+    name = "down"
+
+    def __init__(self):
+        self.calls = 0
+
+    def _fail(self, *args, **kwargs):
+        self.calls += 1
+        raise requests.exceptions.ConnectionError("unplugged")
+
+    get_messages = find_message = save_message_obj = _fail
+
+    def eccb_get(self, path):
+        self.calls += 1
+        return {"path": path}, 200
+
+
+def _wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def _threads(prefix):
+    return [t for t in threading.enumerate() if t.name.startswith(prefix)]
+
+
+def test_poller_stop_ends_its_thread():
+    sign   = DownSign()
+    poller = StatusPoller(sign, interval=0.01)
+    poller.get("status")
+    _wait_for(lambda: sign.calls > 6)
+    poller.stop()
+    _wait_for(lambda: not _threads("poller-down"))
+    calls = sign.calls
+    poller.get("status")             # served from the snapshot; doesn't restart it
+    time.sleep(0.05)
+    assert sign.calls == calls and not _threads("poller-down")
+
+
+def test_outbox_close_ends_replay_and_closes_db(tmp_path):
+    sign   = DownSign()
+    outbox = Outbox(sign, str(tmp_path / "outbox.db"), retry=0.01)
+    outbox.put("save", "m", Message("m", [Frame([Line("X")])]))
+    _wait_for(lambda: sign.calls > 2)
+    outbox.close()
+    _wait_for(lambda: not _threads("outbox-down"))
+    with pytest.raises(sqlite3.ProgrammingError):
+        outbox.depth
+    # The queued write is still on disk for the next Outbox of this sign
+    again = Outbox(sign, str(tmp_path / "outbox.db"), retry=60)
+    assert again.depth == 1
+    again.close()
@@ -0,0 +1,84 @@
+import pytest
+
+from messages import MessageError, apply_update, build_message, plan_batch
+from model import MISSING, Message, Frame, Line
+
+
+def _msg(name, *lines):
+    return Message(name, [Frame([Line(l) for l in lines or ("TEXT",)])])
+
+
+# ── Batches ───────────────────────────────────────────────────────
+
+@pytest.mark.parametrize("op, error", [
+    ("x",                                                   "each operation must be an object"),
+    ({"op": "create", "name": 5},                           "name is required"),
+    ({"op": "create", "name": "n", "frames": ["a"]},        "frames must be a list of objects"),
+    ({"op": "create", "name": "n", "frames": [{"lines": "ab"}]}, "frame lines must be a list"),
+    ({"op": "create", "name": "n", "frames": [{"lines": ["A"]}], "schedule": []},
+                                                            "schedule must be an object"),
+    ({"op": "toggle", "name": 5, "enabled": True},          "name must be a string"),
+    ({"op": "explode", "name": "a"},                        "unknown op 'explode'"),
+])
+def test_bad_op_fails_alone(op, error):
+    deletes, saves, results = plan_batch([_msg("a")], [op, {"op": "delete", "name": "a"}])
+    assert results[0]["ok"] is False and results[0]["status"] == 400
+    assert results[0]["error"] == error
+    assert results[1]["names"] == ["a"] and deletes == ["a"] and saves == []
+
+
+def test_build_message_rejects_non_object():
+    assert build_message(["x"]) == (None, "expected a JSON object")
+
+
+# ── Updates ───────────────────────────────────────────────────────
+
+@pytest.mark.parametrize("index", ["0", -1, 1.0, True, None])
+def test_update_rejects_bad_frame_index(index):
+    with pytest.raises(MessageError, match="invalid frameIndex"):
+        apply_update(_msg("a", "ONE"), {"frames": [{"frameIndex": index, "lines": ["X"]}]})
+
+
+def test_update_edits_one_line_and_shares_the_rest():
+    current = Message("a", [Frame([Line("ONE"), Line("TWO")]), Frame([Line("THREE")])])
+    msg = apply_update(current, {"frames": [{"frameIndex": 0, "lines": ["ONE", "2"]}]})
+    assert [l.text for l in msg.frames[0].lines] == ["ONE", "2"]
+    assert msg.frames[0].lines[0] is current.frames[0].lines[0]
+    assert msg.frames[1] is current.frames[1]
+
+
+def test_update_of_message_without_frames():
+    current = Message.from_eccb({"Name": "a"})
+    msg = apply_update(current, {"frames": [{"frameIndex": 0, "lines": ["X"]}]})
+    assert msg.frames is MISSING and msg.to_eccb() == {"Name": "a"}
+
+
+@pytest.mark.parametrize("body", [{"frames": "x"}, {"frames": [{"lines": "x"}]},
+                                  {"schedule": []}, {"newName": 5}])
+def test_update_rejects_bad_types(body):
+    with pytest.raises(MessageError):
+        apply_update(_msg("a"), body)
+
+
+def test_batch_collapses_to_net_changes():
+    a, b = _msg("a", "ONE"), _msg("b", "TWO")
+    deletes, saves, results = plan_batch([a, b], [
+        {"op": "toggle", "name": "a", "enabled": False},
+        {"op": "update", "name": "a", "frames": [{"frameIndex": 0, "lines": ["1"]}]},
+        {"op": "create", "name": "c", "frames": [{"lines": ["NEW"]}]},
+        {"op": "delete", "name": "c"},
+        {"op": "toggle", "name": "b", "enabled": True},   # already enabled
+    ])
+    assert deletes == [] and [m.name for m in saves] == ["a"]
+    assert saves[0].schedule.enabled is False and saves[0].frames[0].lines[0].text == "1"
+    assert all(r.get("ok", True) for r in results)
+
+
+def test_batch_rename_and_missing():
+    deletes, saves, results = plan_batch([_msg("a")], [
+        {"op": "update", "name": "a", "newName": "z"},
+        {"op": "toggle", "name": "a", "enabled": False},   # renamed away above
+    ])
+    assert deletes == ["a"] and [m.name for m in saves] == ["z"]
+    assert results[0]["names"] == ["a", "z"]
+    assert results[1]["status"] == 404
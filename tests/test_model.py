@@ -0,0 +1,99 @@
+import json
+
+import pytest
+
+from messages import diff_messages, format_path
+from model import (InvalidMessage, MISSING, Message, Frame, Line, Schedule,
+                   parse_duration, parse_messages)
+
+# As getmessagelist.php sends it (in its key order), with fields the model
+# doesn't know at every level
+SIGN_MESSAGE = {
+    "Name": "Welcome", "Height": 32, "Width": 72, "IsPermanent": False,
+    "Frames": [{"HoldTime": "P0Y0M0DT0H0M5S",
+                "Lines": [{"Font": "dak_eccb_black-webfont.ttf", "FontSize": 17.5,
+                           "Text": "HELLO", "Color": "#FF0000"},
+                          {"Font": "dak_eccb_black-webfont.ttf", "FontSize": 17.5, "Text": "LEEDS"}],
+                "LineSpacing": 0, "Effect": {"In": "Wipe"}}],
+    "CurrentSchedule": {"Enabled": True, "StartTime": "PT8H0M0S", "EndTime": "PT17H0M0S",
+                        "Dow": 62, "IsAllDay": False, "Priority": 2},
+    "Notes": "", "Tags": ["lobby"],
+}
+
+
+def test_round_trip_is_unchanged():
+    msg = Message.from_eccb(SIGN_MESSAGE)
+    assert msg.to_eccb() == SIGN_MESSAGE
+    assert json.dumps(msg.to_eccb()) == json.dumps(SIGN_MESSAGE)   # key order too
+
+
+def test_unknown_fields_kept_in_extra():
+    msg = Message.from_eccb(SIGN_MESSAGE)
+    assert msg.extra == {"Notes": "", "Tags": ["lobby"]}
+    assert msg.frames[0].extra == {"Effect": {"In": "Wipe"}}
+    assert msg.frames[0].lines[0].extra == {"Color": "#FF0000"}
+    assert msg.schedule.extra == {"Priority": 2}
+
+
+def test_missing_fields_stay_missing():
+    msg = Message.from_eccb({"Name": "bare", "Frames": [{"Lines": [{"Text": "X"}]}]})
+    assert msg.schedule is MISSING and msg.frames[0].hold_time is MISSING
+    assert msg.to_eccb() == {"Name": "bare", "Frames": [{"Lines": [{"Text": "X"}]}]}
+
+
+def test_replace_shares_untouched_fields():
+    msg = Message.from_eccb(SIGN_MESSAGE)
+    new = msg.replace(name="Other")
+    assert new.frames is msg.frames and new.extra is msg.extra and msg.name == "Welcome"
+    with pytest.raises(TypeError):
+        msg.replace(colour="red")
+
+
+def test_parse_rejects_non_objects():
+    with pytest.raises(InvalidMessage):
+        parse_messages([{"Name": "a", "Frames": "nope"}])
+    with pytest.raises(InvalidMessage):
+        Message.from_eccb(["a"])
+
+
+@pytest.mark.parametrize("text, seconds", [("P0Y0M0DT0H0M5S", 5), ("PT8H30M0S", 30600),
+                                           ("PT0.5S", 0.5), ("P1D", 86400)])
+def test_parse_duration(text, seconds):
+    assert parse_duration(text) == seconds
+
+
+@pytest.mark.parametrize("text", ["P", "PT", "5S", "P1DT", 5])
+def test_parse_duration_rejects(text):
+    with pytest.raises(InvalidMessage):
+        parse_duration(text)
+
+
+def test_validate():
+    Message.from_eccb(SIGN_MESSAGE).validate()
+    with pytest.raises(InvalidMessage, match="Dow"):
+        Message("a", [Frame([Line("X")])], Schedule(dow=200)).validate()
+    with pytest.raises(InvalidMessage, match="font size"):
+        Message("a", [Frame([Line("X", font_size=0)])]).validate()
+
+
+# ── Diffing ───────────────────────────────────────────────────────
+
+def test_diff_identical_is_empty():
+    assert diff_messages(Message.from_eccb(SIGN_MESSAGE), Message.from_eccb(SIGN_MESSAGE)) == []
+
+
+def test_diff_reports_changed_paths():
+    old = Message.from_eccb(SIGN_MESSAGE)
+    line = old.frames[0].lines[1].replace(text="BRADFORD")
+    new = old.replace(frames=(old.frames[0].replace(lines=(old.frames[0].lines[0], line)),),
+                      schedule=old.schedule.replace(dow=0))
+    assert [format_path(p) for p in diff_messages(old, new)] == [
+        "Frames[0].Lines[1].Text", "CurrentSchedule.Dow"]
+
+
+def test_diff_extra_and_length_changes():
+    old = Message.from_eccb(SIGN_MESSAGE)
+    new = Message.from_eccb({**SIGN_MESSAGE, "Notes": "x", "Frames": SIGN_MESSAGE["Frames"] * 2})
+    assert [format_path(p) for p in diff_messages(old, new)] == ["Frames", "Notes"]
+    gone = Message.from_eccb({k: v for k, v in SIGN_MESSAGE.items() if k != "Tags"})
+    assert diff_messages(old, gone) == [("Tags",)]
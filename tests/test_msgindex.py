@@ -0,0 +1,56 @@
+from datetime import datetime
+
+import pytest
+
+from model import Message, Frame, Line, Schedule
+from msgindex import QueryError, index_for, page, parse_query, parse_when
+
+
+def _msg(name, text, enabled=True, dow=127, start="PT0H0M0S", end="PT0H0M0S"):
+    return Message(name, [Frame([Line(text)])],
+                   Schedule(enabled=enabled, dow=dow, start_time=start, end_time=end,
+                            is_all_day=start == end))
+
+
+MSGS = [_msg("Open", "WELCOME"), _msg("Closed", "SORRY", enabled=False, dow=0),
+        _msg("Lunch", "SOUP TODAY", dow=0b0111110, start="PT11H0M0S", end="PT14H0M0S")]
+
+
+def test_parse_query_none_without_params():
+    assert parse_query({}) is None
+    assert parse_query({"fresh": "1"}) is None
+
+
+def test_parse_query_reads_every_param():
+    q = parse_query({"enabled": "yes", "dow": "2", "q": " soup ", "offset": "1", "limit": "5",
+                     "activeAt": "2026-10-12T12:34:56"})
+    assert q == {"enabled": True, "days": 2, "text": "soup", "offset": 1, "limit": 5,
+                 "active_at": datetime(2026, 10, 12, 12, 34)}
+
+
+@pytest.mark.parametrize("args", [{"enabled": "maybe"}, {"dow": "128"}, {"limit": "-1"},
+                                  {"offset": "x"}, {"activeAt": "tuesday"}])
+def test_parse_query_rejects(args):
+    with pytest.raises(QueryError):
+        parse_query(args)
+
+
+def test_parse_when_epoch_and_now():
+    assert parse_when("0") == datetime.fromtimestamp(0)
+    assert parse_when("now").second == 0
+
+
+def test_index_filters():
+    index = index_for(MSGS)
+    assert "Lunch" in index and index.get("Lunch") is MSGS[2]
+    assert index.query(enabled=True) == [0, 2]
+    assert index.query(enabled=False) == [1]
+    assert index.query(days=1) == [0]                       # Sunday
+    assert index.query(text="soup") == [2]
+    assert index.query(active_at=datetime(2026, 10, 12, 12)) == [0, 2]
+    assert index.query(active_at=datetime(2026, 10, 12, 15)) == [0]
+
+
+def test_page():
+    body = page(MSGS, enabled=True, offset=1, limit=1)
+    assert body["total"] == 2 and [m["Name"] for m in body["messages"]] == ["Lunch"]
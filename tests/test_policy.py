@@ -0,0 +1,69 @@
+import threading
+import time
+
+import pytest
+
+import policy
+from policy import Policy, PoolBusy
+
+
+class _Response:
+    status_code = 200
+
+
+def test_busy_pool_fails_after_pool_wait(monkeypatch):
+    monkeypatch.setattr(policy, "POOL_WAIT", 0.2)
+    p = Policy("test")
+    release = threading.Event()
+
+    def hold(timeout):
+        release.wait(5)
+        return _Response()
+
+    holders = [threading.Thread(target=p.send, args=("GET", "/x", hold))
+               for _ in range(policy.POOL_SIZE)]
+    for t in holders:
+        t.start()
+    time.sleep(0.1)
+    try:
+        started = time.perf_counter()
+        with pytest.raises(PoolBusy):
+            p.send("GET", "/y", lambda timeout: _Response())
+        assert time.perf_counter() - started < 2
+        assert p.describe()["endpoints"]["/y"]["pool_timeouts"] == 1
+    finally:
+        release.set()
+        for t in holders:
+            t.join()
+    assert p.send("GET", "/y", lambda timeout: _Response()).status_code == 200
+
+
+def test_round_trip_excludes_pool_wait(monkeypatch):
+    monkeypatch.setattr(policy, "POOL_SIZE", 1)
+    p = Policy("test")
+    entered = threading.Event()
+
+    def slow(timeout):
+        entered.set()
+        time.sleep(0.3)
+        return _Response()
+
+    holder = threading.Thread(target=p.send, args=("GET", "/slow", slow))
+    holder.start()
+    entered.wait(5)
+    p.send("GET", "/fast", lambda timeout: _Response())
+    holder.join()
+    assert p._rtts["/fast"][0] < 0.1
+    assert p._rtts["/slow"][0] >= 0.3
+
+
+def test_slot_released_after_error():
+    p = Policy("test")
+
+    def fail(timeout):
+        raise ValueError("boom")
+
+    for _ in range(policy.POOL_SIZE + 1):
+        with pytest.raises(ValueError):
+            p.send("POST", "/x", fail)
+    assert p.send("POST", "/x", lambda timeout: _Response()).status_code == 200
@@ -0,0 +1,55 @@
+import struct
+import zlib
+
+import pytest
+
+import preview
+from model import Frame, Line, Message, SIGN_WIDTH, SIGN_HEIGHT
+
+
+def _decode(png):
+    """(width, height, rows of palette indexes) from an unfiltered 8-bit PNG."""
+    assert png[:8] == b"\x89PNG\r\n\x1a\n"
+    at, chunks = 8, {}
+    while at < len(png):
+        length, tag = struct.unpack_from(">I4s", png, at)
+        chunks.setdefault(tag, []).append(png[at + 8:at + 8 + length])
+        at += 12 + length
+    width, height = struct.unpack_from(">II", chunks[b"IHDR"][0])
+    raw  = zlib.decompress(b"".join(chunks[b"IDAT"]))
+    rows = [raw[r * (width + 1):(r + 1) * (width + 1)] for r in range(height)]
+    assert all(row[0] == 0 for row in rows)
+    return width, height, [row[1:] for row in rows]
+
+
+def test_renders_a_frame_to_png(font_dir):
+    # One 500x700-unit box at size 20: 10x14 LEDs, centred on the 72x32 grid
+    frame  = Frame([Line("I", font_size=20)])
+    pixels = preview.render_frame(frame)
+    width, height, rows = _decode(preview.encode_png(pixels))
+    assert (width, height) == (SIGN_WIDTH, SIGN_HEIGHT)
+    lit = {(x, y) for y, row in enumerate(rows) for x, v in enumerate(row) if v}
+    assert lit == {(x, y) for x in range(31, 41) for y in range(9, 23)}
+
+
+def test_scale_enlarges_each_led(font_dir):
+    pixels = preview.render_frame(Frame([Line("I", font_size=20)]))
+    width, height, rows = _decode(preview.encode_png(pixels, scale=2))
+    assert (width, height) == (2 * SIGN_WIDTH, 2 * SIGN_HEIGHT)
+    assert sum(v for row in rows for v in row) == 4 * 140
+
+
+def test_message_is_animated(font_dir):
+    msg = Message("m", [Frame([Line("A")]), Frame([Line("B")], "PT2S")])
+    png = preview.render_message(msg)
+    assert b"acTL" in png and png.count(b"fcTL") == 2
+
+
+def test_missing_font(tmp_path, monkeypatch):
+    import fonts
+    monkeypatch.setattr(fonts, "FONT_DIR", str(tmp_path))
+    fonts.reload_fonts()
+    assert not preview.available()
+    with pytest.raises(preview.PreviewError):
+        preview.render_frame(Frame([Line("NOFONT")]))
+    fonts.reload_fonts()
@@ -0,0 +1,51 @@
+import threading
+import time
+
+import pytest
+
+import shared
+from poller import StatusPoller
+
+
+@pytest.fixture
+def shared_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(shared, "_db", None)
+    monkeypatch.setattr(shared, "active", False)
+    shared.init_shared(str(tmp_path / "shared.db"))
+    yield
+    shared._db.close()
+
+
+class CountingSign:
+    name = "main"
+
+    def __init__(self):
+        self.calls = 0
+
+    def eccb_get(self, path):
+        self.calls += 1
+        return {"Temperature": 20 + self.calls}, 200
+
+
+def test_one_worker_polls_and_the_other_follows(shared_db):
+    # Two pollers of one sign stand in for two worker processes: their
+    # threads are different lease holders, as processes would be
+    a_sign, b_sign = CountingSign(), CountingSign()
+    a, b = StatusPoller(a_sign, interval=0.02), StatusPoller(b_sign, interval=0.02)
+    a.get("status")
+    time.sleep(0.1)
+    b.get("status")
+    time.sleep(0.2)
+    a.stop()
+    b.stop()
+    while any(t.name == "poller-main" for t in threading.enumerate()):
+        time.sleep(0.01)
+    assert a_sign.calls > 3 and b_sign.calls == 0
+    # b serves what a polled (the last result or one before it)
+    assert 21 < b.snapshot()["status"]["data"]["Temperature"] <= 20 + a_sign.calls
+
+
+def test_snapshots_round_trip(shared_db):
+    assert shared.get_snapshot("x") is None
+    shared.put_snapshot("x", {"data": "ok", "status": 200, "updated": 1.5})
+    assert shared.get_snapshot("x") == {"data": "ok", "status": 200, "updated": 1.5}
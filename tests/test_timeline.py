@@ -0,0 +1,53 @@
+from datetime import datetime
+
+from model import Message, Frame, Line, Schedule
+from timeline import Timeline, loop_seconds, week_seconds, window
+
+MONDAY = datetime(2026, 10, 12)   # a Monday; Dow bit 1
+
+
+def _msg(name, start="PT0H0M0S", end="PT0H0M0S", dow=127, enabled=True, hold="PT5S", frames=1):
+    return Message(name, [Frame([Line(name)], hold) for _ in range(frames)],
+                   Schedule(enabled=enabled, start_time=start, end_time=end, dow=dow,
+                            is_all_day=start == end == "PT0H0M0S"))
+
+
+def test_week_seconds_counts_from_sunday():
+    assert week_seconds(datetime(2026, 10, 11)) == 0
+    assert week_seconds(MONDAY.replace(hour=1)) == 86400 + 3600
+
+
+def test_window_and_loop():
+    assert window(_msg("a", "PT8H0M0S", "PT17H0M0S", dow=62))[:3] == (62, 8 * 3600, 17 * 3600)
+    assert window(_msg("off", enabled=False))[0] == 0
+    days, *_, problems = window(_msg("back", "PT17H0M0S", "PT8H0M0S"))
+    assert days == 0 and problems == ["ends before it starts, so never plays"]
+    assert loop_seconds(_msg("a", frames=3)) == 15
+
+
+def test_at_and_now_playing():
+    t = Timeline([_msg("always"), _msg("work", "PT9H0M0S", "PT17H0M0S", dow=0b0111110)])
+    assert t.at(MONDAY.replace(hour=8)) == (0,)
+    assert t.at(MONDAY.replace(hour=9)) == (0, 1)
+    assert t.at(MONDAY.replace(hour=17)) == (0,)
+    assert t.at(datetime(2026, 10, 17, 12)) == (0,)   # Saturday
+    now = t.now_playing(MONDAY.replace(hour=10))
+    assert now["messages"] == ["always", "work"] and now["until"] == "2026-10-12T17:00"
+    assert now["loop"] == 10
+
+
+def test_playlist_gaps_and_issues():
+    t = Timeline([_msg("morning", "PT6H0M0S", "PT12H0M0S"), _msg("morning", dow=0)])
+    plan = t.playlist(MONDAY, days=1)
+    assert [(e["from"], e["to"], e["messages"]) for e in plan["entries"]] == [
+        ("2026-10-12T00:00", "2026-10-12T06:00", []),
+        ("2026-10-12T06:00", "2026-10-12T12:00", ["morning"]),
+        ("2026-10-12T12:00", "2026-10-13T00:00", [])]
+    assert len(plan["gaps"]) == 2
+    assert {i["problem"] for i in plan["issues"]} == {"is enabled but runs on no days",
+                                                     "appears 2 times"}
+
+
+def test_every_day_message_does_not_split_at_midnight():
+    t = Timeline([_msg("always")])
+    assert [e["messages"] for e in t.playlist(MONDAY, days=3)["entries"]] == [["always"]]
@@ -0,0 +1,176 @@
+"""
+Schedule timeline for DAK Sign Controller.
+Every message's CurrentSchedule is compiled onto a one-week clock (seconds
+from Sunday 00:00), and the week is cut into segments at each start and
+end time, each holding the messages in rotation then and the length of one
+loop through their frames. "What is playing at T" is a bisect, and the
+coming week's playlist is a walk over the segments. A list is compiled
+once and kept until it is replaced, as with msgindex.py.
+
+A message plays the way the page shows it: enabled, on the days in its
+Dow, from StartTime up to EndTime, with 00:00-00:00 meaning all day. A
+window that ends before it starts, or a schedule that can't be read, never
+plays; these come back as issues, along with repeated names and an
+IsAllDay that disagrees with the times.
+"""
+import threading
+from bisect import bisect_right
+from collections import Counter, OrderedDict
+from datetime import timedelta
+
+from model import MISSING, ALL_DAYS
+
+DAY           = 86400
+WEEK          = 7 * DAY
+TIMELINE_MEMO = 16   # compiled lists kept in memory
+
+
+def week_seconds(when):
+    """Seconds from the Sunday 00:00 before a (naive, local) datetime."""
+    day = (when.weekday() + 1) % 7   # Dow bit number: Sunday = 0
+    return day * DAY + when.hour * 3600 + when.minute * 60 + when.second
+
+
+def loop_seconds(msg):
+    """One pass through a message's frames, by their HoldTime."""
+    total = 0.0
+    for frame in msg.frames or ():
+        try:
+            total += frame.hold_seconds or 0
+        except ValueError:   # an unreadable HoldTime; the sign will show its default
+            pass
+    return total
+
+
+def window(msg):
+    """(days, start, end, problems): the Dow bitmask a message plays on (0 if
+    it never plays), its seconds into the day, and what's wrong with it."""
+    sched = msg.schedule
+    if sched is MISSING or sched.enabled is not True:
+        return 0, 0, 0, []
+    problems = []
+    try:
+        start = sched.start_seconds or 0
+        end   = sched.end_seconds or 0
+    except ValueError:
+        problems.append("has a StartTime or EndTime that can't be read")
+        return 0, 0, 0, problems
+    days = sched.dow if isinstance(sched.dow, int) and not isinstance(sched.dow, bool) else ALL_DAYS
+    if days & ALL_DAYS == 0:
+        problems.append("is enabled but runs on no days")
+    all_day = start == 0 and end == 0
+    if sched.is_all_day is not MISSING and bool(sched.is_all_day) != all_day:
+        problems.append(f"has IsAllDay {sched.is_all_day} but runs "
+                        f"{'all day' if all_day else 'for part of the day'}")
+    if all_day:
+        return days & ALL_DAYS, 0, DAY, problems
+    if end <= start:
+        problems.append("ends before it starts, so never plays")
+        return 0, 0, 0, problems
+    return days & ALL_DAYS, start, min(end, DAY), problems
+
+
+class Timeline:
+    """One message list compiled onto the week; positions index `msgs`."""
+
+    def __init__(self, msgs):
+        self.msgs   = msgs
+        self.loops  = [loop_seconds(m) for m in msgs]
+        self.issues = []
+        events = {}   # week second -> [(position, +1 or -1)]
+        for i, m in enumerate(msgs):
+            days, start, end, problems = window(m)
+            self.issues += [{"name": m.name, "problem": p} for p in problems]
+            for day in range(7):
+                if days & (1 << day):
+                    events.setdefault(day * DAY + start, []).append((i, 1))
+                    events.setdefault(day * DAY + end, []).append((i, -1))
+        for name, n in Counter(m.name for m in msgs).items():
+            if n > 1:
+                self.issues.append({"name": name, "problem": f"appears {n} times"})
+
+        # Sweep the week; an interval ending where the next day's begins
+        # nets out, so an every-day message doesn't split the week at midnight
+        self._starts, self._playing = [], []
+        running = Counter()
+        for t in sorted(set(events) | {0}):
+            if t >= WEEK:
+                break
+            for i, delta in events.get(t, ()):
+                running[i] += delta
+            playing = tuple(sorted(i for i, n in running.items() if n > 0))
+            if self._playing and self._playing[-1] == playing:
+                continue
+            self._starts.append(t)
+            self._playing.append(playing)
+        self._loop = [sum(self.loops[i] for i in p) for p in self._playing]
+
+    def at(self, when):
+        """Positions of the messages in rotation at `when`, in list order."""
+        return self._playing[bisect_right(self._starts, week_seconds(when)) - 1]
+
+    def spans(self, begin, end):
+        """[(from, to, positions)] covering begin..end, one per change."""
+        base  = (begin - timedelta(seconds=week_seconds(begin))).replace(microsecond=0)
+        first = (begin - base).total_seconds()
+        last  = (end - base).total_seconds()
+        n     = len(self._starts)
+        seg   = bisect_right(self._starts, first % WEEK) - 1
+        week  = 0
+        out   = []
+        while True:
+            t0 = week * WEEK + self._starts[seg]
+            if t0 >= last:
+                break
+            t1 = week * WEEK + (self._starts[seg + 1] if seg + 1 < n else WEEK)
+            playing = self._playing[seg]
+            if out and out[-1][2] == playing:
+                out[-1][1] = min(t1, last)   # the same rotation on both sides of Sunday 00:00
+            else:
+                out.append([max(t0, first), min(t1, last), playing])
+            seg += 1
+            if seg == n:
+                seg, week = 0, week + 1
+        return [(base + timedelta(seconds=a), base + timedelta(seconds=b), p) for a, b, p in out]
+
+    def now_playing(self, when):
+        """What is in rotation at `when`, and until when (at most a week on)."""
+        _, until, playing = self.spans(when, when + timedelta(days=7))[0]
+        return {"at": when.isoformat(timespec="minutes"),
+                "until": until.isoformat(timespec="minutes"),
+                "messages": [self.msgs[i].name for i in playing],
+                "loop": round(sum(self.loops[i] for i in playing), 2)}
+
+    def playlist(self, begin, days=7):
+        """Every change in rotation from `begin` for `days` days, with the gaps
+        when nothing plays and the schedules' issues."""
+        end     = begin + timedelta(days=days)
+        entries = [{"from": a.isoformat(timespec="minutes"), "to": b.isoformat(timespec="minutes"),
+                    "messages": [self.msgs[i].name for i in p],
+                    "loop": round(sum(self.loops[i] for i in p), 2)}
+                   for a, b, p in self.spans(begin, end)]
+        return {"from": begin.isoformat(timespec="minutes"), "to": end.isoformat(timespec="minutes"),
+                "entries": entries,
+                "gaps": [{"from": e["from"], "to": e["to"]} for e in entries if not e["messages"]],
+                "issues": self.issues}
+
+
+# Compiled by the list's identity, like msgindex.index_for(); the memo holds
+# the list so its id() isn't reused while the entry is alive.
+_memo      = OrderedDict()   # id(msgs) -> Timeline
+_memo_lock = threading.Lock()
+
+
+def timeline_for(msgs):
+    """The Timeline for a message list, compiling it on first use."""
+    with _memo_lock:
+        timeline = _memo.get(id(msgs))
+        if timeline is not None and timeline.msgs is msgs:
+            _memo.move_to_end(id(msgs))
+            return timeline
+    timeline = Timeline(msgs)
+    with _memo_lock:
+        _memo[id(msgs)] = timeline
+        while len(_memo) > TIMELINE_MEMO:
+            _memo.popitem(last=False)
+    return timeline